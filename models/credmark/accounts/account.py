@@ -32,8 +32,16 @@ from credmark.dto import DTO, DTOField, cross_examples
 from eth_typing import ChecksumAddress
 from web3.exceptions import ContractLogicError
 
-from models.credmark.accounts.token_return import TokenReturnOutput, token_return
-from models.credmark.ledger.transfers import get_native_transfer, get_token_transfer
+from models.credmark.accounts.token_return import (
+    TokenReturnCalculator,
+    TokenReturnOutput,
+    get_token_list,
+)
+from models.credmark.ledger.transfers import (
+    get_native_transfer,
+    get_token_transfer,
+    iter_token_transfer_pages,
+)
 from models.dtos.historical import HistoricalDTO
 
 np.seterr(all="raise")
@@ -122,7 +130,7 @@ class AccountsReturnInput(Accounts):
 
 @Model.describe(
     slug="accounts.token-return",
-    version="0.10",
+    version="0.11",
     display_name="Accounts' Token Return",
     description="Accounts' Token Return",
     developer="Credmark",
@@ -192,27 +200,14 @@ class AccountsTokenReturn(Model):
                 ]
             )
 
-        # ERC-20 transaction
-        df_erc20 = get_token_transfer(self.context, input.to_address(), [], 0)
+        calculator = TokenReturnCalculator(
+            self.context, self.logger, get_token_list(self.context, input.token_list), input.quote)
+        calculator.add_transfers(df_native_comb)
 
-        if df_erc20.empty:
-            df_erc20 = pd.DataFrame(
-                columns=[
-                    "block_number",
-                    "log_index",
-                    "to_address",
-                    "from_address",
-                    "token_address",
-                    "value",
-                ]
-            )
-
-        df_comb = pd.concat([df_native_comb, df_erc20], ignore_index=True).reset_index(drop=True)
-
-        # If we filter for one token address, use below
-        # df_erc20 = df_erc20.query('token_address == "0x4e3fbd56cd56c3e72c1403e103b45db9da5b9d2b"')
-
-        return token_return(self.context, self.logger, df_comb, input.token_list, input.quote)
+        # ERC-20 transaction, netted page by page as they arrive from the ledger
+        for df_erc20 in iter_token_transfer_pages(self.context, input.to_address()):
+            calculator.add_transfers(df_erc20)
+        return calculator.result()
 
 
 class AccountReturnHistoricalInput(AccountReturnInput, HistoricalDTO):
@@ -480,9 +475,79 @@ class AccountsHistoricalInput(Accounts, HistoricalDTO):
         }
 
 
+# 7200 blocks = 1440 minutes = 24 hr = 1 day
+PRICE_FILL_MAX_BLOCKS = 7200
+
+# Number of token x block prices requested per call of price.dex-db-blocks-tokens
+PRICE_CELLS_PER_CALL = 10 * 7
+
+
+class TokenBlockPrices:
+    """
+    Prices of tokens (rows) at blocks (columns) in a matrix, NaN for missing.
+    """
+
+    def __init__(self, tokens: List[str], blocks: List[int]):
+        self.tokens = list(tokens)
+        self.token_index = {token: n for n, token in enumerate(self.tokens)}
+        self.blocks = np.unique(np.array(blocks, dtype=np.int64))
+        self.prices = np.full((len(self.tokens), self.blocks.shape[0]), np.nan)
+
+    def row(self, block_prices: List[dict]) -> np.ndarray:
+        """
+        Align a list of {blockNumber, price} to the blocks.
+        """
+        row = np.full(self.blocks.shape[0], np.nan)
+        found = [(p["blockNumber"], p["price"]) for p in block_prices if p["price"] is not None]
+        if len(found) > 0:
+            found_blocks, found_prices = zip(*found)
+            pos = np.searchsorted(self.blocks, np.array(found_blocks, dtype=np.int64))
+            in_blocks = pos < self.blocks.shape[0]
+            in_blocks[in_blocks] = self.blocks[pos[in_blocks]] == np.array(found_blocks)[in_blocks]
+            row[pos[in_blocks]] = np.array(found_prices, dtype=np.float64)[in_blocks]
+        return row
+
+    def set_prices(self, token: str, block_prices: List[dict]):
+        self.prices[self.token_index[token]] = self.row(block_prices)
+
+    def mask(self, token_blocks: dict) -> np.ndarray:
+        """
+        Cells of the blocks listed for each token.
+        """
+        mask = np.zeros(self.prices.shape, dtype=bool)
+        for token, blocks in token_blocks.items():
+            mask[self.token_index[token], np.searchsorted(self.blocks, list(blocks))] = True
+        return mask
+
+    def divide(self, quotes: np.ndarray):
+        with np.errstate(divide="ignore", invalid="ignore"):
+            self.prices = np.where(quotes > 0, self.prices / quotes, np.nan)
+
+    def forward_fill(self, max_blocks: int = PRICE_FILL_MAX_BLOCKS):
+        """
+        Fill missing prices with the last price of the token within max_blocks before.
+        """
+        n_blocks = self.blocks.shape[0]
+        last_pos = np.where(np.isnan(self.prices), -1, np.arange(n_blocks))
+        last_pos = np.maximum.accumulate(last_pos, axis=1)
+        has_last = last_pos >= 0
+        last_pos = np.maximum(last_pos, 0)
+        block_diff = self.blocks[np.newaxis, :] - self.blocks[last_pos]
+        fill = np.isnan(self.prices) & has_last & (block_diff < max_blocks)
+        self.prices[fill] = np.take_along_axis(self.prices, last_pos, axis=1)[fill]
+
+    def fill_from(self, token: str, block_number: int, price: float, max_blocks: int = PRICE_FILL_MAX_BLOCKS):
+        """
+        Fill missing prices of a token for blocks within max_blocks after block_number.
+        """
+        row = self.prices[self.token_index[token]]
+        block_diff = self.blocks - block_number
+        row[np.isnan(row) & (block_diff > 0) & (block_diff < max_blocks)] = price
+
+
 @Model.describe(
     slug="accounts.token-historical",
-    version="0.14",
+    version="0.15",
     display_name="Accounts' Token Holding Historical",
     description="Accounts' Token Holding Historical",
     developer="Credmark",
@@ -511,13 +576,13 @@ class AccountsERC20TokenHistorical(Model):
                 functools.reduce(lambda a, b: a | set(b), token_blocks.values(), set())
             )
             all_tokens = list(token_blocks.keys())
+            is_usd_quote = input.quote.address == FiatCurrency(symbol="USD").address
 
             all_prices = []
             len_list = len(all_tokens)
-            chunk_size = int(10 * 7 / len(all_blocks))
-            range_start = 0
+            chunk_size = max(1, PRICE_CELLS_PER_CALL // max(1, len(all_blocks)))
             for i in range(0, len_list, chunk_size):
-                rr = (range_start + i, min(len_list, range_start + i + chunk_size))
+                rr = (i, min(len_list, i + chunk_size))
                 self.logger.info(
                     "Fetching `price.dex-db-blocks-tokens` "
                     f"{rr[1]-rr[0]}*{len(all_blocks)}={(rr[1]-rr[0])*len(all_blocks)} "
@@ -531,108 +596,92 @@ class AccountsERC20TokenHistorical(Model):
             if len(all_prices) != len(all_tokens):
                 raise ModelRunError("Prices results length is different from input list of tokens")
 
-            all_prices_dict = {d["address"]: d["results"] for d in all_prices}
+            price_matrix = TokenBlockPrices(all_tokens, all_blocks)
+            for d in all_prices:
+                price_matrix.set_prices(d["address"], d["results"])
 
-            if input.quote.address != FiatCurrency(symbol="USD").address:
+            if not is_usd_quote:
                 quotes = self.context.run_model(
                     "price.dex-db-blocks",
                     input={"address": input.quote.address, "blocks": all_blocks},
                 )["results"]
-                quotes = {q["blockNumber"]: q["price"] for q in quotes}
-            else:
-                quotes = None
-
-            for token_addr, past_blocks in token_blocks.items():
-                # pylint: disable=pointless-string-statement
-                """
-                # Use per-token-many-blocks model
-
-                prices = (self.context.run_model(
-                    'price.dex-db-blocks',
-                    input={'address': token_addr, 'blocks': list(past_blocks)})
-                    ['results'])
-
-                if len(prices) == 0 and len(past_blocks) != 1:
-                    continue
-                """
+                price_matrix.divide(price_matrix.row(quotes))
 
-                prices = all_prices_dict.get(token_addr)
-                if (
-                    prices is None
-                    or len(prices) == 0
-                    or len([p for p in prices if p["price"] is None]) > 0
-                ):
-                    continue
-
-                prices = [p for p in prices if p["blockNumber"] in past_blocks]
+            price_matrix.forward_fill()
 
-                if quotes is not None:
-                    for p_idx, _ in enumerate(prices):
-                        prices[p_idx]["price"] /= quotes[prices[p_idx]["blockNumber"]]
+            needed = price_matrix.mask(token_blocks)
+            missing = needed & np.isnan(price_matrix.prices)
 
-                if len(prices) < len(past_blocks):
-                    if not do_wobble_price:
-                        continue
+            if do_wobble_price and missing.any():
+                # TODO: temporary fix to price not catching up with the latest
+                try:
+                    last_quote = (
+                        None
+                        if is_usd_quote
+                        else self.context.run_model(
+                            "price.dex-db-latest", input={"address": input.quote.address}
+                        )["price"]
+                    )
+                except ModelDataError as err:
+                    if "No price for" not in err.data.message:  # pylint:disable=unsupported-membership-test
+                        raise
+                    last_quote = np.nan
 
+                for token_n in np.flatnonzero(missing.any(axis=1)):
+                    token_addr = price_matrix.tokens[token_n]
                     try:
                         last_price = self.context.run_model(
                             "price.dex-db-latest", input={"address": token_addr}
                         )
-                        if input.quote.address != FiatCurrency(symbol="USD").address:
-                            last_quote = self.context.run_model(
-                                "price.dex-db-latest", input={"address": input.quote.address}
-                            )
-                            last_price["price"] /= last_quote["price"]
                     except ModelDataError as err:
                         if "No price for" in err.data.message:  # pylint:disable=unsupported-membership-test
                             continue
                         raise
+                    if last_price["price"] is None:
+                        continue
+                    price_matrix.fill_from(
+                        token_addr,
+                        last_price["blockNumber"],
+                        last_price["price"] / last_quote if last_quote is not None else last_price["price"],
+                    )
 
-                    last_price_block = last_price["blockNumber"]
-                    # TODO: temporary fix to price not catching up with the latest
-                    blocks_in_prices = set(p["blockNumber"] for p in prices)
-                    for blk_n, blk in enumerate(past_blocks):
-                        if blk not in blocks_in_prices:
-                            # 7200 blocks = 1440 minutes = 24 hr = 1 day
-                            self.logger.info(f"[{self.slug}] make up last price")
-                            blk_diff = blk - last_price_block
-                            if 0 < blk_diff < 7200:
-                                self.logger.info(
-                                    f"Use last price for {token_addr} for "
-                                    f"{blk} close to {last_price_block} ({blk_diff=})"
-                                )
-                                prices.insert(blk_n, last_price)
-                            else:
-                                self.logger.info(
-                                    f"Not use last price for {token_addr} "
-                                    f"for {blk} far to {last_price_block} ({blk_diff=})"
-                                )
-                                try:
-                                    new_price = self.context.run_model(
-                                        "price.quote",
-                                        input={
-                                            "base": token_addr,
-                                            "quote": input.quote.address,
-                                            "prefer": "cex",
-                                        },
-                                        block_number=blk,
-                                    )  # type: ignore
-                                except ModelRunError:
-                                    continue
-                                prices.insert(blk_n, new_price)
-
-                # pylint:disable=line-too-long
-                for past_block, price in zip(past_blocks, prices):
-                    if price["price"] is not None:
-                        (
-                            price_historical_result[historical_blocks[str(past_block)]]  # type: ignore
-                            # type: ignore
-                            .output["positions"][token_rows[token_addr][str(past_block)]][
-                                "price_quote"
+                missing = needed & np.isnan(price_matrix.prices)
+                missing_cells = np.argwhere(missing)
+                if missing_cells.shape[0] > 0:
+                    self.logger.info(
+                        f"[{self.slug}] Fetching {missing_cells.shape[0]} prices "
+                        "not in the price database"
+                    )
+                    fallback_prices = self.context.run_model(
+                        "price.quote-multiple-blocks-maybe",
+                        input={
+                            "some": [
+                                {
+                                    "base": price_matrix.tokens[token_n],
+                                    "quote": input.quote.address,
+                                    "prefer": "cex",
+                                    "block_number": int(price_matrix.blocks[block_n]),
+                                }
+                                for token_n, block_n in missing_cells
                             ]
-                        ) = PriceWithQuote(
-                            price=price["price"], src="dex", quoteAddress=input.quote.address
-                        ).dict()
+                        },
+                        return_type=Some[Maybe[PriceWithQuote]],
+                    ).some
+                    for (token_n, block_n), fallback_price in zip(missing_cells, fallback_prices):
+                        if fallback_price.just is not None:
+                            price_matrix.prices[token_n, block_n] = fallback_price.just.price
+
+            for token_n, block_n in np.argwhere(needed & ~np.isnan(price_matrix.prices)):
+                token_addr = price_matrix.tokens[token_n]
+                past_block = str(price_matrix.blocks[block_n])
+                (
+                    price_historical_result[historical_blocks[past_block]]  # type: ignore
+                    .output["positions"][token_rows[token_addr][past_block]]["price_quote"]
+                ) = PriceWithQuote(
+                    price=float(price_matrix.prices[token_n, block_n]),
+                    src="dex",
+                    quoteAddress=input.quote.address,
+                ).dict()
 
         res = price_historical_result.dict()
         for n in range(len(res["results"])):
@@ -1,16 +1,18 @@
 # pylint:disable=line-too-long
 
+from collections import defaultdict
 from datetime import datetime
-from typing import List, Optional
+from typing import Dict, List, Optional, Tuple
 
+import numpy as np
+import pandas as pd
 from credmark.cmf.model.errors import ModelDataError, ModelInputError, ModelRunError
 from credmark.cmf.types import (
     Address,
-    BlockNumber,
-    MapBlocksOutput,
     Maybe,
     PriceWithQuote,
     Records,
+    Some,
     Token,
 )
 from credmark.dto import DTO, DTOField
@@ -37,44 +39,42 @@ class TokenReturnOutput(DTO):
         return cls(token_returns=[], total_current_value=0, total_return=0)
 
 
-# pylint:disable=too-many-branches
-def token_return(_context, _logger, _df, _token_list, quote=None) -> TokenReturnOutput:
-    if _token_list == 'cmf':
-        token_list = (_context.run_model(
-            'token.list', {}, return_type=Records).to_dataframe()
-            ['address']
-            .values)
-    elif _token_list == 'all':
-        token_list = None
-    else:
-        raise ModelInputError(
-            'The token_list field in input shall be one of all or cmf (token list from token.list)')
+class TokenReturnCalculator:
+    """
+    Return of tokens from transfers, added in batches as they arrive from the ledger.
 
-    all_tokens = []
+    Transfers are netted per token and block, so each (token, block) pair is priced once
+    when the result is requested.
+    """
 
-    _block_times = [BlockNumber(blk).timestamp_datetime
-                    for blk in _df.block_number.unique().tolist()]
+    NATIVE_ADDRESS = '0xeeeeeeeeeeeeeeeeeeeeeeeeeeeeeeeeeeeeeeee'
 
-    _logger.info(
-        f'{_df.shape[0]} rows, {_df["token_address"].unique().shape[0]} tokens')
+    def __init__(self, context, logger, token_list: Optional[List[str]], quote=None):
+        self.context = context
+        self.logger = logger
+        self.token_list = token_list
+        self.quote = quote
+        # token address => (token, symbol), None for tokens that are skipped
+        self.tokens: Dict[str, Optional[Tuple[Token, str]]] = {}
+        self.flows = {}
+        self.transactions = defaultdict(int)
 
-    _token_min_block = _df.groupby('token_address')["block_number"].min()
-
-    for tok_address, dfa in _df.groupby('token_address'):
-        min_block_number = int(dfa.block_number.min())
+    def load_token(self, tok_address: str) -> Optional[Token]:
+        if tok_address in self.tokens:
+            loaded = self.tokens[tok_address]
+            return loaded[0] if loaded is not None else None
 
         tok = Token(tok_address).as_erc20(set_loaded=True)
-
         try:
-            dfa = dfa.assign(
-                value=lambda x, tok=tok: x.value.apply(tok.scaled))
+            tok.scaled(0)
         except ModelDataError:
-            _context.logger.info(tok.address)
-            if tok.abi is not None and 'decimals' not in tok.abi.functions:
-                continue  # skip for ERC-721`
-            continue  # also skip for other error
+            self.context.logger.info(tok.address)
+            # skip for ERC-721 and for other error
+            self.tokens[tok_address] = None
+            return None
         except ContractLogicError:
-            continue
+            self.tokens[tok_address] = None
+            return None
 
         try:
             tok_symbol = tok.symbol
@@ -83,99 +83,167 @@ def token_return(_context, _logger, _df, _token_list, quote=None) -> TokenReturn
         except OverflowError:
             tok_symbol = ''
         except Exception as _err:
-            _context.logger.info(f'{_err} with {tok} for symbol')
+            self.context.logger.info(f'{_err} with {tok} for symbol')
             tok_symbol = ''
 
-        if (token_list is None or
-            tok.address.checksum in token_list or
-                tok.contract_name in ['UniswapV2Pair', 'Vyper_contract', ]):
-            input = {'base': tok}
-            if quote is not None:
-                input['quote'] = quote
-            then_pq = _context.run_model(slug='price.quote-maybe',
-                                         input=input,
-                                         return_type=Maybe[PriceWithQuote],
-                                         block_number=min_block_number)
-            if then_pq.just:
-                then_price = then_pq.just.price
-            else:
-                then_price = None
-        else:
-            then_price = None
-
-        value = None
-        block_numbers = []
-        past_prices = {}
-        if then_price is not None:
-            block_numbers = [int(x)
-                             for x in dfa.block_number.unique().tolist()]
-
-            dd = datetime.now()
-            pp = _context.run_model('price.quote-maybe-blocks',
-                                    input={'base': tok,
-                                           'quote': quote,
-                                           'block_numbers': block_numbers},
-                                    return_type=MapBlocksOutput[Maybe[PriceWithQuote]])
-
-            for r in pp.results:
-                if r.output is not None and r.output.just is not None:
-                    past_prices[r.blockNumber] = r.output.just.price
+        self.tokens[tok_address] = (tok, tok_symbol)
+        return tok
+
+    def add_transfers(self, df_transfers: pd.DataFrame):
+        """
+        Add a batch of transfers with columns of token_address, block_number and value (signed, unscaled).
+        """
+        if df_transfers.empty:
+            return
+
+        self.logger.info(
+            f'{df_transfers.shape[0]} rows, {df_transfers["token_address"].unique().shape[0]} tokens')
+
+        for tok_address, df_tok in df_transfers.groupby('token_address'):
+            tok = self.load_token(tok_address)
+            if tok is None:
+                continue
+
+            self.transactions[tok_address] += df_tok.shape[0]
+            df_flow = (df_tok
+                       .assign(block_number=lambda x: x.block_number.astype(int),
+                               value=lambda x: x.value.astype(object))
+                       .groupby('block_number')['value']
+                       .sum())
+            if tok_address in self.flows:
+                df_flow = self.flows[tok_address].add(df_flow, fill_value=0)
+            self.flows[tok_address] = df_flow
+
+    def is_priced(self, tok: Token) -> bool:
+        return (self.token_list is None or
+                tok.address.checksum in self.token_list or
+                tok.contract_name in ['UniswapV2Pair', 'Vyper_contract', ])
+
+    def run_prices(self, price_blocks: List[Tuple[str, Optional[int]]]) -> np.ndarray:
+        """
+        Prices of (token address, block number or None for the current block), NaN for missing.
+        """
+        if len(price_blocks) == 0:
+            return np.array([])
+
+        price_inputs = []
+        for tok_address, block_number in price_blocks:
+            price_input = {'base': self.loaded_token(tok_address)[0], 'block_number': block_number}
+            if self.quote is not None:
+                price_input['quote'] = self.quote
+            price_inputs.append(price_input)
+
+        dd = datetime.now()
+        prices = self.context.run_model('price.quote-multiple-blocks-maybe',
+                                        input={'some': price_inputs},
+                                        return_type=Some[Maybe[PriceWithQuote]]).some
+        tt = datetime.now() - dd
+        self.logger.info(f'Priced {len(price_inputs)} (token, block) pairs in {tt.seconds}s')
+
+        return np.array([p.just.price if p.just is not None else np.nan for p in prices])
+
+    def get_prices(self, tok_addresses: List[str]) -> Dict[str, np.ndarray]:
+        """
+        Prices of each token at its transfer blocks, followed by the current price, NaN for missing.
+
+        The first transfer block of all tokens is priced first, and the other blocks only of the
+        tokens with a price there, as the others are skipped by token_return.
+        """
+        first_prices = self.run_prices([(tok_address, int(self.flows[tok_address].index[0]))
+                                        for tok_address in tok_addresses])
+        tok_addresses = [tok_address for tok_address, first_price in zip(tok_addresses, first_prices)
+                         if not np.isnan(first_price)]
+
+        price_blocks = [(tok_address, block_number)
+                        for tok_address in tok_addresses
+                        for block_number in self.flows[tok_address].index[1:].tolist() + [None]]
+        price_array = self.run_prices(price_blocks)
+
+        splits = np.cumsum([self.flows[tok_address].shape[0] for tok_address in tok_addresses])[:-1]
+        return {tok_address: np.concatenate([[first_prices_n], rest])
+                for tok_address, first_prices_n, rest
+                in zip(tok_addresses,
+                       first_prices[~np.isnan(first_prices)],
+                       np.split(price_array, splits))}
+
+    def loaded_token(self, tok_address: str) -> Tuple[Token, str]:
+        loaded = self.tokens[tok_address]
+        if loaded is None:
+            raise ModelRunError(f'Token {tok_address} is not loaded')
+        return loaded
+
+    def token_return(self, tok_address: str, prices: Optional[np.ndarray]) -> TokenReturn:
+        tok, tok_symbol = self.loaded_token(tok_address)
+        df_flow = self.flows[tok_address]
+        amounts = np.array([tok.scaled(v) for v in df_flow.values], dtype=np.float64)
+        balance = float(amounts.sum())
+
+        current_value = None
+        tok_return = None
+        # Skip pricing when there is no price at the first transfer
+        if prices is not None and not np.isnan(prices[0]):
+            past_prices = prices[:-1]
+            missing = np.isnan(past_prices)
+            if missing.any():
+                if tok_address == self.NATIVE_ADDRESS:
+                    # TODO: for price earlier than DEX was created
+                    past_prices = np.where(missing, 0, past_prices)
                 else:
-                    if tok_address == '0xeeeeeeeeeeeeeeeeeeeeeeeeeeeeeeeeeeeeeeee':
-                        # TODO: for price earlier than DEX was created
-                        past_prices[r.blockNumber] = 0
-                    else:
-                        raise ValueError(
-                            f'Unable to obtain price for {tok} on block {r.blockNumber} among {pp.results}')
-
-            value = 0
-
-            tt = datetime.now() - dd
-            _logger.info((tok_symbol, then_price, tt.seconds,
-                          len(block_numbers), tt.seconds / len(block_numbers),
-                          min_block_number))
-        else:
-            _logger.info((tok_symbol, then_price, len(
-                block_numbers), 'Skip price'))
+                    raise ValueError(
+                        f'Unable to obtain price for {tok} on block {df_flow.index[missing].tolist()}')
 
-        balance = 0
-        for _n, r in dfa.iterrows():
-            balance += r.value
-            if then_price is not None:
-                value += -r.value * past_prices[r.block_number]
+            # Value paid for the inflows and received from the outflows
+            value = float(-(amounts * past_prices).sum())
 
-        if value is not None:
             if balance != 0:
-                current_price = _context.run_model(slug='price.quote',
-                                                   input={'base': tok, 'quote': quote},
-                                                   return_type=PriceWithQuote).price
-                current_value = balance * current_price
+                current_price = prices[-1]
+                if np.isnan(current_price):
+                    raise ModelRunError(f'Unable to obtain current price for {tok}')
+                current_value = float(balance * current_price)
             else:
                 current_value = 0.0
 
             tok_return = value + current_value
         else:
-            tok_return = None
-            current_value = None
-
-        all_tokens.append(
-            TokenReturn(
-                token_address=tok.address,
-                token_symbol=tok_symbol,
-                current_amount=balance,
-                current_value=current_value,
-                token_return=tok_return,
-                transactions=dfa.shape[0]))
-
-    total_current_value = sum(x.current_value for x in all_tokens
-                              if x.current_value is not None)
-
-    total_return = sum(x.token_return for x in all_tokens
-                       if x.token_return is not None)
-
-    return TokenReturnOutput(
-        # + [native_token_return],
-        token_returns=all_tokens,
-        # + (native_token_return.current_value if native_token_return.current_value is not None else 0)),
-        total_current_value=(total_current_value),
-        total_return=total_return)
+            self.logger.info((tok_symbol, None, df_flow.shape[0], 'Skip price'))
+
+        return TokenReturn(
+            token_address=tok.address,
+            token_symbol=tok_symbol,
+            current_amount=balance,
+            current_value=current_value,
+            token_return=tok_return,
+            transactions=self.transactions[tok_address])
+
+    def result(self) -> TokenReturnOutput:
+        tok_addresses = sorted(self.flows.keys())
+        priced_addresses = [tok_address for tok_address in tok_addresses
+                            if self.is_priced(self.loaded_token(tok_address)[0])]
+        prices = self.get_prices(priced_addresses)
+
+        all_tokens = [self.token_return(tok_address, prices.get(tok_address))
+                      for tok_address in tok_addresses]
+
+        total_current_value = sum(x.current_value for x in all_tokens
+                                  if x.current_value is not None)
+
+        total_return = sum(x.token_return for x in all_tokens
+                           if x.token_return is not None)
+
+        return TokenReturnOutput(
+            token_returns=all_tokens,
+            total_current_value=total_current_value,
+            total_return=total_return)
+
+
+def get_token_list(_context, _token_list) -> Optional[List[str]]:
+    if _token_list == 'cmf':
+        return (_context.run_model(
+            'token.list', {}, return_type=Records).to_dataframe()
+            ['address']
+            .values)
+    elif _token_list == 'all':
+        return None
+    else:
+        raise ModelInputError(
+            'The token_list field in input shall be one of all or cmf (token list from token.list)')
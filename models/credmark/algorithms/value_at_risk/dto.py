@@ -58,6 +58,46 @@ class VaRHistoricalOutput(DTO):
         return cls(cvar=[], var=VaROutput.default().var, total_value=0, value_list=[])
 
 
+class VaRHistoricalMultipleInput(IterableListGenericDTO[PriceList]):
+    portfolios: List[Portfolio]
+    priceLists: List[PriceList]
+    intervals: List[int]
+    confidences: List[float]
+    _iterator: str = PrivateAttr('priceLists')
+
+    class Config:
+        schema_extra = {
+            'description': 'Historical VaR input for many portfolios, intervals and confidences over the same price lists',
+            'examples': [
+                {'portfolios': [
+                    {'positions': [
+                        {'amount': 100.0, 'asset': {'address': '0x7fc66500c84a76ad7e9c93437bfc5ac33e2ddae9'}},
+                        {'amount': 100.0, 'asset': {'address': '0xa0b86991c6218b36c1d19d4a2e9eb0ce3606eb48'}}]},
+                    {'positions': [
+                        {'amount': -50.0, 'asset': {'address': '0x7fc66500c84a76ad7e9c93437bfc5ac33e2ddae9'}}]}],
+                 'priceLists': [
+                     {'prices': [float(i) for i in range(1, 31+1)],
+                      'tokenAddress': '0x7fc66500c84a76ad7e9c93437bfc5ac33e2ddae9', 'src': 'finance.example-historical-price'},
+                     {'prices': [float(i) for i in range(1, 31+1)],
+                      'tokenAddress': '0xa0b86991c6218b36c1d19d4a2e9eb0ce3606eb48', 'src': 'finance.example-historical-price'}],
+                 'intervals': [1, 3],
+                 'confidences': [0.01, 0.05]}
+            ]}
+
+
+class VaRHistoricalScenario(DTO):
+    portfolio: int = DTOField(description='Index of the portfolio in the input')
+    interval: int
+    confidence: float
+    var: float = DTOField(description='VaR')
+    cvar: List[float] = DTOField(description='VaR components')
+    total_value: float = DTOField(description='Value of the portfolio')
+
+
+class VaRHistoricalMultipleOutput(DTO):
+    results: List[VaRHistoricalScenario]
+
+
 class VaRInput(DTO):
     window: str
     interval: int
@@ -1,7 +1,7 @@
-from typing import Optional
+from collections import defaultdict
+from typing import List, Optional, Tuple
 
 import numpy as np
-import scipy.stats as sps
 from credmark.cmf.model import Model
 from credmark.cmf.model.errors import ModelRunError
 from credmark.cmf.types import (
@@ -25,9 +25,11 @@ from models.credmark.algorithms.value_at_risk.dto import (
     AccountVaRInput,
     PortfolioVaRInput,
     VaRHistoricalInput,
+    VaRHistoricalMultipleInput,
+    VaRHistoricalMultipleOutput,
     VaRHistoricalOutput,
+    VaRHistoricalScenario,
 )
-from models.credmark.algorithms.value_at_risk.risk_method import calc_var
 
 np.seterr(all='raise')
 
@@ -220,8 +222,140 @@ class VaRPortfolio(Model):
                                       return_type=VaRHistoricalOutput)
 
 
+class HistoricalVaR:
+    """
+    Historical VaR over a shared set of price lists.
+
+    Returns are computed once per token and interval and reused for every portfolio.
+    The prices in priceLists is assumed be sorted in descending order in time.
+    """
+
+    def __init__(self, price_lists: List[PriceList]):
+        self.price_lists = defaultdict(list)
+        for price_list in price_lists:
+            self.price_lists[price_list.tokenAddress].append(price_list)
+        self._prices = {}
+        self._returns = {}
+
+    def prices(self, token: Token) -> np.ndarray:
+        if token.address not in self._prices:
+            price_lists = self.price_lists.get(token.address, [])
+            if len(price_lists) != 1:
+                raise ModelRunError(
+                    f'There is no or more than 1 price list for {token.address=}')
+            self._prices[token.address] = np.array(price_lists[0].prices)
+        return self._prices[token.address]
+
+    def returns(self, token: Token, interval: int) -> np.ndarray:
+        if (token.address, interval) not in self._returns:
+            np_priceList = self.prices(token)
+            if interval > np_priceList.shape[0]-2:
+                raise ModelRunError(
+                    f'Interval {interval} is shall be of at most input list '
+                    f'({np_priceList.shape[0]}-2) long.')
+            self._returns[(token.address, interval)] = (
+                np_priceList[:-interval] / np_priceList[interval:] - 1)
+        return self._returns[(token.address, interval)]
+
+    @staticmethod
+    def position_tokens(position) -> List[Tuple[Token, float]]:
+        if isinstance(position, CurveLPPosition):
+            return [(lp_pos.asset, lp_pos.amount) for lp_pos in position.lp_position]
+        return [(position.asset, position.amount)]
+
+    def position_values(self, portfolios: List[Portfolio]):
+        """
+        Value of each position (rows) in each token (columns) at the latest prices.
+        """
+        tokens = {}
+        cells = []
+        for port_n, portfolio in enumerate(portfolios):
+            for pos_n, position in enumerate(portfolio):
+                for token, amount in self.position_tokens(position):
+                    token_n = tokens.setdefault(token.address, (len(tokens), token))[0]
+                    cells.append((port_n, pos_n, token_n, amount * self.prices(token)[0]))
+
+        n_positions = [len(portfolio.positions) for portfolio in portfolios]
+        offsets = np.concatenate([[0], np.cumsum(n_positions)]).astype(int)
+        values = np.zeros((offsets[-1], len(tokens)))
+        for port_n, pos_n, token_n, value in cells:
+            values[offsets[port_n] + pos_n, token_n] += value
+        return [token for _, token in tokens.values()], values, offsets
+
+    def returns_matrix(self, tokens: List[Token], interval: int) -> np.ndarray:
+        returns = [self.returns(token, interval) for token in tokens]
+        for token, ret in zip(tokens, returns):
+            if ret.shape[0] != returns[0].shape[0]:
+                raise ModelRunError(
+                    f'Input priceList for {token.address} has '
+                    f'difference lengths has {ret.shape[0]} != {returns[0].shape[0]}')
+        return np.vstack(returns)
+
+    @staticmethod
+    def component_weights(ppl: np.ndarray, total_ppl: np.ndarray) -> np.ndarray:
+        """
+        Slope of each position's P&L (rows) regressed on the portfolio P&L, normalized to sum to 1.
+        """
+        total_centered = total_ppl - total_ppl.mean()
+        total_ss = total_centered @ total_centered
+        if total_ss == 0:
+            return np.zeros(ppl.shape[0])
+        weights = ppl @ total_centered / total_ss
+        weights_sum = weights.sum()
+        return weights / weights_sum if weights_sum != 0 else weights
+
+    def run(self,
+            portfolios: List[Portfolio],
+            intervals: List[int],
+            confidences: List[float]) -> List[VaRHistoricalScenario]:
+        for conf in confidences:
+            if conf < 0 or conf > 1:
+                raise ModelRunError(f'Invalid confidence level {conf=}')
+
+        tokens, values, offsets = self.position_values(portfolios)
+        total_values = [values[offsets[port_n]:offsets[port_n+1]].sum()
+                        for port_n in range(len(portfolios))]
+
+        results = []
+        for interval in intervals:
+            if len(tokens) == 0:
+                continue
+            # ppl: potential profit&loss of each position (rows) in each scenario (columns)
+            ppl = values @ self.returns_matrix(tokens, interval)
+            if ppl.shape[1] <= 1:
+                raise ModelRunError(f'PPL is too short to calculate VaR {ppl.shape[1]=}')
+
+            for port_n in range(len(portfolios)):
+                port_ppl = ppl[offsets[port_n]:offsets[port_n+1]]
+                if port_ppl.shape[0] == 0:
+                    continue
+                total_ppl = port_ppl.sum(axis=0)
+                weights = self.component_weights(port_ppl, total_ppl)
+                var = np.percentile(total_ppl, np.array(confidences) * 100,
+                                    method='interpolated_inverted_cdf')
+                for conf, conf_var in zip(confidences, var):
+                    results.append(VaRHistoricalScenario(portfolio=port_n,
+                                                         interval=interval,
+                                                         confidence=conf,
+                                                         var=float(conf_var),
+                                                         cvar=weights.tolist(),
+                                                         total_value=float(total_values[port_n])))
+        return results
+
+    def value_list(self, portfolio: Portfolio) -> List[VaRHistoricalOutput.ValueList]:
+        value_list = []
+        for position in portfolio:
+            for token, amount in self.position_tokens(position):
+                price = self.prices(token)[0]
+                value_list.append(VaRHistoricalOutput.ValueList(token=Token(address=token.address),
+                                                                amount=amount,
+                                                                price=price,
+                                                                value=amount * price))
+        return value_list
+
+
 @Model.describe(slug='finance.var-engine-historical',
-                version='1.6',
+                version='1.7',
                 display_name='Value at Risk',
                 description='Value at Risk',
                 category='financial',
@@ -234,94 +368,36 @@ class VaREngineHistorical(Model):
     The prices in priceLists is assumed be sorted in descending order in time.
     """
 
-    value_list = []
-    total_value = 0
-    all_ppl_arr = np.array([])
-
-    def calculate_ppl(self, token, amount, input):
-        priceLists = [
-            pl for pl in input.priceLists if pl.tokenAddress == token.address]
-
-        if len(priceLists) != 1:
-            raise ModelRunError(
-                f'There is no or more than 1 price list for {token.address=}')
-
-        np_priceList = np.array(priceLists[0].prices)
-
-        if input.interval > np_priceList.shape[0]-2:
-            raise ModelRunError(
-                f'Interval {input.interval} is shall be of at most input list '
-                f'({np_priceList.shape[0]}-2) long.')
-
-        value = amount * np_priceList[0]
-        self.total_value += value
-        self.value_list.append(VaRHistoricalOutput.ValueList(token=Token(address=token.address),
-                                                             amount=amount,
-                                                             price=np_priceList[0],
-                                                             value=value))
-        ret_series = np_priceList[:-input.interval] / np_priceList[input.interval:] - 1
-        # ppl: potential profit&loss
-        ppl_vector = value * ret_series
-        return ppl_vector
-
-    def fill_ppl(self, ppl_vector, token):
-        if self.all_ppl_arr.shape[0] == 0:
-            self.all_ppl_arr = ppl_vector[:, np.newaxis]
-        else:
-            ppl_vec_len = ppl_vector.shape[0]
-            all_ppl_vec_len = self.all_ppl_arr.shape[0]
-            if all_ppl_vec_len != ppl_vec_len:
-                raise ModelRunError(
-                    f'Input priceList for {token.address} has '
-                    f'difference lengths has {ppl_vec_len} != {all_ppl_vec_len}')
-
-            self.all_ppl_arr = np.column_stack([self.all_ppl_arr, ppl_vector])
-
     def run(self, input: VaRHistoricalInput) -> VaRHistoricalOutput:
-        self.value_list = []
-        self.total_value = 0
-        self.all_ppl_arr = np.array([])
-
-        for _pos_n, pos in enumerate(input.portfolio):
-            if isinstance(pos, CurveLPPosition):
-                lp_vec_ppl = None
-                for _lp_pos_n, lp_pos in enumerate(pos.lp_position):
-                    token = lp_pos.asset
-                    amount = lp_pos.amount
-                    ppl_vector = self.calculate_ppl(token, amount, input)
-                    if lp_vec_ppl is None:
-                        lp_vec_ppl = ppl_vector
-                    else:
-                        lp_vec_ppl += ppl_vector
-                self.fill_ppl(lp_vec_ppl, pos.asset)
-            else:
-                token = pos.asset
-                amount = pos.amount
-                ppl_vector = self.calculate_ppl(token, amount, input)
-                self.fill_ppl(ppl_vector, token)
-
         output = VaRHistoricalOutput.default()
 
-        if self.all_ppl_arr.shape[0] == 0:
+        if len(input.portfolio.positions) == 0:
             return output
 
-        all_ppl_vec = self.all_ppl_arr.sum(axis=1)
-        weights = np.ones(len(input.portfolio.positions))
-        for i in range(len(input.portfolio.positions)):
-            try:
-                linreg_result = sps.linregress(
-                    all_ppl_vec, self.all_ppl_arr[:, i])
-                weights[i] = linreg_result.slope  # type: ignore
-            except ValueError as err:
-                if 'Cannot calculate a linear regression if all x values are identical' in str(err):
-                    weights[i] = 0
-
-        weights /= weights.sum()
-
-        output.cvar = weights
-        var_result = calc_var(all_ppl_vec, input.confidence)
-        output.var = var_result.var
-
-        output.total_value = self.total_value
-        output.value_list = self.value_list
+        engine = HistoricalVaR(input.priceLists)
+        results = engine.run([input.portfolio], [input.interval], [input.confidence])
+        # No token in the positions, e.g. a Curve LP position with no underlying
+        if len(results) == 0:
+            return output
+        result = results[0]
+
+        output.cvar = result.cvar
+        output.var = result.var
+        output.total_value = result.total_value
+        output.value_list = engine.value_list(input.portfolio)
         return output
+
+
+@Model.describe(slug='finance.var-engine-historical-multiple',
+                version='0.1',
+                display_name='Value at Risk - multiple portfolios',
+                description=('Value at Risk for many portfolios, intervals and confidences '
+                             'over the same price lists'),
+                category='financial',
+                input=VaRHistoricalMultipleInput,
+                output=VaRHistoricalMultipleOutput)
+class VaREngineHistoricalMultiple(Model):
+    def run(self, input: VaRHistoricalMultipleInput) -> VaRHistoricalMultipleOutput:
+        results = HistoricalVaR(input.priceLists).run(
+            input.portfolios, input.intervals, input.confidences)
+        return VaRHistoricalMultipleOutput(results=results)
@@ -2,11 +2,12 @@
 
 import math
 from datetime import date, datetime, timezone
-from typing import Union
+from typing import Optional, Union
 
+import numpy as np
 from credmark.cmf.model import CachePolicy, Model
 from credmark.cmf.model.errors import ModelDataError
-from credmark.cmf.types import Network, NetworkDict
+from credmark.cmf.types import Network, NetworkDict, Some
 from credmark.dto import DTO, EmptyInput
 
 
@@ -65,6 +66,67 @@ class Block(DTO):
     timestamp: int
 
 
+class BlocksInput(DTO):
+    timestamps: list[int]
+
+    class Config:
+        schema_extra = {
+            'examples': [{'timestamps': [1683726143, 1683639743, 1683553343]}],
+            'skip_test': True
+        }
+
+
+class BlockTimestampIndex:
+    """
+    Known (block number, timestamp) pairs of a chain, kept sorted in arrays.
+
+    New blocks are buffered and merged into the arrays when they are next searched.
+    Above MAX_BLOCKS, every other block is dropped so the index still spans the chain.
+    """
+
+    MAX_BLOCKS = 100_000
+
+    def __init__(self):
+        self.block_numbers = np.array([], dtype=np.int64)
+        self.timestamps = np.array([], dtype=np.int64)
+        self.pending: list[Block] = []
+
+    def add(self, block: Block):
+        self.pending.append(block)
+
+    def merge(self):
+        if len(self.pending) == 0:
+            return
+        block_numbers = np.concatenate(
+            [self.block_numbers, np.array([b.block_number for b in self.pending], dtype=np.int64)])
+        timestamps = np.concatenate(
+            [self.timestamps, np.array([b.timestamp for b in self.pending], dtype=np.int64)])
+        self.pending = []
+
+        block_numbers, pos = np.unique(block_numbers, return_index=True)
+        timestamps = timestamps[pos]
+        while block_numbers.shape[0] > self.MAX_BLOCKS:
+            block_numbers = block_numbers[::2]
+            timestamps = timestamps[::2]
+        self.block_numbers = block_numbers
+        self.timestamps = timestamps
+
+    def bounds(self, timestamp: int) -> tuple[Optional[Block], Optional[Block]]:
+        """
+        Closest known blocks at or before, and at or after the timestamp.
+        """
+        self.merge()
+        pos_right = np.searchsorted(self.timestamps, timestamp, side='right')
+        pos_left = np.searchsorted(self.timestamps, timestamp, side='left')
+        lower = (Block(block_number=int(self.block_numbers[pos_right - 1]),
+                       timestamp=int(self.timestamps[pos_right - 1]))
+                 if pos_right > 0 else None)
+        upper = (Block(block_number=int(self.block_numbers[pos_left]),
+                       timestamp=int(self.timestamps[pos_left]))
+                 if pos_left < self.timestamps.shape[0] else None)
+        return lower, upper
+
+
 class BlockYMDInput(DTO):
     datetime: Union[date, datetime]
 
@@ -96,21 +158,23 @@ class GetBlockYMD(Model):
                                       return_type=BlockOutput)
 
 
-@Model.describe(slug="chain.get-block",
-                version="0.3",  # CAN CHANGE THIS VERSION
-                display_name="Obtain block from timestamp",
-                description='In UTC',
-                category='chain',
-                input=BlockInput,
-                output=BlockOutput)
-class GetBlock(Model):
+class BlockSearch(Model):
+    # Blocks probed in this process by chain id, to narrow down later searches
+    BLOCK_INDEX: dict[int, BlockTimestampIndex] = {}
+
+    @property
+    def block_index(self) -> BlockTimestampIndex:
+        return self.BLOCK_INDEX.setdefault(self.context.chain_id, BlockTimestampIndex())
+
     def get_block(self, number: int) -> Block:
         output = self.context.run_model(
             "chain.get-block-timestamp",
             input=TimestampInput(block_number=number),
             local=True,
             return_type=TimestampOutput)
-        return Block(block_number=number, timestamp=output.timestamp)
+        block = Block(block_number=number, timestamp=output.timestamp)
+        self.block_index.add(block)
+        return block
 
     def get_latest_block(self) -> Block:
         output = self.context.run_model(
@@ -121,61 +185,99 @@ class GetBlock(Model):
                           timestamp: int,
                           start: Block,
                           end: Block) -> Block:
-        start_block = start.block_number
-        end_block = end.block_number
-
-        if start_block == end_block:
-            return start
-        # Return the closer one, if we're already between blocks
-        if (start_block == end_block - 1
-                or timestamp <= start.timestamp
-                or timestamp >= end.timestamp):
-            return start if abs(timestamp - start.timestamp) < abs(timestamp - end.timestamp) else end
-
-        # K is how far in between start and end we're expected to be
-        k = (timestamp - start.timestamp) / (end.timestamp - start.timestamp)
-        # We bound, to ensure logarithmic time even when guesses aren't great
-        k = min(max(k, 0.05), 0.95)
-        # We get the expected block number from K
-        expected_block_number = round(
-            start_block + k * (end_block - start_block))
-        # Make sure to make some progress
-        expected_block_number = min(
-            max(expected_block_number, start_block + 1), end_block - 1)
-
-        # Get the actual timestamp for that block
-        expected_block = self.get_block(expected_block_number)
-        expected_block_timestamp = expected_block.timestamp
-
-        # Adjust bound using our estimated block
-        if expected_block_timestamp < timestamp:
-            start = expected_block
-        elif expected_block_timestamp > timestamp:
-            end = expected_block
-        else:
-            # Return the perfect match
-            return expected_block
+        # Start from the tightest bounds known from previous probes
+        known_start, known_end = self.block_index.bounds(timestamp)
+        if known_start is not None and start.block_number < known_start.block_number < end.block_number:
+            start = known_start
+        if known_end is not None and start.block_number < known_end.block_number < end.block_number:
+            end = known_end
+
+        while True:
+            start_block = start.block_number
+            end_block = end.block_number
+
+            if start_block == end_block:
+                return start
+            # Return the closer one, if we're already between blocks
+            if (start_block == end_block - 1
+                    or timestamp <= start.timestamp
+                    or timestamp >= end.timestamp):
+                return start if abs(timestamp - start.timestamp) < abs(timestamp - end.timestamp) else end
+
+            # K is how far in between start and end we're expected to be
+            k = (timestamp - start.timestamp) / (end.timestamp - start.timestamp)
+            # We bound, to ensure logarithmic time even when guesses aren't great
+            k = min(max(k, 0.05), 0.95)
+            # We get the expected block number from K
+            expected_block_number = round(
+                start_block + k * (end_block - start_block))
+            # Make sure to make some progress
+            expected_block_number = min(
+                max(expected_block_number, start_block + 1), end_block - 1)
+
+            # Get the actual timestamp for that block
+            expected_block = self.get_block(expected_block_number)
+            expected_block_timestamp = expected_block.timestamp
+
+            # Adjust bound using our estimated block
+            if expected_block_timestamp < timestamp:
+                start = expected_block
+            elif expected_block_timestamp > timestamp:
+                end = expected_block
+            else:
+                # Return the perfect match
+                return expected_block
+
+    def get_blocks(self, timestamps: list[int]) -> list[BlockOutput]:
+        """
+        Search blocks for many timestamps. They are searched in time order so that each
+        search starts from the bounds left by the previous ones.
+        """
+        start = self.get_block(0)
+        end = self.get_latest_block()
 
-        # Recurse using tightened bounds
-        return self.get_closest_block(timestamp, start, end)
+        results = {}
+        for timestamp in sorted(set(timestamps)):
+            if timestamp < start.timestamp:
+                raise ModelDataError(
+                    f'{timestamp=} is before the first block ({start.timestamp})')
 
-    def run(self, input: BlockInput) -> BlockOutput:
-        start = self.get_block(0)
-        if input.timestamp < start.timestamp:
-            raise ModelDataError(
-                f'{input.timestamp=} is before the first block ({start.timestamp})')
+            if timestamp > end.timestamp:
+                results[timestamp] = BlockOutput(block_number=end.block_number,
+                                                 block_timestamp=end.timestamp,
+                                                 sample_timestamp=timestamp)
+                continue
 
-        end = self.get_latest_block()
-        if input.timestamp > end.timestamp:
-            return BlockOutput(block_number=end.block_number,
-                               block_timestamp=end.timestamp,
-                               sample_timestamp=input.timestamp)
+            closest_block = self.get_closest_block(timestamp, start, end)
+            results[timestamp] = BlockOutput(block_number=closest_block.block_number,
+                                             block_timestamp=closest_block.timestamp,
+                                             sample_timestamp=timestamp)
 
-        closest_block = self.get_closest_block(input.timestamp, start, end)
+        return [results[timestamp] for timestamp in timestamps]
 
-        return BlockOutput(block_number=closest_block.block_number,
-                           block_timestamp=closest_block.timestamp,
-                           sample_timestamp=input.timestamp)
+
+@Model.describe(slug="chain.get-block",
+                version="0.4",  # CAN CHANGE THIS VERSION
+                display_name="Obtain block from timestamp",
+                description='In UTC',
+                category='chain',
+                input=BlockInput,
+                output=BlockOutput)
+class GetBlock(BlockSearch):
+    def run(self, input: BlockInput) -> BlockOutput:
+        return self.get_blocks([input.timestamp])[0]
+
+
+@Model.describe(slug="chain.get-blocks",
+                version="0.1",
+                display_name="Obtain blocks from timestamps",
+                description='In UTC. Timestamps are searched together with shared probes',
+                category='chain',
+                input=BlocksInput,
+                output=Some[BlockOutput])
+class GetBlocks(BlockSearch):
+    def run(self, input: BlocksInput) -> Some[BlockOutput]:
+        return Some[BlockOutput](some=self.get_blocks(input.timestamps))
 
 
 class EmptyInputForLatestBlock(EmptyInput):
@@ -1,16 +1,20 @@
 # pylint: disable=pointless-string-statement, line-too-long
 
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from contextvars import copy_context
 from datetime import datetime
 from typing import Any, Optional
 
 import pandas as pd
-from credmark.cmf.model import CachePolicy, IncrementalModel, Model
+from credmark.cmf.model import CachePolicy, IncrementalModel, Model, ModelContext
 from credmark.cmf.model.errors import ModelDataError
 from credmark.cmf.types import BlockNumber, Contract, Records
 from credmark.cmf.types.series import BlockSeries, BlockSeriesRow
 from credmark.dto import DTO, DTOField
 from requests.exceptions import HTTPError
 
+from models.credmark.chain.event_store import EventStore
+
 
 class ContractEventsBlockSeriesInput(Contract):
     event_name: str = DTOField(description='Event name')
@@ -32,84 +36,103 @@ class ContractEventsInput(ContractEventsBlockSeriesInput):
         None, gte=0, description='Block number to start fetching events from')
 
 
-def fetch_events_with_range(logger,
+def _fetch_events(contract: Contract, contract_event, from_block, to_block, contract_address, argument_filters):
+    return pd.DataFrame(contract.fetch_events(
+        contract_event,
+        from_block=from_block,
+        to_block=to_block,
+        contract_address=contract_address,
+        argument_filters=argument_filters))
+
+
+def iter_events_with_range(logger,  # pylint: disable=too-many-arguments
+                           contract: Contract,
+                           contract_event,
+                           from_block: int,
+                           to_block: int,
+                           contract_address=None,
+                           argument_filters=None,
+                           by_range: int = 10_000,
+                           max_by_range: int = 100_000,
+                           max_workers: int = 4):
+    """
+    Fetch events in block ranges on a pool of workers and yield the DataFrames in block order.
+
+    A new range is submitted as soon as a worker is free, so a slow range does not hold up
+    the others. A range that fails is split in halves and the next ranges are made smaller;
+    the range size grows again after each success, up to max_by_range.
+    """
+    # failed ranges to fetch again, in block order
+    pending: list[tuple[int, int]] = []
+    running: dict[Future, tuple[int, int]] = {}
+    fetched: dict[int, tuple[int, pd.DataFrame]] = {}
+    next_block = from_block
+    scheduled_block = from_block
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while next_block <= to_block:
+            while len(running) < max_workers and (len(pending) > 0 or scheduled_block <= to_block):
+                if len(pending) > 0:
+                    start, end = pending.pop(0)
+                else:
+                    start, end = scheduled_block, min(scheduled_block + by_range - 1, to_block)
+                    scheduled_block = end + 1
+                future = executor.submit(copy_context().run, _fetch_events,
+                                         contract, contract_event, start, end,
+                                         contract_address, argument_filters)
+                running[future] = (start, end)
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                start, end = running.pop(future)
+                try:
+                    fetched[start] = (end, future.result())
+                    by_range = min(by_range * 2, max_by_range)
+                except (HTTPError, ValueError) as err:
+                    if start == end:
+                        raise ValueError(
+                            f'Can not fetch events for {contract.address} in block {start}') from err
+                    mid = (start + end) // 2
+                    pending = sorted(pending + [(start, mid), (mid + 1, end)])
+                    by_range = max(1, (end - start + 1) // 2)
+                    if logger:
+                        logger.info(f'Split [{start}-{end}] and use by_range={by_range}')
+
+            while next_block in fetched:
+                end, df_events = fetched.pop(next_block)
+                if not df_events.empty:
+                    yield df_events
+                next_block = end + 1
+
+
+def fetch_events_with_range(logger,  # pylint: disable=too-many-arguments
                             contract: Contract,
                             contract_event,
                             from_block: int,
                             to_block: Optional[int],
                             contract_address=None,
-                            argument_filters=None
+                            argument_filters=None,
+                            max_workers: int = 4
                             ):
     try:
-        df_events = pd.DataFrame(contract.fetch_events(
-            contract_event,
-            from_block=from_block,
-            to_block=to_block,
-            contract_address=contract_address,
-            argument_filters=argument_filters))
-    except HTTPError:
-        try:
-            df_events = pd.DataFrame(contract.fetch_events(
-                contract_event,
-                from_block=from_block,
-                to_block=to_block,
-                contract_address=contract_address,
-                argument_filters=argument_filters,
-                by_range=10_000))
-            if logger:
-                logger.info('Use by_range=10_000')
-        except ValueError:
-            try:
-                df_events = pd.DataFrame(contract.fetch_events(
-                    contract_event,
-                    from_block=from_block,
-                    to_block=to_block,
-                    contract_address=contract_address,
-                    argument_filters=argument_filters,
-                    by_range=5_000))
-                if logger:
-                    logger.info('Use by_range=5_000')
-            except ValueError:
-                try:
-                    df_events = pd.DataFrame(contract.fetch_events(
-                        contract_event,
-                        from_block=from_block,
-                        to_block=to_block,
-                        contract_address=contract_address,
-                        argument_filters=argument_filters,
-                        by_range=2_000))
-                    if logger:
-                        logger.info('Use by_range=2_000')
-                except ValueError:
-                    try:
-                        df_events = pd.DataFrame(contract.fetch_events(
-                            contract_event,
-                            from_block=from_block,
-                            to_block=to_block,
-                            contract_address=contract_address,
-                            argument_filters=argument_filters,
-                            by_range=1_000))
-                        if logger:
-                            logger.info('Use by_range=1_000')
-                    except ValueError:
-                        try:
-                            df_events = pd.DataFrame(contract.fetch_events(
-                                contract_event,
-                                from_block=from_block,
-                                to_block=to_block,
-                                contract_address=contract_address,
-                                argument_filters=argument_filters,
-                                by_range=100))
-                            if logger:
-                                logger.info('Use by_range=100')
-                        except ValueError as _err:
-                            raise ValueError(
-                                f'Can not fetch events for {contract.address} between [{from_block}-{to_block}]') from _err
-    return df_events
+        return _fetch_events(contract, contract_event, from_block, to_block,
+                             contract_address, argument_filters)
+    except (HTTPError, ValueError):
+        if logger:
+            logger.info(f'Fetch events for {contract.address} in ranges from {from_block} to {to_block}')
+
+    if to_block is None:
+        to_block = int(ModelContext.current_context().block_number)
+
+    df_events = list(iter_events_with_range(logger, contract, contract_event, from_block, to_block,
+                                            contract_address, argument_filters, max_workers=max_workers))
+    if len(df_events) == 0:
+        return pd.DataFrame()
+    return pd.concat(df_events, ignore_index=True)
 
 
 @IncrementalModel.describe(slug='contract.events-block-series',
-                           version='0.13',
+                           version='0.14',
                            display_name='Events from contract (non-mainnet)',
                            description='Get the past events from a contract in block series',
                            category='contract',
@@ -117,13 +140,35 @@ def fetch_events_with_range(logger,
                            input=ContractEventsBlockSeriesInput,
                            output=BlockSeries[Records])
 class ContractEventsSeries(IncrementalModel):
+    @staticmethod
+    def process_events(df_events):
+        if df_events.empty:
+            return df_events
+        return (df_events
+                .drop('args', axis=1)
+                .assign(transactionHash=lambda r: r.transactionHash.apply(lambda x: x.hex()),
+                        blockHash=lambda r: r.blockHash.apply(lambda x: x.hex())))
+
     def run(self, input: ContractEventsInput, from_block: BlockNumber) -> BlockSeries[dict]:
         if input.event_abi is not None:
             input_contract = Contract(input.address).set_abi(input.event_abi, set_loaded=True)
         else:
             input_contract = Contract(input.address)
 
-        from_block_number = int(from_block)
+        step_from_block = int(from_block)
+        to_block_number = int(self.context.block_number)
+
+        store = EventStore.from_env()
+        df_stored = pd.DataFrame()
+        if store.enabled:
+            store_key = store.key(self.context.chain_id, input_contract.address,
+                                  input.event_name, input.argument_filters)
+            covered_to = min(store.covered_to(store_key, step_from_block), to_block_number)
+            if covered_to >= step_from_block:
+                df_stored = store.read(store_key, step_from_block, covered_to)
+                step_from_block = covered_to + 1
+
+        from_block_number = step_from_block
         if from_block_number == 0:
             try:
                 deployment = self.context.run_model(
@@ -134,24 +179,32 @@ class ContractEventsSeries(IncrementalModel):
                     return BlockSeries()
                 raise
 
-        df_events = fetch_events_with_range(self.logger,
-                                            input_contract,
-                                            input_contract.events[input.event_name],
-                                            from_block_number,
-                                            int(self.context.block_number),
-                                            input_contract.address.checksum,
-                                            input.argument_filters)
-        self.logger.info(
-            f'[{self.slug}] Finished fetching event {input.event_name} from {from_block_number} '
-            f'to {int(self.context.block_number)} on {datetime.now()}')
+        if from_block_number <= to_block_number:
+            df_events = self.process_events(
+                fetch_events_with_range(self.logger,
+                                        input_contract,
+                                        input_contract.events[input.event_name],
+                                        from_block_number,
+                                        to_block_number,
+                                        input_contract.address.checksum,
+                                        input.argument_filters))
+            self.logger.info(
+                f'[{self.slug}] Finished fetching event {input.event_name} from {from_block_number} '
+                f'to {to_block_number} on {datetime.now()}')
 
-        if df_events.empty:
+            final_block = store.final_block(to_block_number)
+            if store.enabled and final_block >= step_from_block:
+                store.append(store_key, step_from_block, final_block,
+                             df_events.loc[df_events.blockNumber <= final_block]
+                             if not df_events.empty else df_events)
+        else:
+            df_events = pd.DataFrame()
+
+        to_concat = [df for df in [df_stored, df_events] if not df.empty]
+        if len(to_concat) == 0:
             return BlockSeries(series=[])
 
-        df_events = (df_events
-                     .drop('args', axis=1)
-                     .assign(transactionHash=lambda r: r.transactionHash.apply(lambda x: x.hex()),
-                             blockHash=lambda r: r.blockHash.apply(lambda x: x.hex()))
+        df_events = (pd.concat(to_concat, ignore_index=True)
                      .sort_values(['blockNumber', 'transactionIndex', 'logIndex'])
                      .groupby('blockNumber'))
 
@@ -172,7 +225,7 @@ class ContractEventsOutput(DTO):
 
 
 @Model.describe(slug='contract.events',
-                version='0.13',
+                version='0.14',
                 display_name='Events from contract (non-mainnet)',
                 description='Get the past events from a contract',
                 category='contract',
@@ -181,7 +234,36 @@ class ContractEventsOutput(DTO):
                 output=ContractEventsOutput,
                 cache=CachePolicy.SKIP)
 class ContractEvents(Model):
+    def read_from_store(self, store: EventStore, input: ContractEventsInput) -> Optional[pd.DataFrame]:
+        """
+        Read the events from the event store when it covers all blocks up to the current block.
+        A filtered query can also be answered from the unfiltered events.
+        """
+        block_number = int(self.context.block_number)
+        store_keys = [(store.key(self.context.chain_id, input.address, input.event_name, input.argument_filters), None)]
+        if input.argument_filters:
+            store_keys.append((store.key(self.context.chain_id, input.address, input.event_name),
+                               input.argument_filters))
+
+        for store_key, argument_filters in store_keys:
+            if store.covered_to(store_key, 0) >= block_number:
+                df = store.read(store_key,
+                                input.from_block if input.from_block is not None else 0,
+                                block_number,
+                                argument_filters)
+                if df.empty:
+                    return df
+                return (df.sort_values(['blockNumber', 'transactionIndex', 'logIndex'])
+                        .reset_index(drop=True))
+        return None
+
     def run(self, input: ContractEventsInput) -> ContractEventsOutput:
+        store = EventStore.from_env()
+        if store.enabled:
+            df = self.read_from_store(store, input)
+            if df is not None:
+                return ContractEventsOutput(records=Records.from_dataframe(df))
+
         events_series = self.context.run_model(
             'contract.events-block-series',
             input=ContractEventsBlockSeriesInput(
@@ -0,0 +1,247 @@
+# pylint: disable=line-too-long
+
+"""
+Local columnar store for contract events
+"""
+
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import Optional
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+EVENT_STORE_PATH_ENV = 'CREDMARK_EVENT_STORE_PATH'
+EVENT_STORE_CONFIRMATIONS_ENV = 'CREDMARK_EVENT_STORE_CONFIRMATIONS'
+
+# Blocks within this depth of the head can still be reorganised and are not persisted
+DEFAULT_CONFIRMATIONS = 64
+
+# Columns encoded as JSON text in Parquet, e.g. uint256 args that overflow int64
+JSON_COLUMNS_KEY = b'credmark_json_columns'
+
+
+class EventStore:
+    """
+    Parquet files of events partitioned by chain/contract/event/block range.
+
+    Each file is named with the block range it covers ({from_block}-{to_block}.parquet),
+    including ranges without events, so the covered blocks are known without reading data.
+    Only blocks at least `confirmations` deep are persisted, and an appended range is merged
+    into the file that ends right before it, up to MAX_FILE_ROWS rows.
+    """
+
+    MAX_FILE_ROWS = 1_000_000
+
+    # key directory => (directory mtime, ranges), so that a read lists the directory only after it changed
+    RANGES = {}
+    MAX_KEYS = 1000
+
+    def __init__(self, root: Optional[str], confirmations: int = DEFAULT_CONFIRMATIONS):
+        self.root = Path(root) if root else None
+        self.confirmations = confirmations
+
+    @classmethod
+    def from_env(cls):
+        return cls(os.environ.get(EVENT_STORE_PATH_ENV),
+                   int(os.environ.get(EVENT_STORE_CONFIRMATIONS_ENV, DEFAULT_CONFIRMATIONS)))
+
+    @property
+    def enabled(self):
+        return self.root is not None
+
+    def key(self, chain_id: int, address, event_name: str, argument_filters: Optional[dict] = None) -> Path:
+        if self.root is None:
+            raise ValueError(f'Event store is not enabled with {EVENT_STORE_PATH_ENV}')
+        filters_key = 'all'
+        if argument_filters:
+            filters_key = hashlib.sha1(
+                json.dumps(argument_filters, sort_keys=True, default=str).lower().encode()).hexdigest()[:16]
+        return self.root / str(chain_id) / str(address).lower() / event_name / filters_key
+
+    def final_block(self, block_number: int) -> int:
+        """
+        Last block that can be persisted when the chain head is at block_number.
+        """
+        return block_number - self.confirmations
+
+    @classmethod
+    def ranges(cls, key: Path) -> list[tuple[int, int]]:
+        try:
+            mtime = key.stat().st_mtime_ns
+        except FileNotFoundError:
+            return []
+
+        cached = cls.RANGES.get(key)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+
+        # A merged file can be left next to the file it replaced if the run stops in between
+        ranges = []
+        for start, end in sorted((tuple(int(b) for b in f.stem.split('-'))  # type: ignore
+                                  for f in key.glob('*.parquet')),
+                                 key=lambda r: (r[0], -r[1])):
+            if len(ranges) == 0 or end > ranges[-1][1]:
+                ranges.append((start, end))
+        while len(cls.RANGES) >= cls.MAX_KEYS:
+            del cls.RANGES[next(iter(cls.RANGES))]
+        cls.RANGES[key] = (mtime, ranges)
+        return ranges
+
+    def covered_to(self, key: Path, from_block: int) -> int:
+        """
+        Last block of the contiguous coverage from from_block, or from_block - 1 if not covered.
+        """
+        covered = from_block - 1
+        for start, end in self.ranges(key):
+            if start > covered + 1:
+                break
+            covered = max(covered, end)
+        return covered
+
+    def append(self, key: Path, from_block: int, to_block: int, df_events: pd.DataFrame):
+        """
+        Persist the events of [from_block, to_block]. The caller keeps to_block at or below final_block().
+        """
+        key.mkdir(parents=True, exist_ok=True)
+
+        json_columns = [c for c in df_events.columns
+                        if df_events[c].dtype == object and not df_events[c].map(lambda x: isinstance(x, str)).all()]
+        df_encoded = df_events.assign(**{c: df_events[c].map(lambda x: json.dumps(_json_encode(x)))
+                                         for c in json_columns})
+        table = pa.Table.from_pandas(df_encoded, preserve_index=False)
+        table = table.replace_schema_metadata(
+            {**(table.schema.metadata or {}), JSON_COLUMNS_KEY: json.dumps(json_columns).encode()})
+
+        merged = self._merge_previous(key, from_block, table)
+        if merged is not None:
+            previous_path, from_block, table = merged
+        else:
+            previous_path = None
+
+        file_path = key / f'{from_block}-{to_block}.parquet'
+        tmp_path = file_path.with_suffix('.tmp')
+        pq.write_table(table, tmp_path)
+        tmp_path.replace(file_path)
+        if previous_path is not None:
+            previous_path.unlink(missing_ok=True)
+
+    def _merge_previous(self, key: Path, from_block: int, table: pa.Table):
+        """
+        Concatenate the table to the file ending at from_block - 1, when the schemas agree and it stays small.
+        """
+        previous = [(start, end) for start, end in self.ranges(key) if end == from_block - 1]
+        if len(previous) == 0:
+            return None
+
+        start, end = previous[0]
+        previous_path = key / f'{start}-{end}.parquet'
+        previous_table = pq.read_table(previous_path)
+        if previous_table.num_rows + table.num_rows > self.MAX_FILE_ROWS:
+            return None
+
+        if table.num_rows == 0:
+            return previous_path, start, previous_table
+        if previous_table.num_rows == 0:
+            return previous_path, start, table
+
+        previous_json = set(json.loads((previous_table.schema.metadata or {}).get(JSON_COLUMNS_KEY, b'[]')))
+        json_columns = set(json.loads((table.schema.metadata or {}).get(JSON_COLUMNS_KEY, b'[]')))
+        if previous_json != json_columns or not previous_table.schema.equals(table.schema):
+            return None
+
+        return previous_path, start, pa.concat_tables([previous_table, table])
+
+    def read(self, key: Path, from_block: int, to_block: int, argument_filters: Optional[dict] = None) -> pd.DataFrame:
+        """
+        Read events in [from_block, to_block], with the block range and argument filters pushed down to Parquet.
+        """
+        df_files = []
+        for start, end in self.ranges(key):
+            if start > to_block or end < from_block:
+                continue
+            df_file = self._read_file(key / f'{start}-{end}.parquet', from_block, to_block, argument_filters)
+            if not df_file.empty:
+                df_files.append(df_file)
+
+        if len(df_files) == 0:
+            return pd.DataFrame()
+        return pd.concat(df_files, ignore_index=True)
+
+    @staticmethod
+    def _read_file(file_path: Path, from_block: int, to_block: int, argument_filters: Optional[dict]) -> pd.DataFrame:
+        dataset = ds.dataset(file_path, format='parquet')
+        if 'blockNumber' not in dataset.schema.names:
+            return pd.DataFrame()
+        json_columns = set(json.loads((dataset.schema.metadata or {}).get(JSON_COLUMNS_KEY, b'[]')))
+
+        expr = (ds.field('blockNumber') >= from_block) & (ds.field('blockNumber') <= to_block)
+        post_filters = {}
+        for arg, value in (argument_filters or {}).items():
+            values = value if isinstance(value, list) else [value]
+            if arg not in dataset.schema.names:
+                return pd.DataFrame()
+            if arg in json_columns:
+                post_filters[arg] = values
+            elif (pa.types.is_string(dataset.schema.field(arg).type) or
+                  pa.types.is_large_string(dataset.schema.field(arg).type)):
+                # addresses can be in checksum or lower case
+                expr &= pc.utf8_lower(ds.field(arg)).isin(  # pylint: disable=no-member
+                    [str(v).lower() for v in values])
+            else:
+                expr &= ds.field(arg).isin(values)
+
+        df_events = dataset.to_table(filter=expr).to_pandas()
+        for c in json_columns & set(df_events.columns):
+            df_events[c] = df_events[c].map(lambda x: json.loads(x, object_hook=_json_object_hook))
+        for arg, values in post_filters.items():
+            filter_keys = {_filter_key(v) for v in values}
+            df_events = df_events.loc[df_events[arg].map(lambda x, filter_keys=filter_keys: _filter_key(x) in filter_keys)]
+
+        return df_events
+
+
+def _json_encode(value):
+    """
+    Tag bytes and tuples so that they are decoded back to the types of a live read.
+    """
+    if isinstance(value, bytes):
+        return {'__bytes__': value.hex()}
+    if isinstance(value, tuple):
+        return {'__tuple__': [_json_encode(v) for v in value]}
+    if isinstance(value, list):
+        return [_json_encode(v) for v in value]
+    if isinstance(value, dict):
+        return {k: _json_encode(v) for k, v in value.items()}
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    return str(value)
+
+
+def _json_object_hook(obj: dict):
+    if obj.keys() == {'__bytes__'}:
+        return bytes.fromhex(obj['__bytes__'])
+    if obj.keys() == {'__tuple__'}:
+        return tuple(obj['__tuple__'])
+    return obj
+
+
+def _filter_key(value):
+    """
+    Comparable form of an event argument or a filter value: bytes as lower-case hex, int as int.
+    """
+    if isinstance(value, bytes):
+        return '0x' + value.hex()
+    if isinstance(value, str):
+        value = value.lower()
+        if value.isdigit():
+            return int(value)
+        return value
+    if isinstance(value, (tuple, list)):
+        return tuple(_filter_key(v) for v in value)
+    return value
@@ -0,0 +1,156 @@
+# pylint: disable=line-too-long, invalid-name
+
+"""
+Pagination of ledger queries
+"""
+
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+from typing import Any, Iterator, Optional
+
+import pandas as pd
+
+LEDGER_PAGE_SIZE = 5000
+# pages fetched ahead for each window while an earlier window is being consumed
+LEDGER_PAGES_AHEAD = 2
+# seconds a window waits for room in its queue before it checks whether the iteration was closed
+LEDGER_PUT_TIMEOUT = 1
+
+_WINDOW_END = object()
+
+
+def _after_cursor(key_columns: list[tuple[Any, str]], cursor: tuple):
+    """
+    Rows after the cursor in the order of the key columns:
+    k1 > v1 OR (k1 = v1 AND (k2 > v2 OR (k2 = v2 AND ...)))
+    """
+    column, _ = key_columns[0]
+    if len(key_columns) == 1:
+        return column.gt(cursor[0])
+    return (column.gt(cursor[0])
+            .or_(column.eq(cursor[0]).and_(_after_cursor(key_columns[1:], cursor[1:])).parentheses_())
+            .parentheses_())
+
+
+def _iter_window(q, key_columns: list[tuple[Any, str]], from_block: Optional[int], to_block: Optional[int],
+                 where, page_size: int, select_args: dict) -> Iterator[pd.DataFrame]:
+    block_column, _ = key_columns[0]
+    order_by = block_column
+    for column, _ in key_columns[1:]:
+        order_by = order_by.comma_(column)
+
+    bounds = []
+    if from_block is not None:
+        bounds.append(block_column.ge(from_block))
+    if to_block is not None:
+        bounds.append(block_column.le(to_block))
+
+    window = where
+    for bound in bounds:
+        window = bound if window is None else window.parentheses_().and_(bound)
+
+    cursor = None
+    while True:
+        page_where = window
+        if cursor is not None:
+            after_cursor = _after_cursor(key_columns, cursor)
+            page_where = after_cursor if window is None else window.parentheses_().and_(after_cursor)
+        df_page = q.select(where=page_where, order_by=order_by, limit=page_size, **select_args).to_dataframe()
+        if df_page.shape[0] > 0:
+            yield df_page
+        if df_page.shape[0] < page_size:
+            return
+        last_row = df_page.iloc[-1]
+        cursor = tuple(int(last_row[name]) for _, name in key_columns)
+
+
+def _put_page(pages: queue.Queue, stop: threading.Event, item) -> bool:
+    """
+    Put into the window's queue, waiting for room until the iteration is closed
+    """
+    while not stop.is_set():
+        try:
+            pages.put(item, timeout=LEDGER_PUT_TIMEOUT)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def _fill_window(pages: queue.Queue, stop: threading.Event, *window_args):
+    """
+    Page a window into its queue, ending with _WINDOW_END or the exception raised
+    """
+    try:
+        for df_page in _iter_window(*window_args):
+            if not _put_page(pages, stop, df_page):
+                return
+    except Exception as err:  # pylint: disable=broad-exception-caught
+        _put_page(pages, stop, err)
+        return
+    _put_page(pages, stop, _WINDOW_END)
+
+
+def iter_ledger_pages(q,
+                      key_columns: list[tuple[Any, str]],
+                      where=None,
+                      from_block: Optional[int] = None,
+                      to_block: Optional[int] = None,
+                      max_workers: int = 4,
+                      page_size: int = LEDGER_PAGE_SIZE,
+                      **select_args) -> Iterator[pd.DataFrame]:
+    """
+    Select from a ledger query q in pages, yielding the DataFrames in the order of the key columns.
+
+    key_columns are (column, name in the result) that identify a row, block number first,
+    e.g. [(q.BLOCK_NUMBER, 'block_number'), (q.LOG_INDEX, 'log_index')]. Pages continue after
+    the key of the last row (instead of an offset), and the block range is cut into max_workers
+    windows that are paged concurrently. Each page is yielded as it arrives, with at most
+    LEDGER_PAGES_AHEAD pages held for each later window. Without from_block/to_block, the range is that of the rows.
+    Key columns that are not in the selected columns are selected for the cursor and dropped
+    from the result.
+    """
+    extra_names = []
+    if 'columns' in select_args:
+        selected = {str(column) for column in select_args['columns']}
+        extra_keys = [(column, name) for column, name in key_columns if str(column) not in selected]
+        select_args = select_args | {'columns': list(select_args['columns']) + [column for column, _ in extra_keys]}
+        extra_names = [name for _, name in extra_keys]
+
+    if max_workers == 1:
+        for df_page in _iter_window(q, key_columns, from_block, to_block, where, page_size, select_args):
+            yield df_page.drop(columns=extra_names)
+        return
+
+    block_column, _ = key_columns[0]
+    if from_block is None or to_block is None:
+        df_range = q.select(aggregates=[(f'MIN({block_column})', 'min_block'), (f'MAX({block_column})', 'max_block')],
+                            where=where,
+                            **{k: v for k, v in select_args.items() if k == 'joins'}).to_dataframe()
+        if df_range.empty or pd.isna(df_range.min_block[0]):
+            return
+        from_block = int(df_range.min_block[0]) if from_block is None else from_block
+        to_block = int(df_range.max_block[0]) if to_block is None else to_block
+
+    window_size = max(1, (to_block - from_block + 1 + max_workers - 1) // max_workers)
+    windows = [(start, min(start + window_size - 1, to_block))
+               for start in range(from_block, to_block + 1, window_size)]
+
+    window_pages = [queue.Queue(maxsize=LEDGER_PAGES_AHEAD) for _ in windows]
+    stop = threading.Event()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for pages, (start, end) in zip(window_pages, windows):
+            executor.submit(copy_context().run, _fill_window,
+                            pages, stop, q, key_columns, start, end, where, page_size, select_args)
+        try:
+            for pages in window_pages:
+                item = pages.get()
+                while item is not _WINDOW_END:
+                    if isinstance(item, Exception):
+                        raise item
+                    yield item.drop(columns=extra_names)
+                    item = pages.get()
+        finally:
+            stop.set()
@@ -1,11 +1,13 @@
 # pylint: disable=line-too-long
-from typing import List, Optional
+from typing import Iterator, List, Optional
 
 import pandas as pd
 from credmark.cmf.model import Model
 from credmark.cmf.types import Account, Accounts, Address, NativeToken, Records
 from credmark.dto import DTO, DTOField, cross_examples
 
+from models.credmark.ledger.pagination import iter_ledger_pages
+
 
 class Tokens(DTO):
     tokens: List[Address] = DTOField([], description='List of tokens')
@@ -117,6 +119,27 @@ def get_token_transfer(_context,
     return result
 
 
+def iter_token_transfer_pages(_context,
+                              _accounts: List[Address],
+                              start_block: int = 0) -> Iterator[pd.DataFrame]:
+    """
+    ERC-20 transfers of the accounts from the ledger, one page at a time in the order of
+    (block_number, log_index), with the value signed as received (+) or sent (-) by the accounts.
+    A transfer between two of the accounts has the value of 0.
+    """
+    with _context.ledger.TokenTransfer as q:
+        for df_page in iter_ledger_pages(
+                q, [(q.BLOCK_NUMBER, 'block_number'), (q.LOG_INDEX, 'log_index')],
+                where=(q.TO_ADDRESS.in_(_accounts).or_(q.FROM_ADDRESS.in_(_accounts))
+                       ).parentheses_().and_(q.BLOCK_NUMBER.ge(start_block)),
+                columns=[q.BLOCK_NUMBER, q.LOG_INDEX, q.TOKEN_ADDRESS],
+                aggregates=[((f'(CASE WHEN {q.TO_ADDRESS.in_(_accounts)} THEN {q.RAW_AMOUNT} ELSE 0 END) - '
+                              f'(CASE WHEN {q.FROM_ADDRESS.in_(_accounts)} THEN {q.RAW_AMOUNT} ELSE 0 END)'),
+                             'value')],
+                bigint_cols=[q.BLOCK_NUMBER]):
+            yield fix_transfer(df_page.assign(block_number=lambda x: x.block_number.apply(int)))
+
+
 def get_native_transfer(_context,
                         _accounts: List[Address],
                         fix_int: bool = True,
@@ -131,25 +154,14 @@ def get_native_transfer(_context,
 
         with _context.ledger.Transaction as q:
             for _address in _accounts:
-                offset = 0
-                while True:
-                    rs_tt = (q.select(
-                        columns=transfer_cols,
-                        aggregates=[((f'CASE WHEN {q.TO_ADDRESS.eq(_address)} '
-                                    f'THEN {q.VALUE} ELSE {q.VALUE.neg_()} END'), 'value'),
-                                    (q.field(native_token_addr).squote(), 'token_address')],
-                        where=(q.TO_ADDRESS.eq(_address).or_(q.FROM_ADDRESS.eq(_address))
-                               ).parentheses_().and_(q.field('value').dquote().ne(0)),
-                        order_by=q.BLOCK_NUMBER.comma_(q.TRANSACTION_INDEX),
-                        offset=offset))
-
-                    df_tt = rs_tt.to_dataframe()
-
-                    if df_tt.shape[0] > 0:
-                        df_ts.append(df_tt)
-                    if df_tt.shape[0] < 5000:
-                        break
-                    offset += 5000
+                df_ts.extend(iter_ledger_pages(
+                    q, [(q.BLOCK_NUMBER, 'block_number'), (q.TRANSACTION_INDEX, 'transaction_index')],
+                    where=(q.TO_ADDRESS.eq(_address).or_(q.FROM_ADDRESS.eq(_address))
+                           ).parentheses_().and_(q.field('value').dquote().ne(0)),
+                    columns=transfer_cols,
+                    aggregates=[((f'CASE WHEN {q.TO_ADDRESS.eq(_address)} '
+                                  f'THEN {q.VALUE} ELSE {q.VALUE.neg_()} END'), 'value'),
+                                (q.field(native_token_addr).squote(), 'token_address')]))
 
             return (pd.concat(df_ts)
                     .assign(block_number=lambda x: x.block_number.apply(int))
@@ -33,6 +33,7 @@ from models.dtos.price import (
     PriceInput,
     PriceInputWithPreference,
     PriceMultipleInput,
+    PricesBlocksInput,
     PricesHistoricalInput,
     PriceSource,
 )
@@ -56,6 +57,20 @@ credmark-dev run price.dex-db -i '{"address": "0x7b0c54eaaaa1ead551d053d6c4c5f95
 """
 
 
+def distinct_price_inputs(inputs: List[PriceInputWithPreference]) -> Tuple[List[PriceInputWithPreference], List[int]]:
+    """
+    The distinct inputs by (base, quote, prefer, try_other_chains), and the position of each input in them
+    """
+    distinct = {}
+    positions = []
+    for m in inputs:
+        key = (m.base.address, m.quote.address, m.prefer, m.try_other_chains)
+        if key not in distinct:
+            distinct[key] = (len(distinct), m)
+        positions.append(distinct[key][0])
+    return [m for _, m in distinct.values()], positions
+
+
 @Model.describe(slug='price.quote-historical-multiple',
                 version='1.12',
                 display_name='Token Price - Quoted - Historical',
@@ -120,7 +135,7 @@ class PriceQuoteHistorical(Model):
 
 
 @Model.describe(slug='price.quote-multiple-maybe',
-                version='0.6',
+                version='0.7',
                 display_name='Token Price - Quoted',
                 description='Credmark Supported Price Algorithms',
                 developer='Credmark',
@@ -133,10 +148,10 @@ class PriceQuoteMultipleMaybe(Model):
     def run(self, input: Some[PriceInputWithPreference]) -> Some[Maybe[PriceWithQuote]]:
         price_slug = 'price.quote-maybe'
 
-        def _use_compose():
+        def _use_compose(inputs):
             token_prices_run = self.context.run_model(
                 slug='compose.map-inputs',
-                input={'modelSlug': price_slug, 'modelInputs': input.some},
+                input={'modelSlug': price_slug, 'modelInputs': inputs},
                 return_type=MapInputsOutput[PriceInputWithPreference, Maybe[PriceWithQuote]])
 
             prices = []
@@ -150,18 +165,23 @@ class PriceQuoteMultipleMaybe(Model):
                     raise ModelRunError(
                         'compose.map-inputs: output/error cannot be both None')
 
-            return Some[Maybe[PriceWithQuote]](some=prices)
+            return prices
 
         def _use_for():
             prices = [self.context.run_model(price_slug, input=m, return_type=Maybe[PriceWithQuote])
                       for m in input]
             return Some[Maybe[PriceWithQuote]](some=prices)
 
-        return _use_for()
+        def _use_compose_distinct():
+            distinct_inputs, positions = distinct_price_inputs(input.some)
+            distinct_prices = _use_compose(distinct_inputs)
+            return Some[Maybe[PriceWithQuote]](some=[distinct_prices[n] for n in positions])
+
+        return _use_compose_distinct()
 
 
 @Model.describe(slug='price.multiple-maybe',
-                version='0.5',
+                version='0.6',
                 display_name='Token Price - Quoted',
                 description='Credmark Supported Price Algorithms',
                 developer='Credmark',
@@ -174,10 +194,10 @@ class PriceMultipleMaybeWithSlug(Model):
     def run(self, input: PriceMultipleInput) -> Some[Maybe[PriceWithQuote]]:
         price_slug = input.slug
 
-        def _use_compose():
+        def _use_compose(inputs):
             token_prices_run = self.context.run_model(
                 slug='compose.map-inputs',
-                input={'modelSlug': price_slug, 'modelInputs': input.some},
+                input={'modelSlug': price_slug, 'modelInputs': inputs},
                 return_type=MapInputsOutput[PriceInputWithPreference, Maybe[PriceWithQuote]])
 
             prices = []
@@ -191,7 +211,7 @@ class PriceMultipleMaybeWithSlug(Model):
                     raise ModelRunError(
                         'compose.map-inputs: output/error cannot be both None')
 
-            return Some[Maybe[PriceWithQuote]](some=prices)
+            return prices
 
         def _use_for():
             prices = [
@@ -202,11 +222,16 @@ class PriceMultipleMaybeWithSlug(Model):
                 for m in input.some]
             return Some[Maybe[PriceWithQuote]](some=prices)
 
-        return _use_compose()
+        def _use_compose_distinct():
+            distinct_inputs, positions = distinct_price_inputs(input.some)
+            distinct_prices = _use_compose(distinct_inputs)
+            return Some[Maybe[PriceWithQuote]](some=[distinct_prices[n] for n in positions])
+
+        return _use_compose_distinct()
 
 
 @Model.describe(slug='price.quote-multiple',
-                version='1.14',
+                version='1.15',
                 display_name='Token Price - Quoted',
                 description='Credmark Supported Price Algorithms',
                 developer='Credmark',
@@ -219,10 +244,10 @@ class PriceQuoteMultiple(Model):
     def run(self, input: Some[PriceInputWithPreference]) -> Some[PriceWithQuote]:
         price_slug = 'price.quote'
 
-        def _use_compose():
+        def _use_compose(inputs):
             token_prices_run = self.context.run_model(
                 slug='compose.map-inputs',
-                input={'modelSlug': price_slug, 'modelInputs': input.some},
+                input={'modelSlug': price_slug, 'modelInputs': inputs},
                 return_type=MapInputsOutput[PriceInputWithPreference, PriceWithQuote])
 
             prices = []
@@ -236,14 +261,73 @@ class PriceQuoteMultiple(Model):
                     raise ModelRunError(
                         'compose.map-inputs: output/error cannot be both None')
 
-            return Some[PriceWithQuote](some=prices)
+            return prices
 
         def _use_for():
             prices = [self.context.run_model(price_slug, input=m, return_type=PriceWithQuote)
                       for m in input]
             return Some[PriceWithQuote](some=prices)
 
-        return _use_for()
+        def _use_compose_distinct():
+            distinct_inputs, positions = distinct_price_inputs(input.some)
+            distinct_prices = _use_compose(distinct_inputs)
+            return Some[PriceWithQuote](some=[distinct_prices[n] for n in positions])
+
+        return _use_compose_distinct()
+
+
+@Model.describe(slug='price.quote-multiple-blocks-maybe',
+                version='0.2',
+                display_name='Token Price - Quoted - Multiple blocks',
+                description='Price a list of base/quote/block inputs',
+                developer='Credmark',
+                category='protocol',
+                tags=['token', 'price'],
+                input=PricesBlocksInput,
+                output=Some[Maybe[PriceWithQuote]],
+                errors=PRICE_DATA_ERROR_DESC)
+class PriceQuoteMultipleBlocksMaybe(Model):
+    """
+    The inputs are grouped by (base, quote, prefer, try_other_chains) with the distinct blocks of
+    each, and the groups run in parallel with price.quote-maybe-blocks, which runs the blocks of
+    a group in parallel.
+    """
+
+    def run(self, input: PricesBlocksInput) -> Some[Maybe[PriceWithQuote]]:
+        current_block = int(self.context.block_number)
+        block_numbers = [current_block if m.block_number is None else m.block_number for m in input.some]
+        if len(block_numbers) > 0 and max(block_numbers) > current_block:
+            raise ModelRunError(f'Request block number ({max(block_numbers)}) is '
+                                f'larger than current block number {current_block}')
+
+        distinct_inputs, positions = distinct_price_inputs(input.some)
+        groups = [PriceBlocksInput(base=m.base,
+                                   quote=m.quote,
+                                   prefer=m.prefer,
+                                   try_other_chains=m.try_other_chains,
+                                   block_numbers=[])
+                  for m in distinct_inputs]
+        for n, block_number in zip(positions, block_numbers):
+            if block_number not in groups[n].block_numbers:
+                groups[n].block_numbers.append(block_number)
+
+        groups_run = self.context.run_model(
+            slug='compose.map-inputs',
+            input={'modelSlug': 'price.quote-maybe-blocks', 'modelInputs': groups},
+            return_type=MapInputsOutput[PriceBlocksInput, MapBlocksOutput[Maybe[PriceWithQuote]]])
+
+        group_prices = []
+        for p in groups_run:
+            if p.output is None:
+                if p.error is not None:
+                    self.logger.error(p.error)
+                    raise create_instance_from_error_dict(p.error.dict())
+                raise ModelRunError('compose.map-inputs: output/error cannot be both None')
+            group_prices.append({r.blockNumber: r.output if r.output is not None else Maybe[PriceWithQuote].none()
+                                 for r in p.output.results})
+
+        return Some[Maybe[PriceWithQuote]](some=[group_prices[n][block_number]
+                                                 for n, block_number in zip(positions, block_numbers)])
 
 
 @Model.describe(slug='price.quote-maybe-blocks',
@@ -1,4 +1,4 @@
-# pylint: disable=line-too-long, pointless-string-statement
+# pylint: disable=line-too-long
 
 
 from credmark.cmf.model import Model
@@ -15,7 +15,7 @@ from models.dtos.price import (
 
 # credmark-dev run dex.ring0-tokens -b 17_100_000 -i '{"protocol": "uniswap-v3"}' -j
 
-RING_MODEL_VERSION = '0.4'
+RING_MODEL_VERSION = '0.5'
 
 
 @Model.describe(slug='dex.ring0-tokens',
@@ -144,51 +144,81 @@ class DexSecondaryTokens(Model):
                 input=PrimaryTokenPairsInput,
                 output=PrimaryTokenPairsOutput)
 class PrimaryTokenPairs(Model):
-    def run(self, input: PrimaryTokenPairsInput) -> PrimaryTokenPairsOutput:
-        input_addresses = input.addresses
+    """
+    The candidate pairs of a token are formed with the primary tokens in use for it:
+    1. In ring0 => all pair without self.
+    2. In ring1+ => add tokens in ring0 and ring1 before
+       e.g. When ring1+ has [wbtc, wbtc2] => for wbtc, add weth; for wbtc2, add weth and wbtc2.
+    3. _ => include all ring0 and ring1+
+
+    Primary tokens and the pairs of each token are kept for buckets of CANDIDATES_BUCKET_BLOCKS blocks,
+    so they are formed once for the many pool lookups in a bucket. The ring tokens of a bucket are those
+    at its first block. Which of these pairs have pools is kept in FactoryPoolIndex.
+    """
+
+    # (chain id, protocol, first block of the bucket) => primary tokens and pairs by token, for the latest buckets
+    CANDIDATES: dict[tuple[int, DexProtocol, int], dict] = {}
+    CANDIDATES_BUCKET_BLOCKS = 1000
+    CANDIDATES_MAX_BUCKETS = 16
+
+    def get_candidates(self, protocol: DexProtocol) -> dict:
+        block_number = int(self.context.block_number)
+        bucket_block = block_number - block_number % self.CANDIDATES_BUCKET_BLOCKS
+        key = (self.context.chain_id, protocol, bucket_block)
+        if key in self.CANDIDATES:
+            return self.CANDIDATES[key]
+
         ring0_tokens = self.context.run_model(
-            'dex.ring0-tokens', DexProtocolInput(protocol=input.protocol),
-            return_type=Some[Address], local=True).some
-        primary_tokens_ring0 = ring0_tokens.copy()
+            'dex.ring0-tokens', DexProtocolInput(protocol=protocol),
+            return_type=Some[Address], local=True, block_number=bucket_block).some
 
-        # _wbtc_address = Token('WBTC').address
         ring1_tokens_with_serial = (self.context.run_model(
-            'dex.ring1-tokens', DexProtocolInput(protocol=input.protocol),
-            return_type=Some[AddressWithSerial], local=True)
+            'dex.ring1-tokens', DexProtocolInput(protocol=protocol),
+            return_type=Some[AddressWithSerial], local=True, block_number=bucket_block)
             .sorted(key=lambda t: t.serial))
         ring1_tokens = [t.address for t in ring1_tokens_with_serial]
 
-        primary_tokens_ring1 = primary_tokens_ring0.copy()
-        primary_tokens_ring1.extend(ring1_tokens)
-
-        primary_tokens_ring1_step = {}
-        for step in range(len(ring1_tokens)):
-            primary_tokens_ring1_step[step] = primary_tokens_ring0.copy()
-            primary_tokens_ring1_step[step].extend(ring1_tokens[:step])
-
-        """
-        TODO:
-        # 1. In ring0 => all pair without self.
-        # 2. In ring1+ => add tokens in ring0 and ring1 before
-        # e.g. When ring1+ has [wbtc, wbtc2] => for wbtc, add weth; for wbtc2, add weth and wbtc2.
-        # 3. _ => include all ring0 and ring1+
-        """
-        token_pairs: list[tuple[Address, Address]] = []
+        while len(self.CANDIDATES) >= self.CANDIDATES_MAX_BUCKETS:
+            del self.CANDIDATES[next(iter(self.CANDIDATES))]
+        self.CANDIDATES[key] = {
+            'ring0_tokens': ring0_tokens,
+            'ring1_tokens': ring1_tokens,
+            # ring0 tokens followed by ring1 tokens, a token uses a prefix of it
+            'primary_tokens': ring0_tokens + ring1_tokens,
+            'pairs': {},
+        }
+        return self.CANDIDATES[key]
+
+    @staticmethod
+    def token_pairs(candidates: dict, input_address: Address) -> list[tuple[Address, Address]]:
+        if input_address in candidates['pairs']:
+            return candidates['pairs'][input_address]
+
+        ring0_tokens = candidates['ring0_tokens']
+        ring1_tokens = candidates['ring1_tokens']
+        n_primary_tokens = len(candidates['primary_tokens'])
+        if input_address in ring0_tokens:
+            n_primary_tokens = len(ring0_tokens)
+        elif input_address in ring1_tokens:
+            n_primary_tokens = len(ring0_tokens) + ring1_tokens.index(input_address)
+
+        token_pairs = []
+        for token_address in candidates['primary_tokens'][:n_primary_tokens]:
+            if token_address == input_address:
+                continue
+            if input_address.to_int() < token_address.to_int():
+                token_pairs.append((input_address, token_address))
+            else:
+                token_pairs.append((token_address, input_address))
+
+        candidates['pairs'][input_address] = token_pairs
+        return token_pairs
 
-        for input_address in input_addresses:
-            primary_tokens_in_use = primary_tokens_ring0
-            if input_address not in ring0_tokens:
-                if input_address not in ring1_tokens:
-                    primary_tokens_in_use = primary_tokens_ring1
-                else:
-                    primary_tokens_in_use = primary_tokens_ring1_step[ring1_tokens.index(input_address)]
-
-            for token_address in primary_tokens_in_use:
-                if token_address == input_address:
-                    continue
-                if input_address.to_int() < token_address.to_int():
-                    token_pairs.append((input_address, token_address))
-                else:
-                    token_pairs.append((token_address, input_address))
+    def run(self, input: PrimaryTokenPairsInput) -> PrimaryTokenPairsOutput:
+        candidates = self.get_candidates(input.protocol)
+
+        token_pairs: list[tuple[Address, Address]] = []
+        for input_address in input.addresses:
+            token_pairs.extend(self.token_pairs(candidates, input_address))
 
         return PrimaryTokenPairsOutput(pairs=token_pairs)
@@ -4,6 +4,7 @@ from math import floor
 from typing import Dict, Optional
 
 import matplotlib.pyplot as plt
+import numpy as np
 import pandas as pd
 from credmark.cmf.model import Model
 from credmark.cmf.model.errors import ModelRunError
@@ -16,6 +17,7 @@ from models.credmark.protocols.dexes.uniswap.univ3_math import (
     UNISWAP_V3_MAX_TICK,
     UNISWAP_V3_MIN_TICK,
     tick_to_price,
+    tick_to_price_array,
 )
 
 
@@ -46,36 +48,81 @@ class UniswapV3PoolLiquidityByTicksOutput(DTO):
 
 
 @Model.describe(slug='uniswap-v3.get-liquidity-by-ticks',
-                version='0.3',
+                version='0.4',
                 display_name='Uniswap v3 - Liquidity',
-                description='Liquidity at every range - restored from Mint/Burn events',
+                description='Liquidity at every range - from the initialized ticks in tickBitmap',
                 category='protocol',
                 subcategory='uniswap-v3',
                 input=UniswapV3PoolLiquidityByTicksInput,
                 output=UniswapV3PoolLiquidityByTicksOutput)
 class UniswapV3LiquidityHistorical(Model):
+    # tickBitmap words by (chain id, pool, block), for the latest MAX_KEYS (pool, block)
+    TICK_BITMAP_CACHE: dict[tuple[int, Address, int], dict[int, int]] = {}
+    MAX_KEYS = 256
+
+    def get_tick_bitmap(self, pool_contract, min_word, max_word) -> dict[int, int]:
+        cache_key = (self.context.chain_id, pool_contract.address, int(self.context.block_number))
+        if cache_key not in self.TICK_BITMAP_CACHE:
+            while len(self.TICK_BITMAP_CACHE) >= self.MAX_KEYS:
+                del self.TICK_BITMAP_CACHE[next(iter(self.TICK_BITMAP_CACHE))]
+            self.TICK_BITMAP_CACHE[cache_key] = {}
+        words = self.TICK_BITMAP_CACHE[cache_key]
+
+        missing_words = [word_pos for word_pos in range(min_word, max_word + 1)
+                         if word_pos not in words]
+        if len(missing_words) > 0:
+            words_result = self.context.web3_batch.call(
+                [pool_contract.functions.tickBitmap(word_pos) for word_pos in missing_words],
+                unwrap=True)
+            words.update(zip(missing_words, words_result))
+
+        return {word_pos: words[word_pos] for word_pos in range(min_word, max_word + 1)}
+
+    def initialized_ticks(self, pool_contract, min_tick, max_tick, tick_spacing) -> list[int]:
+        """
+        Initialized ticks in [min_tick, max_tick] from the words of tickBitmap,
+        each bit for a compressed tick (tick // tick_spacing).
+        """
+        min_compressed = -(-min_tick // tick_spacing)
+        max_compressed = max_tick // tick_spacing
+        if min_compressed > max_compressed:
+            return []
+
+        words = self.get_tick_bitmap(pool_contract, min_compressed >> 8, max_compressed >> 8)
+
+        ticks = []
+        for word_pos, word in words.items():
+            while word:
+                bit_pos = (word & -word).bit_length() - 1
+                compressed = (word_pos << 8) + bit_pos
+                if min_compressed <= compressed <= max_compressed:
+                    ticks.append(compressed * tick_spacing)
+                word &= word - 1
+        return ticks
+
     def collect_ticks(self, pool_contract, min_tick, max_tick, tick_bottom, tick_spacing):
-        ticks_b = []
-        ticks_b_calls = []
-
-        x = 0
-        tick_b = tick_bottom
-        while tick_b >= min_tick:
-            ticks_b_calls.append(pool_contract.functions.ticks(tick_b))
-            ticks_b.append(tick_b)
-            x += 1
-            tick_b = tick_bottom - tick_spacing * x
-
-        x = 1
-        tick_b = tick_bottom + tick_spacing
-        while tick_b <= max_tick:
-            ticks_b_calls.append(pool_contract.functions.ticks(tick_b))
-            ticks_b.append(tick_b)
-            x += 1
-            tick_b = tick_bottom + tick_spacing * x
+        if 'tickBitmap' in pool_contract.abi.functions:
+            ticks_b = self.initialized_ticks(pool_contract, min_tick, max_tick, tick_spacing)
+        else:
+            ticks_b = []
+
+            x = 0
+            tick_b = tick_bottom
+            while tick_b >= min_tick:
+                ticks_b.append(tick_b)
+                x += 1
+                tick_b = tick_bottom - tick_spacing * x
+
+            x = 1
+            tick_b = tick_bottom + tick_spacing
+            while tick_b <= max_tick:
+                ticks_b.append(tick_b)
+                x += 1
+                tick_b = tick_bottom + tick_spacing * x
 
         batch = self.context.web3_batch
-        ticks_b_result = batch.call(ticks_b_calls, unwrap=True)
+        ticks_b_result = batch.call([pool_contract.functions.ticks(tick_b) for tick_b in ticks_b],
+                                    unwrap=True)
         ticks_b_dict = dict(zip(ticks_b, ticks_b_result))
         return ticks_b_dict
 
@@ -116,11 +163,9 @@ class UniswapV3LiquidityHistorical(Model):
         ticks_dict = self.collect_ticks(pool_contract, min_tick,
                                         max_tick, tick_bottom, tick_spacing)
 
+        # Only ticks with liquidity change (initialized) are collected
         liquidity = current_liquidity
-        x = 0
-        tick_b = tick_bottom
-        while tick_b >= min_tick:
-            # Replaced: ticks = pool_contract.functions.ticks(tick_b).call()
+        for tick_b in sorted((t for t in ticks_dict if t <= tick_bottom), reverse=True):
             ticks = ticks_dict[tick_b]
             if ticks[1] != 0:
                 change_on_tick[tick_b] = ticks[1]
@@ -128,18 +173,13 @@ class UniswapV3LiquidityHistorical(Model):
                 liquidity_on_tick[tick_b] = liquidity
             if ticks[0] != 0:
                 liquidity_pos_on_tick[tick_b] = ticks[0]
-            x += 1
-            tick_b = tick_bottom - tick_spacing * x
 
         liquidity_on_tick = dict(sorted(liquidity_on_tick.items()))
         change_on_tick = dict(sorted(change_on_tick.items()))
         liquidity_pos_on_tick = dict(sorted(liquidity_pos_on_tick.items()))
 
         liquidity = current_liquidity
-        x = 1
-        tick_b = tick_bottom + tick_spacing
-        while tick_b <= max_tick:
-            # Replaced: ticks = pool_contract.functions.ticks(tick_b).call()
+        for tick_b in sorted(t for t in ticks_dict if t > tick_bottom):
             ticks = ticks_dict[tick_b]
             if ticks[1] != 0:
                 change_on_tick[tick_b] = ticks[1]
@@ -147,8 +187,6 @@ class UniswapV3LiquidityHistorical(Model):
                 liquidity_on_tick[tick_b] = liquidity
             if ticks[0] != 0:
                 liquidity_pos_on_tick[tick_b] = ticks[0]
-            x += 1
-            tick_b = tick_bottom + tick_spacing * x
 
         return UniswapV3PoolLiquidityByTicksOutput(
             liquidity=liquidity_on_tick,
@@ -200,6 +238,15 @@ def plot_liquidity(context,
 
 
 # pylint:disable=too-many-arguments
+def int_column(values):
+    """
+    Integer column as pandas would infer from Python ints: int64 when all values fit.
+    """
+    if len(values) > 0 and (np.abs(values) < 2 ** 63).all():
+        return np.asarray(values).astype(np.int64)
+    return [int(v) for v in values]
+
+
 def get_amount_in_ticks(logger,
                         pool_contract: 'Contract',
                         token0: 'Token',
@@ -278,10 +325,6 @@ def get_amount_in_ticks(logger,
         current_tick / tick_spacing) * tick_spacing
     current_price = tick_to_price(current_tick)
 
-    liquidity = 0
-
-    token_amounts = []
-
     min_tick = (min_tick
                 if len(change_on_tick.keys()) == 0
                 else min(change_on_tick.keys()))
@@ -289,39 +332,37 @@ def get_amount_in_ticks(logger,
                 if len(change_on_tick.keys()) == 0
                 else max(change_on_tick.keys()))
 
-    for tick in range(min_tick, max_tick, tick_spacing):
-        liquidity += change_on_tick.get(tick, 0)
-
-        tick_bottom = tick
-        tick_top = tick_bottom + tick_spacing
-
-        sa = tick_to_price(tick_bottom // 2)
-        sb = tick_to_price(tick_top // 2)
-
-        # Compute the amounts of tokens potentially in the range
-        amount1 = int(liquidity * (sb - sa))
-        amount0 = int(amount1 / (sb * sa))
-
-        if tick < current_range_bottom_tick:
-            token_amounts.append((tick, amount0, amount1, liquidity))
-        elif tick == current_range_bottom_tick:
-            # Print the real amounts of the two assets needed to be swapped to move out of the current tick range
-            sp = tick_to_price(current_tick / 2)
-            amount0 = int(liquidity * (sb - sp) / (sp * sb))
-            amount1 = int(liquidity * (sp - sa))
-
-            token_amounts.append((tick, amount0, amount1, liquidity))
+    # All ticks are computed together: liquidity is the running sum of the changes on ticks.
+    ticks = np.arange(min_tick, max_tick, tick_spacing, dtype=np.int64)
+    changes = np.zeros(ticks.shape[0], dtype=object)
+    for tick, change in change_on_tick.items():
+        pos = (tick - min_tick) // tick_spacing
+        if 0 <= pos < ticks.shape[0] and ticks[pos] == tick:
+            changes[pos] = change
+    liquidity = np.cumsum(changes) if ticks.shape[0] > 0 else changes
+    liquidity_float = liquidity.astype(np.float64)
+
+    sa = tick_to_price_array(ticks // 2)
+    sb = tick_to_price_array((ticks + tick_spacing) // 2)
+
+    # Compute the amounts of tokens potentially in the range
+    amount1 = np.trunc(liquidity_float * (sb - sa))
+    amount0 = np.trunc(amount1 / (sb * sa))
+
+    current_range = ticks == current_range_bottom_tick
+    if current_range.any():
+        # Print the real amounts of the two assets needed to be swapped to move out of the current tick range
+        sp = tick_to_price(current_tick / 2)
+        amount0[current_range] = np.trunc(liquidity_float[current_range] * (sb[current_range] - sp) / (sp * sb[current_range]))
+        amount1[current_range] = np.trunc(liquidity_float[current_range] * (sp - sa[current_range]))
+        logger.info(
+            f"{amount0[current_range][0]:.2f} {token0} and {amount1[current_range][0]:.2f} {token1} remaining in the current tick range")
+
+    if should_print_tick:
+        for adjusted_amount0, adjusted_amount1 in zip(amount0[ticks > current_range_bottom_tick] / (10 ** decimals0),
+                                                      amount1[ticks > current_range_bottom_tick] / (10 ** decimals1)):
             logger.info(
-                f"{amount0:.2f} {token0} and {amount1:.2f} {token1} remaining in the current tick range")
-        else:
-            token_amounts.append((tick, amount0, amount1, liquidity))
-            if should_print_tick:
-                adjusted_amount0 = amount0 / (10 ** decimals0)
-                adjusted_amount1 = amount1 / (10 ** decimals1)
-                logger.info(
-                    f"{adjusted_amount0:.2f} {token0} locked, potentially worth {adjusted_amount1:.2f} {token1}")
-
-        tick += tick_spacing
+                f"{adjusted_amount0:.2f} {token0} locked, potentially worth {adjusted_amount1:.2f} {token1}")
 
     token0_bal = token0.balance_of(pool_contract.address.checksum)
     token1_bal = token1.balance_of(pool_contract.address.checksum)
@@ -330,8 +371,10 @@ def get_amount_in_ticks(logger,
 
     df_pool = (
         pd.DataFrame(
-            token_amounts,
-            columns=['tick', 'token0', 'token1', 'liquidity'])
+            {'tick': ticks,
+             'token0': int_column(amount0),
+             'token1': int_column(amount1),
+             'liquidity': int_column(liquidity)})
         .assign(token0_locked=lambda x: x.token0,
                 token1_locked=lambda x: x.token1)
         .assign(token0_locked=lambda x, t=current_range_bottom_tick: x.token0_locked.where(x.tick >= t, 0),
@@ -349,7 +392,7 @@ def get_amount_in_ticks(logger,
 
 
 @Model.describe(slug='uniswap-v3.get-amount-in-ticks',
-                version='0.1',
+                version='0.2',
                 display_name='Uniswap v3 - Liquidity',
                 description='Liquidity at every range - restored from Mint/Burn events',
                 category='protocol',
@@ -0,0 +1,122 @@
+# pylint: disable=line-too-long
+
+"""
+Local store for pool state checkpoints
+"""
+
+import io
+import json
+import os
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+
+POOL_CHECKPOINT_PATH_ENV = 'CREDMARK_POOL_CHECKPOINT_PATH'
+
+# Bump when the content of a checkpoint changes; checkpoints of other versions are ignored.
+POOL_CHECKPOINT_VERSION = 1
+
+UINT64_MASK = 2 ** 64 - 1
+
+
+def split_int128(values) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Python ints in [-2^127, 2^127) as signed high and unsigned low 64-bit words
+    """
+    values = [int(v) for v in values]
+    if any(not -2 ** 127 <= v < 2 ** 127 for v in values):
+        raise ValueError('Value out of the int128 range')
+    return (np.array([v >> 64 for v in values], dtype=np.int64),
+            np.array([v & UINT64_MASK for v in values], dtype=np.uint64))
+
+
+def join_int128(high: np.ndarray, low: np.ndarray) -> np.ndarray:
+    values = np.empty(high.shape[0], dtype=object)
+    values[:] = [(int(h) << 64) | int(lo) for h, lo in zip(high, low)]
+    return values
+
+
+class PoolCheckpointStore:
+    """
+    Snapshots of pool state by chain/protocol/pool, one .npz file per checkpoint
+    named with the event it was taken after ({block_number}-{log_index}.npz).
+
+    The scalar state is kept as JSON, and arrays (e.g. the tick table) are kept as columns
+    with the big integers split into 64-bit words.
+    """
+
+    def __init__(self, root: Optional[str]):
+        self.root = Path(root) if root else None
+
+    @classmethod
+    def from_env(cls):
+        return cls(os.environ.get(POOL_CHECKPOINT_PATH_ENV))
+
+    @property
+    def enabled(self):
+        return self.root is not None
+
+    def key(self, chain_id: int, protocol: str, pool_address) -> Path:
+        if self.root is None:
+            raise ValueError(f'Pool checkpoint store is not enabled with {POOL_CHECKPOINT_PATH_ENV}')
+        return self.root / str(chain_id) / protocol / str(pool_address).lower()
+
+    @staticmethod
+    def checkpoints(key: Path) -> list[tuple[int, int]]:
+        if not key.exists():
+            return []
+        return sorted(tuple(int(n) for n in f.stem.split('-'))  # type: ignore
+                      for f in key.glob('*.npz'))
+
+    def nearest(self, key: Path, block_number: int) -> Optional[tuple[int, int]]:
+        """
+        The latest checkpoint taken at or before the block
+        """
+        earlier = [c for c in self.checkpoints(key) if c[0] <= block_number]
+        return earlier[-1] if len(earlier) > 0 else None
+
+    def save(self, key: Path, block_number: int, log_index: int, state: dict, big_int_arrays: dict[str, np.ndarray], int_arrays: dict[str, np.ndarray]):
+        key.mkdir(parents=True, exist_ok=True)
+
+        columns = {f'int_{name}': np.asarray(values, dtype=np.int64) for name, values in int_arrays.items()}
+        for name, values in big_int_arrays.items():
+            columns[f'high_{name}'], columns[f'low_{name}'] = split_int128(values)
+
+        buffer = io.BytesIO()
+        np.savez_compressed(buffer,
+                            version=np.array(POOL_CHECKPOINT_VERSION),
+                            state=np.frombuffer(json.dumps(state, default=_json_default).encode(), dtype=np.uint8),
+                            **columns)
+
+        file_path = key / f'{block_number}-{log_index}.npz'
+        tmp_path = file_path.with_suffix('.tmp')
+        tmp_path.write_bytes(buffer.getvalue())
+        tmp_path.replace(file_path)
+
+    def load(self, key: Path, block_number: int, log_index: int) -> Optional[tuple[dict, dict[str, np.ndarray]]]:
+        """
+        (state, arrays) of a checkpoint, None if it is of another version
+        """
+        with np.load(key / f'{block_number}-{log_index}.npz') as data:
+            if int(data['version']) != POOL_CHECKPOINT_VERSION:
+                return None
+
+            state = json.loads(bytes(data['state']).decode())
+            arrays = {}
+            for column in data.files:
+                if column.startswith('int_'):
+                    arrays[column[len('int_'):]] = data[column]
+                elif column.startswith('high_'):
+                    name = column[len('high_'):]
+                    arrays[name] = join_int128(data[column], data[f'low_{name}'])
+        return state, arrays
+
+
+def _json_default(value):
+    # numbers taken from event DataFrames
+    if isinstance(value, np.integer):
+        return int(value)
+    if isinstance(value, np.floating):
+        return float(value)
+    return str(value)
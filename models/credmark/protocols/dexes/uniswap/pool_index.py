@@ -0,0 +1,108 @@
+"""
+Known pools of DEX factories by token pair
+"""
+
+from typing import Callable, Optional
+
+from credmark.cmf.model.errors import ModelBaseError
+from credmark.cmf.types import Address
+from requests.exceptions import HTTPError
+
+# (token0, token1, fee), fee is None for factories with one pool per pair
+PoolKey = tuple[Address, Address, Optional[int]]
+
+
+def pool_key(token_a, token_b, fee: Optional[int] = None) -> PoolKey:
+    """
+    Key of a pair with the tokens in address order, as the factories sort them
+    """
+    token_a, token_b = Address(token_a), Address(token_b)
+    if token_b.to_int() < token_a.to_int():
+        token_a, token_b = token_b, token_a
+    return (token_a, token_b, fee)
+
+
+class FactoryPoolIndex:
+    """
+    Pools known to exist, or not, for the token pairs of a factory.
+
+    A pool found at a block exists at all later blocks. A pair without a pool at a block has none
+    at earlier blocks, nor at later blocks until the factory emits a PairCreated/PoolCreated event
+    for it. The index follows these events to carry the known absence forward to newer blocks.
+    """
+
+    # (chain id, factory address) => index
+    INDEXES: dict[tuple[int, Address], 'FactoryPoolIndex'] = {}
+
+    # Creation events are followed for at most this many blocks at once;
+    # beyond, absence is probed again.
+    MAX_EVENT_BLOCKS = 100_000
+
+    def __init__(self):
+        # key => (pool, a block where the pool exists)
+        self.present: dict[PoolKey, tuple[Address, int]] = {}
+        # key => last block known without a pool
+        self.absent: dict[PoolKey, int] = {}
+        # creation events are reflected up to this block
+        self.synced_to: Optional[int] = None
+
+    @classmethod
+    def get(cls, chain_id: int, factory_addr: Address) -> 'FactoryPoolIndex':
+        return cls.INDEXES.setdefault((chain_id, Address(factory_addr)), cls())
+
+    def sync(self,
+             block_number: int,
+             fetch_created: Callable[[int, int], list[tuple[PoolKey, Address, int]]]) -> bool:
+        """
+        Follow creation events (synced_to, block_number], from fetch_created(from_block, to_block)
+        returning (key, pool, block number) of the created pools.
+
+        Returns False when the events can not be fetched, then the index is not to be used
+        at the block.
+        """
+        if self.synced_to is not None and block_number <= self.synced_to:
+            return True
+
+        if self.synced_to is None or block_number - self.synced_to > self.MAX_EVENT_BLOCKS:
+            self.synced_to = block_number
+            return True
+
+        try:
+            created_pools = fetch_created(self.synced_to + 1, block_number)
+        except (HTTPError, ValueError, ModelBaseError):
+            return False
+
+        created = {}
+        for key, pool, created_block in created_pools:
+            key = pool_key(*key)
+            created[key] = min(created.get(key, created_block), created_block)
+            self.record(key, created_block, pool)
+
+        for key, absent_to in self.absent.items():
+            if absent_to == self.synced_to:
+                self.absent[key] = created[key] - 1 if key in created else block_number
+        self.synced_to = block_number
+        return True
+
+    def lookup(self, key: PoolKey, block_number: int) -> tuple[bool, Optional[Address]]:
+        """
+        (whether it is known, pool or None) for the pair at the block, in either token order
+        """
+        key = pool_key(*key)
+        if key in self.present:
+            pool, present_from = self.present[key]
+            if block_number >= present_from:
+                return True, pool
+        if key in self.absent and block_number <= self.absent[key]:
+            return True, None
+        return False, None
+
+    def record(self, key: PoolKey, block_number: int, pool: Optional[Address]):
+        key = pool_key(*key)
+        if pool is None:
+            self.absent[key] = max(self.absent.get(key, block_number), block_number)
+            return
+
+        if key in self.present:
+            block_number = min(self.present[key][1], block_number)
+        self.present[key] = (pool, block_number)
@@ -9,9 +9,11 @@ import warnings
 from datetime import datetime
 
 import pandas as pd
+from credmark.cmf.model import ModelContext
 from credmark.cmf.types import Contract
 
 from models.credmark.chain.contract import fetch_events_with_range
+from models.credmark.protocols.dexes.uniswap.pool_checkpoint import PoolCheckpointStore
 
 warnings.filterwarnings("error")
 
@@ -25,6 +27,52 @@ class UniswapPoolBase:
         self.df_evt = {}
         self._event_list = event_list
         self.protocol = _protocol
+        # set by the pool class
+        self.pool: Contract
+        # the last processed event
+        self.block_number = None
+        self.log_index = None
+        # checkpoints of the pool state, when enabled with CREDMARK_POOL_CHECKPOINT_PATH
+        self.checkpoint_store = PoolCheckpointStore.from_env()
+
+    def checkpoint_key(self):
+        return self.checkpoint_store.key(ModelContext.current_context().chain_id, self.protocol, self.pool.address)
+
+    def save_checkpoint(self):
+        """
+        Save the pool state after the last processed event, with checkpoint_state() of the pool class
+        """
+        if not self.checkpoint_store.enabled or self.block_number is None:
+            return
+        state, big_int_arrays, int_arrays = self.checkpoint_state()  # pylint: disable=no-member
+        self.checkpoint_store.save(self.checkpoint_key(), int(self.block_number), int(self.log_index),
+                                   state, big_int_arrays, int_arrays)
+
+    def load_checkpoint(self, block_number: int) -> bool:
+        """
+        Restore the latest checkpoint at or before the block with restore_checkpoint() of the pool class
+        """
+        if not self.checkpoint_store.enabled:
+            return False
+        key = self.checkpoint_key()
+        checkpoint = self.checkpoint_store.nearest(key, block_number)
+        if checkpoint is None:
+            return False
+        loaded = self.checkpoint_store.load(key, *checkpoint)
+        if loaded is None:
+            return False
+        self.restore_checkpoint(*loaded)  # pylint: disable=no-member
+        return True
+
+    def events_after_state(self, df_comb_evt: pd.DataFrame) -> pd.DataFrame:
+        """
+        Events after the (block_number, log_index) the pool state is at
+        """
+        if self.block_number is None or df_comb_evt.empty:
+            return df_comb_evt
+        block_number, log_index = self.block_number, self.log_index
+        return df_comb_evt.loc[(df_comb_evt.blockNumber > block_number) |
+                               ((df_comb_evt.blockNumber == block_number) & (df_comb_evt.logIndex > log_index))]
 
     def load_events_etl(self, _chain_id, _pool_addr, _protocol, _start_block, _end_block, pool_id, _get_uniswap_event_etl):
         """
@@ -42,10 +90,16 @@ class UniswapPoolBase:
     def load_events(self, _pool, from_block, to_block, use_async: bool, async_worker: int):
         """
         load events from node
+
+        A pool without state starts from the latest checkpoint at or before to_block, if any,
+        and loads only the events from its block. proc_events() skips the events before it.
         """
         if not _pool.abi:
             raise ValueError(f'Pool abi missing for {_pool.address}')
 
+        if self.block_number is None and self.load_checkpoint(to_block):
+            from_block = int(self.block_number)
+
         for event_name in self._event_list:
             # no fix for types, will fix when insertion
             df_evt = fetch_events_with_cols(
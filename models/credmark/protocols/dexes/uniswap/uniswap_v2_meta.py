@@ -2,6 +2,7 @@
 # pylint: disable=too-many-lines, unsubscriptable-object, line-too-long
 from abc import abstractmethod
 from datetime import datetime
+from functools import partial
 from typing import Tuple
 
 import numpy as np
@@ -10,11 +11,11 @@ from credmark.cmf.model import Model
 from credmark.cmf.model.errors import ModelDataError, ModelRunError
 from credmark.cmf.types import Address, BlockNumberOutOfRangeError, Contract, Contracts, Maybe, Records, Some, Token
 from credmark.cmf.types.compose import MapInputsOutput
-from web3.exceptions import (
-    BadFunctionCallOutput,
-    ContractLogicError,
-)
+from web3.exceptions import BadFunctionCallOutput
 
+from models.credmark.ledger.pagination import iter_ledger_pages
+from models.credmark.protocols.dexes.uniswap.pool_index import FactoryPoolIndex, PoolKey
+from models.credmark.tokens.token_metadata import TokenMetadataResolver
 from models.dtos.pool import PoolPriceInfo
 from models.dtos.price import (
     DexPriceTokenInput,
@@ -41,11 +42,30 @@ class UniswapV2PoolMeta(Model):
     def get_pool(pair_addr: Address):
         return Contract(address=pair_addr).set_abi(UNISWAP_V2_POOL_ABI, set_loaded=True)
 
+    @staticmethod
+    def fetch_created_pools(factory: Contract, from_block: int, to_block: int) -> list[tuple[PoolKey, Address, int]]:
+        return [((Address(evt['token0']), Address(evt['token1']), None), Address(evt['pair']), evt['blockNumber'])
+                for evt in factory.fetch_events(factory.events.PairCreated, from_block=from_block, to_block=to_block)]
+
     def get_pools_by_pair(self, factory_addr: Address, token_pairs: list[tuple[Address, Address]]) -> list[Address]:
         factory = self.get_factory(factory_addr)
 
+        # Pairs known in the index, with or without pool, are not looked up in the factory.
+        block_number = int(self.context.block_number)
+        pool_index = FactoryPoolIndex.get(self.context.chain_id, factory_addr)
+        if not pool_index.sync(block_number, partial(self.fetch_created_pools, factory)):
+            # Look up all pairs in the factory, with an index for this run only
+            pool_index = FactoryPoolIndex()
+
         pools = []
         for token0_addr, token1_addr in token_pairs:
+            key = (Address(token0_addr), Address(token1_addr), None)
+            is_known, pair_addr = pool_index.lookup(key, block_number)
+            if is_known:
+                if pair_addr is not None:
+                    pools.append(pair_addr)
+                continue
+
             try:
                 pair_addr = Address(factory.functions.getPair(
                     token0_addr.checksum, token1_addr.checksum).call())
@@ -55,6 +75,7 @@ class UniswapV2PoolMeta(Model):
                 continue  # before its creation
 
             if pair_addr.is_null():
+                pool_index.record(key, block_number, None)
                 continue
 
             cc = self.get_pool(pair_addr)
@@ -66,6 +87,7 @@ class UniswapV2PoolMeta(Model):
                 continue
             except ModelDataError:
                 pass
+            pool_index.record(key, block_number, pair_addr)
             pools.append(pair_addr)
 
         return pools
@@ -94,21 +116,8 @@ class UniswapV2PoolMeta(Model):
 
         start_time = datetime.now()
         with factory.ledger.events.PairCreated as q:
-            df_ts = []
-            offset = 0
-
-            while True:
-                df_tt = q.select(
-                    columns=q.columns,
-                    order_by=q.BLOCK_NUMBER.comma_(q.EVT_PAIR),
-                    limit=5000,
-                    offset=offset).to_dataframe()
-
-                if df_tt.shape[0] > 0:
-                    df_ts.append(df_tt)
-                if df_tt.shape[0] < 5000:
-                    break
-                offset += 5000
+            df_ts = list(iter_ledger_pages(q, [(q.BLOCK_NUMBER, 'block_number'), (q.LOG_INDEX, 'log_index')],
+                                           columns=q.columns))
 
         all_df = (pd
                   .concat(df_ts).sort_values(['block_number', 'log_index'])
@@ -181,20 +190,10 @@ class UniswapV2PoolMeta(Model):
                     q.EVT_TOKEN1.eq(tp1[1].checksum)).parentheses_()
                 eq_conds = eq_conds.or_(new_eq)
 
-            df_ts = []
-            offset = 0
-            while True:
-                df_tt = q.select(columns=[q.EVT_PAIR, q.BLOCK_NUMBER],
-                                 where=eq_conds,
-                                 order_by=q.BLOCK_NUMBER.comma_(q.EVT_PAIR),
-                                 limit=5000,
-                                 offset=offset).to_dataframe()
-
-                if df_tt.shape[0] > 0:
-                    df_ts.append(df_tt)
-                if df_tt.shape[0] < 5000:
-                    break
-                offset += 5000
+            df_ts = list(iter_ledger_pages(q, [(q.BLOCK_NUMBER, 'block_number'), (q.LOG_INDEX, 'log_index')],
+                                           where=eq_conds,
+                                           max_workers=1,
+                                           columns=[q.EVT_PAIR, q.BLOCK_NUMBER]))
 
             if len(df_ts) == 0:
                 return Contracts.empty()
@@ -215,15 +214,10 @@ class UniswapV2PoolMeta(Model):
         token0_addr = pool.functions.token0().call()
         token1_addr = pool.functions.token1().call()
 
-        try:
-            token0 = Token(address=Address(token0_addr)).as_erc20(set_loaded=True)
-        except (OverflowError, ContractLogicError):
-            token0 = Token(address=Address(token0_addr)).as_erc20()
-
-        try:
-            token1 = Token(address=Address(token1_addr)).as_erc20(set_loaded=True)
-        except (OverflowError, ContractLogicError):
-            token1 = Token(address=Address(token1_addr)).as_erc20()
+        token0_meta, token1_meta = TokenMetadataResolver(self.context).resolve(
+            [Address(token0_addr), Address(token1_addr)])
+        token0 = token0_meta['token']
+        token1 = token1_meta['token']
 
         scaled_reserve0 = token0.scaled(reserves[0])
         scaled_reserve1 = token1.scaled(reserves[1])
@@ -16,12 +16,10 @@ from credmark.cmf.types import (
     Tokens,
 )
 from credmark.dto import DTO
-from web3.exceptions import (
-    ABIFunctionNotFound,
-    ContractLogicError,
-)
+from web3.exceptions import ABIFunctionNotFound
 
 from models.credmark.protocols.dexes.uniswap.uniswap_ref_price_meta import UniswapRefPriceMeta
+from models.credmark.tokens.token_metadata import TokenMetadataResolver
 from models.dtos.pool import PoolPriceInfo
 from models.dtos.price import DexPoolPriceInput
 from models.dtos.tvl import TVLInfo
@@ -55,7 +53,7 @@ class UniswapV2DexPoolPriceInput(UniswapV2Pool, DexPoolPriceInput):
 
 
 @Model.describe(slug='uniswap-v2.get-pool-price-info',
-                version='1.23',
+                version='1.24',
                 display_name='Uniswap v2 Token Pool Price Info',
                 description='Gather price and liquidity information from pool',
                 category='protocol',
@@ -80,19 +78,9 @@ class UniswapPoolPriceInfo(UniswapRefPriceMeta):
         token0_addr = Address(pool.functions.token0().call())
         token1_addr = Address(pool.functions.token1().call())
 
-        try:
-            token0 = Token(address=token0_addr).as_erc20(set_loaded=True)
-            token0_symbol = token0.symbol
-        except (OverflowError, ContractLogicError):
-            token0 = Token(address=token0_addr).as_erc20()
-            token0_symbol = token0.symbol
-
-        try:
-            token1 = Token(address=token1_addr).as_erc20(set_loaded=True)
-            token1_symbol = token1.symbol
-        except (OverflowError, ContractLogicError):
-            token1 = Token(address=token1_addr).as_erc20()
-            token1_symbol = token1.symbol
+        token0_meta, token1_meta = TokenMetadataResolver(self.context).resolve([token0_addr, token1_addr])
+        token0, token0_symbol = token0_meta['token'], token0_meta['symbol']
+        token1, token1_symbol = token1_meta['token'], token1_meta['symbol']
 
         scaled_reserve0 = token0.scaled(reserves[0])
         scaled_reserve1 = token1.scaled(reserves[1])
@@ -2,15 +2,28 @@
 
 from abc import abstractmethod
 from datetime import datetime
+from functools import partial
 
 import numpy as np
 import pandas as pd
 from credmark.cmf.model import Model
 from credmark.cmf.model.errors import ModelDataError, ModelRunError
-from credmark.cmf.types import Address, BlockNumberOutOfRangeError, Contract, Contracts, Maybe, Records, Some, Token
+from credmark.cmf.types import (
+    Address,
+    BlockNumberOutOfRangeError,
+    Contract,
+    Contracts,
+    Maybe,
+    Records,
+    Some,
+    Token,
+)
 from credmark.cmf.types.compose import MapInputsOutput
 from web3.exceptions import BadFunctionCallOutput
 
+from models.credmark.ledger.pagination import iter_ledger_pages
+from models.credmark.protocols.dexes.uniswap.pool_index import FactoryPoolIndex, PoolKey
+from models.credmark.protocols.dexes.uniswap.uniswap_v3_pool import UniswapV3PoolSnapshot
 from models.dtos.pool import PoolPriceInfo
 from models.dtos.price import (
     DexPriceTokenInput,
@@ -40,63 +53,109 @@ class UniswapV3PoolMeta(Model):
         # UniswapV3 pool abi is good enough for token0 and token1 calls, but not for slot0
         return Contract(address=pair_addr).set_abi(UNISWAP_V3_POOL_ABI, set_loaded=True)
 
+    # Number of calls in one multicall request for pool discovery
+    POOL_DISCOVERY_CHUNK_SIZE = 500
+
+    def batch_call(self, calls):
+        """
+        Run calls in chunks of web3 batch calls, None for the failed ones.
+        """
+        results = []
+        for i in range(0, len(calls), self.POOL_DISCOVERY_CHUNK_SIZE):
+            results.extend(self.context.web3_batch.call(
+                calls[i:i + self.POOL_DISCOVERY_CHUNK_SIZE], unwrap=True, require_success=False))
+        return results
+
+    def validate_pool(self, pool_addr: Address) -> bool:
+        """
+        Check a pool whose token0/token1 failed in the batch call one call at a time, as the batch
+        call does not tell why it failed. A pool accessed before its creation is not used; a pool
+        without ABI is still used.
+        """
+        try:
+            cc = self.get_pool(pool_addr)
+            _ = cc.abi
+            _ = cc.functions.token0().call()
+            _ = cc.functions.token1().call()
+        except (BlockNumberOutOfRangeError, BadFunctionCallOutput):
+            self.logger.info(f'Dropped pool {pool_addr} accessed before its creation')
+            return False
+        except ModelDataError:
+            pass
+        return True
+
+    @staticmethod
+    def fetch_created_pools(factory: Contract, from_block: int, to_block: int) -> list[tuple[PoolKey, Address, int]]:
+        if factory.abi is not None and 'Pool' in factory.abi.events:  # QuickSwap
+            return [((Address(evt['token0']), Address(evt['token1']), None), Address(evt['pool']), evt['blockNumber'])
+                    for evt in factory.fetch_events(factory.events.Pool, from_block=from_block, to_block=to_block)]
+        return [((Address(evt['token0']), Address(evt['token1']), evt['fee']), Address(evt['pool']), evt['blockNumber'])
+                for evt in factory.fetch_events(factory.events.PoolCreated, from_block=from_block, to_block=to_block)]
+
     def get_pools_by_pair(self, factory_addr: Address, factory_abi, token_pairs: list[tuple[Address, Address]], pool_fees: list[int]) -> list[Address]:
         uniswap_factory = self.get_factory(factory_addr, factory_abi)
         if uniswap_factory.abi is None:
             raise ModelRunError(f'Missing ABI for factory contract {factory_addr}')
-        pools = []
-        if 'poolByPair' in uniswap_factory.abi.functions:
-            for token0_addr, token1_addr in token_pairs:
-                try:
-                    pool_addr = Address(uniswap_factory.functions
-                                        .poolByPair(token0_addr.checksum, token1_addr.checksum)
-                                        .call())
-                except BadFunctionCallOutput:
-                    break  # factory has not existed yet
-                except (BlockNumberOutOfRangeError, ModelDataError):
-                    continue
-
-                if pool_addr.is_null():
-                    continue
 
-                try:
-                    cc = self.get_pool(pool_addr)
-                    _ = cc.abi
-                    _ = cc.functions.token0().call()
-                    _ = cc.functions.token1().call()
-                except (BlockNumberOutOfRangeError, BadFunctionCallOutput):
-                    continue  # access it before its creation
-                except ModelDataError:
-                    pass
-                pools.append(pool_addr)
+        if 'poolByPair' in uniswap_factory.abi.functions:
+            pool_keys = [(Address(token0_addr), Address(token1_addr), None)
+                         for token0_addr, token1_addr in token_pairs]
         elif 'getPool' in uniswap_factory.abi.functions:
-            for token0_addr, token1_addr in token_pairs:
-                for fee in pool_fees:
-                    try:
-                        pool_addr = Address(uniswap_factory.functions
-                                            .getPool(token0_addr.checksum, token1_addr.checksum, fee)
-                                            .call())
-                    except (BlockNumberOutOfRangeError, BadFunctionCallOutput, ModelDataError):
-                        continue  # before its creation
-
-                    if pool_addr.is_null():
-                        continue
-
-                    try:
-                        cc = self.get_pool(pool_addr)
-                        _ = cc.abi
-                        _ = cc.functions.token0().call()
-                        _ = cc.functions.token1().call()
-                    except (BlockNumberOutOfRangeError, BadFunctionCallOutput):
-                        continue  # access it before its creation
-                    except ModelDataError:
-                        pass
-                    pools.append(pool_addr)
+            pool_keys = [(Address(token0_addr), Address(token1_addr), fee)
+                         for token0_addr, token1_addr in token_pairs
+                         for fee in pool_fees]
         else:
             raise ModelRunError(
                 'Missing neither getPool() nor poolByPair() in the factory contract')
 
-        return pools
+        # Only the pairs not known in the index, with or without pool, are looked up in the factory.
+        block_number = int(self.context.block_number)
+        pool_index = FactoryPoolIndex.get(self.context.chain_id, factory_addr)
+        if not pool_index.sync(block_number, partial(self.fetch_created_pools, uniswap_factory)):
+            # Look up all pairs in the factory, with an index for this run only
+            pool_index = FactoryPoolIndex()
+
+        known_pools = {}
+        lookup_keys = []
+        for key in pool_keys:
+            is_known, pool_addr = pool_index.lookup(key, block_number)
+            if is_known:
+                known_pools[key] = pool_addr
+            else:
+                lookup_keys.append(key)
+
+        if len(lookup_keys) > 0:
+            if 'poolByPair' in uniswap_factory.abi.functions:
+                factory_calls = [uniswap_factory.functions.poolByPair(token0_addr.checksum, token1_addr.checksum)
+                                 for token0_addr, token1_addr, _fee in lookup_keys]
+            else:
+                factory_calls = [uniswap_factory.functions.getPool(token0_addr.checksum, token1_addr.checksum, fee)
+                                 for token0_addr, token1_addr, fee in lookup_keys]
+
+            # Failed calls are for the factory/pool accessed before its creation.
+            # Only a successful call with no pool is recorded as absent.
+            found_pools = {}
+            for key, pool_addr in zip(lookup_keys, self.batch_call(factory_calls)):
+                if pool_addr is None:
+                    continue
+                if Address(pool_addr).is_null():
+                    pool_index.record(key, block_number, None)
+                else:
+                    found_pools[key] = Address(pool_addr)
+
+            if len(found_pools) > 0:
+                validate_calls = []
+                for pool_addr in found_pools.values():
+                    cc = self.get_pool(pool_addr)
+                    validate_calls.extend([cc.functions.token0(), cc.functions.token1()])
+                validate_results = self.batch_call(validate_calls)
+
+                for (key, pool_addr), token0, token1 in zip(found_pools.items(), validate_results[::2], validate_results[1::2]):
+                    if (token0 is not None and token1 is not None) or self.validate_pool(pool_addr):
+                        pool_index.record(key, block_number, pool_addr)
+                        known_pools[key] = pool_addr
+
+        return [known_pools[key] for key in pool_keys if known_pools.get(key) is not None]
 
     POOLS_COLUMNS = ['block_number', 'log_index', 'transaction_hash',
                      'pool_address', 'token0', 'token1', 'fee', 'tickSpacing']
@@ -112,21 +171,8 @@ class UniswapV3PoolMeta(Model):
         start_time = datetime.now()
         if 'Pool' in factory.abi.events:
             with factory.ledger.events.Pool as q:
-                df_ts = []
-                offset = 0
-
-                while True:
-                    df_tt = q.select(
-                        columns=q.columns,
-                        order_by=q.BLOCK_NUMBER.comma_(q.EVT_POOL),
-                        limit=5000,
-                        offset=offset).to_dataframe()
-
-                    if df_tt.shape[0] > 0:
-                        df_ts.append(df_tt)
-                    if df_tt.shape[0] < 5000:
-                        break
-                    offset += 5000
+                df_ts = list(iter_ledger_pages(q, [(q.BLOCK_NUMBER, 'block_number'), (q.LOG_INDEX, 'log_index')],
+                                               columns=q.columns))
             all_df = (pd
                       .concat(df_ts).sort_values(['block_number', 'log_index'])
                       .reset_index(drop=True)
@@ -146,21 +192,8 @@ class UniswapV3PoolMeta(Model):
                 .loc[:, self.QUICKSWAP_POOLS_COLUMNS])
         else:
             with factory.ledger.events.PoolCreated as q:
-                df_ts = []
-                offset = 0
-
-                while True:
-                    df_tt = q.select(
-                        columns=q.columns,
-                        order_by=q.BLOCK_NUMBER.comma_(q.EVT_POOL),
-                        limit=5000,
-                        offset=offset).to_dataframe()
-
-                    if df_tt.shape[0] > 0:
-                        df_ts.append(df_tt)
-                    if df_tt.shape[0] < 5000:
-                        break
-                    offset += 5000
+                df_ts = list(iter_ledger_pages(q, [(q.BLOCK_NUMBER, 'block_number'), (q.LOG_INDEX, 'log_index')],
+                                               columns=q.columns))
             all_df = (pd
                       .concat(df_ts).sort_values(['block_number', 'log_index'])
                       .reset_index(drop=True)
@@ -253,21 +286,10 @@ class UniswapV3PoolMeta(Model):
                               .parentheses_())
                     eq_conds = eq_conds.or_(new_eq)
 
-                df_ts = []
-                offset = 0
-                while True:
-                    df_tt = q.select(
-                        columns=[q.EVT_POOL, q.BLOCK_NUMBER],
-                        where=eq_conds,
-                        order_by=q.BLOCK_NUMBER.comma_(q.EVT_POOL),
-                        limit=5000,
-                        offset=offset).to_dataframe()
-
-                    if df_tt.shape[0] > 0:
-                        df_ts.append(df_tt)
-                    if df_tt.shape[0] < 5000:
-                        break
-                    offset += 5000
+                df_ts = list(iter_ledger_pages(q, [(q.BLOCK_NUMBER, 'block_number'), (q.LOG_INDEX, 'log_index')],
+                                               where=eq_conds,
+                                               max_workers=1,
+                                               columns=[q.EVT_POOL, q.BLOCK_NUMBER]))
 
                 if len(df_ts) == 0:
                     return Contracts.empty()
@@ -294,22 +316,11 @@ class UniswapV3PoolMeta(Model):
                               .parentheses_())
                     eq_conds = eq_conds.or_(new_eq)
 
-                df_ts = []
-                offset = 0
-                while True:
-                    df_tt = q.select(
-                        columns=[q.EVT_POOL, q.BLOCK_NUMBER],
-                        aggregates=[(q.EVT_FEE.as_bigint(), q.EVT_FEE)],
-                        where=eq_conds,
-                        order_by=q.BLOCK_NUMBER.comma_(q.EVT_POOL),
-                        limit=5000,
-                        offset=offset).to_dataframe()
-
-                    if df_tt.shape[0] > 0:
-                        df_ts.append(df_tt)
-                    if df_tt.shape[0] < 5000:
-                        break
-                    offset += 5000
+                df_ts = list(iter_ledger_pages(q, [(q.BLOCK_NUMBER, 'block_number'), (q.LOG_INDEX, 'log_index')],
+                                               where=eq_conds,
+                                               max_workers=1,
+                                               columns=[q.EVT_POOL, q.BLOCK_NUMBER],
+                                               aggregates=[(q.EVT_FEE.as_bigint(), q.EVT_FEE)]))
 
                 if len(df_ts) == 0:
                     return Contracts.empty()
@@ -344,8 +355,10 @@ class UniswapV3PoolMeta(Model):
                         [(token0_address, token1_address), (token1_address, token0_address)])
                     continue
 
-                pools_info = [self.context.run_model(
-                    'uniswap-v3.get-pool-info', input={'address': p}) for p in pools]
+                pools_info = self.context.run_model(
+                    'uniswap-v3.get-pool-info-multiple',
+                    input=Contracts.from_addresses(pools),
+                    return_type=Some[dict]).some
                 pools_info_sel = [[p,
                                    *[pi[k] for k in ['ratio_price0', 'one_tick_liquidity0', 'ratio_price1', 'one_tick_liquidity1']]]
                                   for p, pi in zip(pools, pools_info)]
@@ -422,6 +435,12 @@ class UniswapV3PoolMeta(Model):
                 protocol=_protocol)
             for pool in pools]
 
+        # Fetch the state of all pools in batches, then run the pool info of each pool
+        # in this process so that it is read from the snapshots.
+        prefetched = model_slug == 'uniswap-v3.get-pool-price-info'
+        if prefetched:
+            UniswapV3PoolSnapshot(self.context).get([pool.address for pool in pools])
+
         def _use_compose():
             pool_infos = self.context.run_model(
                 slug='compose.map-inputs',
@@ -456,5 +475,5 @@ class UniswapV3PoolMeta(Model):
                     infos.append(pi.just)
             return infos
 
-        infos = _use_for(local=False)
+        infos = _use_for(local=prefetched)
         return Some[PoolPriceInfo](some=infos)
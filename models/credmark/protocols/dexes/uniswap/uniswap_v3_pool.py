@@ -1,13 +1,14 @@
 # pylint: disable=locally-disabled, invalid-name, line-too-long
 
 import math
+from typing import Optional
 
 import numpy as np
 import numpy.linalg as nplin
 import scipy.optimize as spo
 from credmark.cmf.model import Model
 from credmark.cmf.model.errors import ModelDataError, ModelRunError
-from credmark.cmf.types import Address, Contract, Maybe, Price, Some, Token
+from credmark.cmf.types import Address, Contract, Contracts, Maybe, Price, Some, Token
 from credmark.dto import DTO, EmptyInput
 from web3.exceptions import BadFunctionCallOutput, ContractLogicError
 
@@ -20,6 +21,7 @@ from models.credmark.protocols.dexes.uniswap.univ3_math import (
     out_of_range,
     tick_to_price,
 )
+from models.credmark.tokens.token_metadata import TokenMetadataResolver
 from models.dtos.pool import PoolPriceInfo
 from models.dtos.price import DexPoolPriceInput, DexProtocol, DexProtocolInput
 from models.tmp_abi_lookup import PANCAKESWAP_V3_POOL_ABI, QUICKSWAP_V3_POOL_ABI, UNISWAP_V3_POOL_ABI
@@ -27,7 +29,10 @@ from models.tmp_abi_lookup import PANCAKESWAP_V3_POOL_ABI, QUICKSWAP_V3_POOL_ABI
 np.seterr(all='raise')
 
 
-def fix_univ3_pool(pool: Contract):
+def univ3_pool_abi(pool: Contract) -> Optional[str]:
+    """
+    ABI to set for a V3 pool without one, by probing Uniswap/PancakeSwap and QuickSwap. None if the pool has its ABI.
+    """
     try:
         _ = pool.abi
     except ModelDataError:
@@ -35,15 +40,31 @@ def fix_univ3_pool(pool: Contract):
             pool = (Contract(address=pool.address)
                     .set_abi(abi=UNISWAP_V3_POOL_ABI, set_loaded=True))
             _ = pool.functions.slot0().call()
+            return UNISWAP_V3_POOL_ABI
         except BadFunctionCallOutput:
             pool = (Contract(address=pool.address)
                     .set_abi(abi=PANCAKESWAP_V3_POOL_ABI, set_loaded=True))
             _ = pool.functions.slot0().call()
+            return PANCAKESWAP_V3_POOL_ABI
         except ContractLogicError:
             pool = (Contract(address=pool.address)
                     .set_abi(abi=QUICKSWAP_V3_POOL_ABI, set_loaded=True))
             _ = pool.functions.globalState().call()
+            return QUICKSWAP_V3_POOL_ABI
+
+    return None
+
+
+def univ3_pool_with_abi(address: Address, abi: Optional[str]) -> Contract:
+    if abi is None:
+        return UniswapV3Pool(address=address)
+    return Contract(address=address).set_abi(abi=abi, set_loaded=True)
+
 
+def fix_univ3_pool(pool: Contract):
+    abi = univ3_pool_abi(pool)
+    if abi is not None:
+        pool = univ3_pool_with_abi(pool.address, abi)
     return pool
 
 
@@ -111,8 +132,152 @@ class UniswapV3PoolInfo(DTO):
     tick_price1: float
 
 
+class UniswapV3PoolSnapshot:
+    """
+    State of V3 pools on the current block, fetched for many pools together.
+
+    Immutable fields (token addresses, fee, tick spacing and the ABI of the pool) are kept
+    per pool for the life of the process, as plain values. The rest is read in batches per
+    block: the token metadata, the pool state and balances, then the ticks around the current
+    tick. The pool and token contracts are made for each block. A pool with a failed call is
+    skipped and returned as None.
+    """
+
+    # (chain id, pool address) => immutable fields
+    POOL_STATIC: dict[tuple[int, Address], dict] = {}
+
+    # (chain id, block number) => pool address => snapshot, for the latest blocks
+    POOL_STATE: dict[tuple[int, int], dict[Address, dict]] = {}
+    POOL_STATE_MAX_BLOCKS = 16
+
+    def __init__(self, context):
+        self.context = context
+
+    def get_static(self, pool_addrs: list[Address]) -> list[Optional[dict]]:
+        chain_id = self.context.chain_id
+        missing = [addr for addr in dict.fromkeys(pool_addrs)
+                   if (chain_id, addr) not in self.POOL_STATIC]
+
+        if len(missing) > 0:
+            pools = []
+            for addr in missing:
+                abi = univ3_pool_abi(UniswapV3Pool(address=addr))
+                pool = univ3_pool_with_abi(addr, abi)
+                if pool.abi is None:
+                    raise ModelRunError(f'Missing ABI for pool contract {addr}')
+                pools.append((abi, pool))
+
+            calls = []
+            for _, pool in pools:
+                calls.extend([pool.functions.token0(),
+                              pool.functions.token1(),
+                              pool.functions.tickSpacing()])
+                if 'fee' in pool.abi.functions:
+                    calls.append(pool.functions.fee())
+            results = iter(self.context.web3_batch.call(calls, unwrap=True, require_success=False))
+
+            for addr, (abi, pool) in zip(missing, pools):
+                token0_addr = next(results)
+                token1_addr = next(results)
+                tick_spacing = next(results)
+                # QuickSwap has dynamic fee in globalState
+                fee = next(results) if 'fee' in pool.abi.functions else None
+                if token0_addr is None or token1_addr is None or tick_spacing is None:
+                    continue
+                self.POOL_STATIC[(chain_id, addr)] = {
+                    'abi': abi,
+                    'token0_addr': Address(token0_addr),
+                    'token1_addr': Address(token1_addr),
+                    'tick_spacing': tick_spacing,
+                    'fee': fee,
+                }
+
+        return [self.POOL_STATIC.get((chain_id, addr)) for addr in pool_addrs]
+
+    def block_state(self) -> dict[Address, dict]:
+        key = (self.context.chain_id, int(self.context.block_number))
+        if key not in self.POOL_STATE:
+            while len(self.POOL_STATE) >= self.POOL_STATE_MAX_BLOCKS:
+                del self.POOL_STATE[next(iter(self.POOL_STATE))]
+            self.POOL_STATE[key] = {}
+        return self.POOL_STATE[key]
+
+    def get(self, pool_addrs: list[Address]) -> list[Optional[dict]]:
+        pool_addrs = [Address(addr) for addr in pool_addrs]
+        block_state = self.block_state()
+        missing = [addr for addr in dict.fromkeys(pool_addrs) if addr not in block_state]
+
+        if len(missing) > 0:
+            statics = [(addr, static) for addr, static in zip(missing, self.get_static(missing))
+                       if static is not None]
+            token_metas = iter(TokenMetadataResolver(self.context).resolve(
+                [token_addr for _, static in statics
+                 for token_addr in (static['token0_addr'], static['token1_addr'])]))
+
+            pools = []
+            calls = []
+            for addr, static in statics:
+                pool = univ3_pool_with_abi(addr, static['abi'])
+                token0_meta = next(token_metas)
+                token1_meta = next(token_metas)
+                pools.append((addr, pool, static | {
+                    'token0_symbol': token0_meta['symbol'],
+                    'token1_symbol': token1_meta['symbol'],
+                    'token0_decimals': token0_meta['decimals'],
+                    'token1_decimals': token1_meta['decimals'],
+                }))
+
+                if 'slot0' in pool.abi.functions:
+                    calls.append(pool.functions.slot0())
+                elif 'globalState' in pool.abi.functions:
+                    calls.append(pool.functions.globalState())
+                else:
+                    raise ModelRunError(
+                        'Unable to query V3 pool state, neither Uniswap/PancakeSwap nor QuickSwap')
+                calls.extend([pool.functions.liquidity(),
+                              token0_meta['token'].functions.balanceOf(pool.address.checksum),
+                              token1_meta['token'].functions.balanceOf(pool.address.checksum)])
+            results = iter(self.context.web3_batch.call(calls, unwrap=True, require_success=False))
+
+            snapshots = []
+            tick_calls = []
+            for addr, pool, pool_fields in pools:
+                slot0 = next(results)
+                liquidity = next(results)
+                token0_balance = next(results)
+                token1_balance = next(results)
+                if slot0 is None or liquidity is None or token0_balance is None or token1_balance is None:
+                    continue
+
+                current_tick = slot0[1]
+                tick_spacing = pool_fields['tick_spacing']
+                tick_bottom = current_tick // tick_spacing * tick_spacing
+                tick_top = tick_bottom + tick_spacing
+                tick_calls.extend([pool.functions.ticks(tick)
+                                   for tick in [current_tick, tick_bottom, tick_top]])
+
+                snapshots.append((addr, pool_fields | {
+                    'slot0': slot0,
+                    'fee': pool_fields['fee'] if pool_fields['fee'] is not None else slot0[2],
+                    'liquidity': liquidity,
+                    'token0_balance': token0_balance,
+                    'token1_balance': token1_balance,
+                }))
+
+            tick_results = iter(self.context.web3_batch.call(tick_calls, unwrap=True, require_success=False))
+            for addr, snapshot in snapshots:
+                ticks = [next(tick_results) for _ in range(3)]
+                if any(tick is None for tick in ticks):
+                    continue
+                snapshot['ticks'], snapshot['lower_ticks'], snapshot['upper_ticks'] = (
+                    V3_TICK(*tick) for tick in ticks)
+                block_state[addr] = snapshot
+
+        return [block_state.get(addr) for addr in pool_addrs]
+
+
 @Model.describe(slug='uniswap-v3.get-pool-info',
-                version='1.25',
+                version='1.26',
                 display_name='Uniswap v3 Token Pools Info',
                 description='The Uniswap v3 pools that support a token contract',
                 category='protocol',
@@ -129,55 +294,37 @@ class UniswapV3GetPoolInfo(Model):
 
     # pylint: disable=too-many-locals
     def run(self, input: UniswapV3Pool) -> UniswapV3PoolInfo:
-        pool = fix_univ3_pool(UniswapV3Pool(address=input.address))
-        if pool.abi is None:
-            raise ModelRunError(f'Missing ABI for pool contract {input.address}')
-
-        if 'slot0' in pool.abi.functions:
-            slot0 = pool.functions.slot0().call()
-        elif 'globalState' in pool.abi.functions:
-            slot0 = pool.functions.globalState().call()
-        else:
-            raise ModelRunError(
-                'Unable to query V3 pool state, neither Uniswap/PancakeSwap nor QuickSwap')
+        snapshot = UniswapV3PoolSnapshot(self.context).get([input.address])[0]
+        if snapshot is None:
+            raise ModelDataError(f'Unable to read the state of pool {input.address}')
+        return self.pool_info(input.address, snapshot)
 
+    def pool_info(self, address: Address, snapshot: dict) -> UniswapV3PoolInfo:
+        slot0 = snapshot['slot0']
         sqrtPriceX96 = slot0[0]
         current_tick = slot0[1]
+        fee = snapshot['fee']
 
-        if 'fee' in pool.abi.functions:
-            fee = pool.functions.fee().call()
-        else:
-            fee = slot0[2]
-        ticks = V3_TICK(*pool.functions.ticks(current_tick).call())
-        _liquidityGross = ticks.liquidityGross
-        _liquidityNet = ticks.liquidityNet
-
-        token0_addr = Address(pool.functions.token0().call())
-        token1_addr = Address(pool.functions.token1().call())
+        _liquidityNet = snapshot['ticks'].liquidityNet
 
-        try:
-            token0 = Token(address=token0_addr).as_erc20(set_loaded=True)
-            token0_symbol = token0.symbol
-        except (OverflowError, ContractLogicError):
-            token0 = Token(address=token0_addr).as_erc20()
-            token0_symbol = token0.symbol
-
-        try:
-            token1 = Token(address=token1_addr).as_erc20(set_loaded=True)
-            token1_symbol = token1.symbol
-        except (OverflowError, ContractLogicError):
-            token1 = Token(address=token1_addr).as_erc20()
-            token1_symbol = token1.symbol
+        token0_addr = snapshot['token0_addr']
+        token1_addr = snapshot['token1_addr']
+        token0_symbol = snapshot['token0_symbol']
+        token1_symbol = snapshot['token1_symbol']
+        token0_decimals = snapshot['token0_decimals']
+        token1_decimals = snapshot['token1_decimals']
+        token0_scale = 10 ** token0_decimals
+        token1_scale = 10 ** token1_decimals
 
-        token0_balance = token0.balance_of_scaled(input.address.checksum)
-        token1_balance = token1.balance_of_scaled(input.address.checksum)
+        token0_balance = snapshot['token0_balance'] / token0_scale
+        token1_balance = snapshot['token1_balance'] / token1_scale
 
         # 1. Liquidity for virtual amount of x and y
-        liquidity = pool.functions.liquidity().call()
+        liquidity = snapshot['liquidity']
 
         # 2. To calculate liquidity within the range of tick
         # Get the current tick and tick_spacing for the pool (set based on the fee)
-        tick_spacing = pool.functions.tickSpacing().call()
+        tick_spacing = snapshot['tick_spacing']
 
         # Compute the tick range near the current tick
         tick_bottom = current_tick // tick_spacing * tick_spacing
@@ -206,13 +353,11 @@ class UniswapV3GetPoolInfo(Model):
         in_tick_amount0, in_tick_amount1 = in_range(liquidity, sb, sa, sp)
 
         # Scale the amounts to the token's unit
-        adjusted_in_tick_amount0 = token0.scaled(in_tick_amount0)
-        adjusted_in_tick_amount1 = token1.scaled(in_tick_amount1)
+        adjusted_in_tick_amount0 = in_tick_amount0 / token0_scale
+        adjusted_in_tick_amount1 = in_tick_amount1 / token1_scale
 
-        lower_tick_info = V3_TICK(*pool.functions.ticks(tick_bottom).call())
-        lower_liquidityNet = lower_tick_info.liquidityNet
-        upper_tick_info = V3_TICK(*pool.functions.ticks(tick_top).call())
-        upper_liquidityNet = upper_tick_info.liquidityNet
+        lower_liquidityNet = snapshot['lower_ticks'].liquidityNet
+        upper_liquidityNet = snapshot['upper_ticks'].liquidityNet
 
         saa = tick_to_price((tick_bottom-tick_spacing) / 2)
         sbb = tick_to_price((tick_top+tick_spacing) / 2)
@@ -222,10 +367,10 @@ class UniswapV3GetPoolInfo(Model):
         upper_tick_amount0, upper_tick_amount1 = out_of_range(
             liquidity+upper_liquidityNet, sbb, sb)
 
-        lower_tick_amount0 = token0.scaled(lower_tick_amount0)
-        lower_tick_amount1 = token1.scaled(lower_tick_amount1)
-        upper_tick_amount0 = token0.scaled(upper_tick_amount0)
-        upper_tick_amount1 = token1.scaled(upper_tick_amount1)
+        lower_tick_amount0 = lower_tick_amount0 / token0_scale
+        lower_tick_amount1 = lower_tick_amount1 / token1_scale
+        upper_tick_amount0 = upper_tick_amount0 / token0_scale
+        upper_tick_amount1 = upper_tick_amount1 / token1_scale
 
         # Below shall be equal for the tick liquidity
         # Reference: UniswapV3 whitepaper Eq. 2.2
@@ -267,15 +412,15 @@ class UniswapV3GetPoolInfo(Model):
             # _tick1_amount0 == 0, _tick1_amount1 = in_range(liquidity, sp, sa_p, sp)
             # tick1_amount0, _tick1_amount1 == 0 = in_range(liquidity, sb_p, sp, sp)
 
-        one_tick_liquidity0_ori = token0.scaled(tick1_amount0)
-        one_tick_liquidity1_ori = token1.scaled(tick1_amount1)
+        one_tick_liquidity0_ori = tick1_amount0 / token0_scale
+        one_tick_liquidity1_ori = tick1_amount1 / token1_scale
 
         # We match the two tokens' liquidity for the minimal available, a fix for the illiquid pools.
         tick1_amount0_adj = min(tick1_amount0, tick1_amount1 / sp / sp)
         tick1_amount1_adj = min(tick1_amount0 * sp * sp, tick1_amount1)
 
-        one_tick_liquidity0_adj = token0.scaled(tick1_amount0_adj)
-        one_tick_liquidity1_adj = token1.scaled(tick1_amount1_adj)
+        one_tick_liquidity0_adj = tick1_amount0_adj / token0_scale
+        one_tick_liquidity1_adj = tick1_amount1_adj / token1_scale
 
         # Combined liquidity
         # https://uniswap.org/blog/uniswap-v3-dominance
@@ -285,10 +430,10 @@ class UniswapV3GetPoolInfo(Model):
 
         # Calculate the virtual liquidity
         # Reference: UniswapV3 whitepaper Eq. 2.1
-        virtual_x = token0.scaled(liquidity / sp)
-        virtual_y = token1.scaled(liquidity * sp)
+        virtual_x = liquidity / sp / token0_scale
+        virtual_y = liquidity * sp / token1_scale
 
-        scale_multiplier = 10 ** (token0.decimals - token1.decimals)
+        scale_multiplier = 10 ** (token0_decimals - token1_decimals)
         tick_price0 = tick_to_price(current_tick) * scale_multiplier
         if math.isclose(0, tick_price0):
             tick_price1 = 0
@@ -306,7 +451,7 @@ class UniswapV3GetPoolInfo(Model):
             ratio_price1 = 0
 
         return UniswapV3PoolInfo(
-            address=input.address,
+            address=address,
             sqrtPriceX96=sqrtPriceX96,
             current_tick=current_tick,
             tick_bottom=tick_bottom,
@@ -317,16 +462,16 @@ class UniswapV3GetPoolInfo(Model):
             # observationCardinalityNext=slot0[4],
             # feeProtocol=slot0[5],
             unlocked=slot0[-1],  # the common between uniswap and quickswap
-            token0=token0,
-            token1=token1,
+            token0=Token(address=token0_addr),
+            token1=Token(address=token1_addr),
             token0_addr=token0_addr,
             token1_addr=token1_addr,
             token0_balance=token0_balance,
             token1_balance=token1_balance,
             token0_symbol=token0_symbol,
             token1_symbol=token1_symbol,
-            token0_decimals=token0.decimals,
-            token1_decimals=token1.decimals,
+            token0_decimals=token0_decimals,
+            token1_decimals=token1_decimals,
             liquidity=liquidity,
             full_tick_liquidity0=adjusted_in_tick_amount0,
             full_tick_liquidity1=adjusted_in_tick_amount1,
@@ -351,6 +496,23 @@ class UniswapV3GetPoolInfo(Model):
             ratio_price1=ratio_price1)
 
 
+@Model.describe(slug='uniswap-v3.get-pool-info-multiple',
+                version='0.1',
+                display_name='Uniswap v3 Pools Info',
+                description='Pool info for many Uniswap v3 pools with their state fetched in batches',
+                category='protocol',
+                subcategory='uniswap-v3',
+                input=Contracts,
+                output=Some[UniswapV3PoolInfo])
+class UniswapV3GetPoolInfoMultiple(UniswapV3GetPoolInfo):
+    def run(self, input: Contracts) -> Some[UniswapV3PoolInfo]:
+        pool_addrs = [pool.address for pool in input]
+        snapshots = UniswapV3PoolSnapshot(self.context).get(pool_addrs)
+        return Some[UniswapV3PoolInfo](some=[self.pool_info(addr, snapshot)
+                                              for addr, snapshot in zip(pool_addrs, snapshots)
+                                              if snapshot is not None])
+
+
 @Model.describe(slug='uniswap-v3.get-pool-price-info',
                 version='1.18',
                 display_name='Uniswap v3 Token Pools Info for Price',
@@ -2,10 +2,11 @@
 import math
 from typing import List
 
+import numpy as np
 import pandas as pd
 from credmark.cmf.model import Model
-from credmark.cmf.model.errors import ModelDataError
-from credmark.cmf.types import Address, Position, Records, Token
+from credmark.cmf.model.errors import ModelDataError, ModelRunError, create_instance_from_error_dict
+from credmark.cmf.types import Address, MapBlocksOutput, Position, Records, Token
 from credmark.dto import DTO, DTOField
 
 from models.credmark.chain.contract import ContractEventsInput, ContractEventsOutput
@@ -213,8 +214,168 @@ def uniswap_v2_fee_sample_data():
 
 
 # pylint: disable=line-too-long
+class UniswapV2LPFeeAccumulator:
+    """
+    Position and fee history of an LP in a V2 pool, computed from the Transfer events of the LP.
+
+    LP balance is the running sum of the transfers. The pool's token amounts per LP token are read
+    for all blocks with transfers in one compose.map-blocks over uniswap-v2.lp-pos, and kept per pool
+    so that a later query, before or after the earlier ones, reads only the blocks not seen yet.
+    """
+
+    FEE_COLUMNS = ['token0_lp', 'token1_lp',
+                   'in_out_amount0', 'in_out_amount1',
+                   'token0_lp_current', 'token1_lp_current',
+                   'token0_fee', 'token1_fee']
+
+    Q_COLS = ["transaction_hash",
+              "block_number",
+              "log_index",
+              "from_address",
+              "to_address",
+              "transaction_value"]
+
+    # (chain id, pool) => {block number: (token0, token1) per 1e18 LP token}
+    POOL_STATES: dict[tuple[int, Address], dict[int, tuple[float, float]]] = {}
+    MAX_POOLS = 100
+    MAX_BLOCKS_PER_POOL = 100_000
+
+    def __init__(self, context, pool: Token, lp: Address, token0: Token, token1: Token):
+        self.context = context
+        self.pool = pool
+        self.lp = lp
+        self.token0 = token0
+        self.token1 = token1
+        self.key = (context.chain_id, pool.address)
+
+    def fetch_transfers(self, from_block: int) -> pd.DataFrame:
+        assert self.pool.abi
+
+        def _fetch(argument_filters):
+            return self.context.run_model(
+                'contract.events',
+                ContractEventsInput(
+                    address=self.pool.address,
+                    event_name='Transfer',
+                    event_abi=self.pool.abi.events.Transfer.raw_abi,
+                    argument_filters=argument_filters,
+                    from_block=from_block),
+                return_type=ContractEventsOutput).records.to_dataframe()
+
+        minted = _fetch({'to': str(self.lp.checksum)})
+        burnt = _fetch({'from': str(self.lp.checksum)})
+
+        df_empty = pd.DataFrame(
+            data=[],
+            columns=['transactionHash', 'blockNumber', 'logIndex', 'from', 'to', 'value'])
+
+        return (pd.concat(
+            [minted.loc[:, ['transactionHash', 'blockNumber', 'logIndex', 'from', 'to', 'value']] if not minted.empty else df_empty,
+             (burnt.loc[:, ['transactionHash', 'blockNumber', 'logIndex', 'from', 'to', 'value']].assign(
+                 value=lambda x: -x.value) if not burnt.empty else df_empty)
+             ])
+            .sort_values(['blockNumber', 'logIndex'])
+            .rename(columns={
+                'transactionHash': 'transaction_hash',
+                'blockNumber': 'block_number',
+                'logIndex': 'log_index',
+                'from': 'from_address',
+                'to': 'to_address',
+                'value': 'transaction_value'})
+            .reset_index(drop=True))
+
+    def get_pool_state(self, block_numbers: List[int]) -> pd.DataFrame:
+        """
+        Token amounts per 1e18 LP token at the end of each block.
+        """
+        pool_states = self.POOL_STATES.get(self.key)
+        if pool_states is None:
+            while len(self.POOL_STATES) >= self.MAX_POOLS:
+                del self.POOL_STATES[next(iter(self.POOL_STATES))]
+            pool_states = self.POOL_STATES[self.key] = {}
+
+        missing = sorted(set(block_numbers) - pool_states.keys())
+        if len(missing) > 0:
+            lp_pos_run = self.context.run_model(
+                'compose.map-blocks',
+                {'modelSlug': 'uniswap-v2.lp-pos',
+                 'modelInput': UniswapV2LPQuantityInput(pool=self.pool, lp_balance=1e18),
+                 'blockNumbers': missing},
+                return_type=MapBlocksOutput[UniswapV2LPOutput])
+            for r in lp_pos_run.results:
+                if r.output is None:
+                    if r.error is not None:
+                        raise create_instance_from_error_dict(r.error.dict())
+                    raise ModelRunError('compose.map-blocks: output/error cannot be both None')
+                while len(pool_states) >= self.MAX_BLOCKS_PER_POOL:
+                    del pool_states[next(iter(pool_states))]
+                pool_states[int(r.blockNumber)] = (r.output.tokens[0].amount, r.output.tokens[1].amount)
+
+        return pd.DataFrame([(block_number, *pool_states[block_number]) for block_number in block_numbers],
+                            columns=['block_number', 'amount0', 'amount1'])
+
+    def calculate_fee(self, df_rows: pd.DataFrame):
+        """
+        Fee columns for the transfer rows of the LP, starting from no position.
+        """
+        # LP balance at the end of each row's block
+        lp_balances = df_rows['transaction_value'].astype(object).cumsum()
+        lp_balances = lp_balances.groupby(df_rows['block_number']).transform('last').astype(float)
+
+        df_state = (df_rows[['block_number']]
+                    .merge(self.get_pool_state(df_rows['block_number'].unique().tolist()),
+                           on='block_number', how='left'))
+        amount0 = df_state['amount0'].to_numpy()
+        amount1 = df_state['amount1'].to_numpy()
+        transaction_value = df_rows['transaction_value'].to_numpy(dtype=float)
+
+        ratio = amount1 / amount0
+
+        # LP position at block_number from LP token (with fee)
+        token0_lp = amount0 * lp_balances.to_numpy() / 1e18
+        token1_lp = amount1 * lp_balances.to_numpy() / 1e18
+
+        # Position implied from previous LP position (without fee)
+        # Uniswap V2 has compounding effect for the fee
+        prev_token0 = np.concatenate([[0.0], token0_lp[:-1]])
+        prev_token1 = np.concatenate([[0.0], token1_lp[:-1]])
+        token0_lp_current = (prev_token0 * prev_token1 / ratio) ** 0.5
+        token1_lp_current = token0_lp_current * ratio
+
+        # LP position from recent deposit/withdraw (no contribution to fee)
+        in_out_amount0 = amount0 * transaction_value / 1e18
+        in_out_amount1 = amount1 * transaction_value / 1e18
+
+        # fee = With fee - Without fee - Just-in
+        df_fee = pd.DataFrame({
+            'token0_lp': token0_lp,
+            'token1_lp': token1_lp,
+            'in_out_amount0': in_out_amount0,
+            'in_out_amount1': in_out_amount1,
+            'token0_lp_current': token0_lp_current,
+            'token1_lp_current': token1_lp_current,
+            'token0_fee': token0_lp - token0_lp_current - in_out_amount0,
+            'token1_fee': token1_lp - token1_lp_current - in_out_amount1,
+        }, index=df_rows.index).apply(lambda col: col.map(try_zero))
+
+        return pd.concat([df_rows, df_fee], axis=1)
+
+    def history(self) -> pd.DataFrame:
+        block_number = int(self.context.block_number)
+
+        df_history = self.fetch_transfers(0)
+        if df_history.empty:
+            return df_history.loc[:, self.Q_COLS]
+
+        if df_history['block_number'].iloc[-1] != block_number:
+            new_row = pd.DataFrame([('', block_number, -1, self.lp, self.lp, 0)], columns=self.Q_COLS)
+            df_history = pd.concat([df_history, new_row], ignore_index=True)
+
+        return self.calculate_fee(df_history)
+
+
 @Model.describe(slug='uniswap-v2.lp-fee-history',
-                version='1.2',
+                version='1.3',
                 display_name='Uniswap v2 (SushiSwap) LP Position and Fee history for account',
                 description='Returns LP Position and Fee history for account',
                 category='protocol',
@@ -236,123 +397,7 @@ class UniswapV2LPFeeHistory(Model):
         token0 = token0.as_erc20(set_loaded=True)
         token1 = token1.as_erc20(set_loaded=True)
 
-        q_cols = ["transaction_hash",
-                  "block_number",
-                  "log_index",
-                  "from_address",
-                  "to_address",
-                  "transaction_value"]
-
-        def _use_model():
-            return self.context.run_model('account.token-transfer',
-                                          input={'address': lp,
-                                                 'tokens': [pool.address]},
-                                          return_type=Records).to_dataframe()
-
-        # _df = _use_model().rename(columns={'value': 'transaction_value'})[q_cols]
-        # _df.loc[1:, 'transaction_value'] = -1 * (_df.loc[0, 'transaction_value'])
-
-        def _use_events():
-            def _use_fetch_events():
-                minted = pd.DataFrame(pool.fetch_events(
-                    pool.events.Transfer,
-                    argument_filters={'to': lp.checksum},
-                    from_block=0,
-                    to_block=self.context.block_number,
-                    contract_address=pool.address.checksum))
-                burnt = pd.DataFrame(pool.fetch_events(
-                    pool.events.Transfer,
-                    argument_filters={'from': lp.checksum},
-                    from_block=0,
-                    to_block=self.context.block_number,
-                    contract_address=pool.address.checksum))
-                if not minted.empty:
-                    minted = minted.assign(
-                        transactionHash=lambda r: r.transactionHash.apply(lambda x: x.hex()))
-                if not burnt.empty:
-                    burnt = burnt.assign(
-                        transactionHash=lambda r: r.transactionHash.apply(lambda x: x.hex()))
-                return minted, burnt
-
-            def use_contract_events():
-                assert pool.abi
-                minted = self.context.run_model(
-                    'contract.events',
-                    ContractEventsInput(
-                        address=pool.address,
-                        event_name='Transfer',
-                        event_abi=pool.abi.events.Transfer.raw_abi,
-                        argument_filters={'to': str(lp.checksum)},
-                        from_block=0),
-                    return_type=ContractEventsOutput).records.to_dataframe()
-                burnt = self.context.run_model(
-                    'contract.events',
-                    ContractEventsInput(
-                        address=pool.address,
-                        event_name='Transfer',
-                        event_abi=pool.abi.events.Transfer.raw_abi,
-                        argument_filters={'from': str(lp.checksum)},
-                        from_block=0),
-                    return_type=ContractEventsOutput).records.to_dataframe()
-                return minted, burnt
-
-            minted, burnt = use_contract_events()
-
-            df_empty = pd.DataFrame(
-                data=[],
-                columns=['transactionHash', 'blockNumber', 'logIndex', 'from', 'to', 'value'])
-
-            df_combined = (pd.concat(
-                [minted.loc[:, ['transactionHash', 'blockNumber', 'logIndex', 'from', 'to', 'value']] if not minted.empty else df_empty,
-                 (burnt.loc[:, ['transactionHash', 'blockNumber', 'logIndex', 'from', 'to', 'value']].assign(
-                     value=lambda x: -x.value) if not burnt.empty else df_empty)
-                 ])
-                .sort_values(['blockNumber', 'logIndex'])
-                .rename(columns={
-                    'transactionHash': 'transaction_hash',
-                    'blockNumber': 'block_number',
-                    'logIndex': 'log_index',
-                    'from': 'from_address',
-                    'to': 'to_address',
-                    'value': 'transaction_value'})
-                .reset_index(drop=True))
-
-            return df_combined
-
-        # _df = _use_ledger()
-        _df = _use_events()
-
-        if _df.empty:
-            return Records.from_dataframe(_df)
-
-        if (_df["block_number"].tail(1) != int(self.context.block_number)).all():
-            new_row = [('', int(self.context.block_number), -
-                        1, input.lp, input.lp, 0)]
-            _df = pd.concat(
-                [_df, pd.DataFrame(new_row, columns=q_cols)]).reset_index(drop=True)
-
-        lp_prev_token0 = 0
-        lp_prev_token1 = 0
-
-        for row_n, row_data in _df.iterrows():
-            # Uniswap V2 has compounding effect for the fee
-            # fee = current lp position - IL'ed position from previous lp position - current addition/removal
-            block_number = row_data['block_number']
-            transaction_value = row_data['transaction_value']
-
-            v2_fee = calculate_v2_fee(
-                self.context, pool, lp, block_number, transaction_value,
-                lp_prev_token0, lp_prev_token1)
-
-            lp_prev_token0 = v2_fee['token0_lp']
-            lp_prev_token1 = v2_fee['token1_lp']
-
-            for it in ['token0_lp', 'token1_lp',
-                       'in_out_amount0', 'in_out_amount1',
-                       'token0_lp_current', 'token1_lp_current',
-                       'token0_fee', 'token1_fee']:
-                _df.loc[row_n, it] = try_zero(v2_fee[it])  # type: ignore
-
+        _df = UniswapV2LPFeeAccumulator(self.context, pool, lp, token0, token1).history()
         return Records.from_dataframe(_df)
 
 
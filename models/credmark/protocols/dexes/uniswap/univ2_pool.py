@@ -8,10 +8,10 @@ from typing import Optional
 
 import numpy as np
 from credmark.cmf.model import ModelContext
-from credmark.cmf.model.errors import ModelDataError
-from credmark.cmf.types import Address, Contract, Maybe, Token
+from credmark.cmf.types import Address, Contract
 
 from models.credmark.protocols.dexes.uniswap.uni_pool_base import UniswapPoolBase
+from models.credmark.tokens.token_metadata import TokenMetadataResolver
 from models.dtos.pool import PoolPriceInfoWithVolume
 from models.tmp_abi_lookup import UNISWAP_V2_POOL_ABI
 
@@ -47,65 +47,14 @@ class UniV2Pool(UniswapPoolBase):
 
         context = ModelContext.current_context()
 
-        try:
-            self.token0 = Token(Address(self.token0_addr).checksum)
-            self.token0_decimals = self.token0.decimals
-            self.token0_symbol = self.token0.symbol
-        except (ModelDataError, OverflowError):
-            try:
-                self.token0 = Token(Address(
-                    self.token0_addr).checksum).as_erc20(set_loaded=True, use_alt=True)
-                self.token0_decimals = self.token0.decimals
-                self.token0_symbol = self.token0.symbol
-            except (ModelDataError, OverflowError):
-                try:
-                    self.token0 = Token(Address(
-                        self.token0_addr).checksum).as_erc20(set_loaded=True)
-                    self.token0_decimals = self.token0.decimals
-                    self.token0_symbol = self.token0.symbol
-                except (ModelDataError, OverflowError):
-                    deployment = context.run_model(
-                        'token.deployment-maybe', {'address': self.token0_addr}, return_type=Maybe[dict])
-                    if not deployment.just:
-                        raise ValueError(
-                            f"Unable to find token deployment for {self.token0}") from None
-
-                    deployment_block_number = deployment.just["deployed_block_number"]
-                    with context.fork(block_number=deployment_block_number) as _past_context:
-                        self.token0 = Token(Address(
-                            self.token0_addr).checksum).as_erc20(set_loaded=True)
-                        self.token0_decimals = self.token0.decimals
-                        self.token0_symbol = self.token0.symbol
-
-        try:
-            self.token1 = Token(Address(self.token1_addr).checksum)
-            self.token1_decimals = self.token1.decimals
-            self.token1_symbol = self.token1.symbol
-        except (ModelDataError, OverflowError):
-            try:
-                self.token1 = Token(address=Address(
-                    self.token1_addr).checksum).as_erc20(set_loaded=True, use_alt=True)
-                self.token1_decimals = self.token1.decimals
-                self.token1_symbol = self.token1.symbol
-            except (ModelDataError, OverflowError):
-                try:
-                    self.token1 = Token(address=Address(
-                        self.token1_addr).checksum).as_erc20(set_loaded=True)
-                    self.token1_decimals = self.token1.decimals
-                    self.token1_symbol = self.token1.symbol
-                except (ModelDataError, OverflowError):
-                    deployment = context.run_model(
-                        'token.deployment-maybe', {'address': self.token1_addr}, return_type=Maybe[dict])
-                    if not deployment.just:
-                        raise ValueError(
-                            f"Unable to find token deployment for {self.token1}") from None
-
-                    deployment_block_number = deployment.just["deployed_block_number"]
-                    with context.fork(block_number=deployment_block_number) as _past_context:
-                        self.token1 = Token(address=Address(
-                            self.token1_addr).checksum).as_erc20(set_loaded=True)
-                        self.token1_decimals = self.token1.decimals
-                        self.token1_symbol = self.token1.symbol
+        token0_meta, token1_meta = TokenMetadataResolver(context).resolve(
+            [Address(self.token0_addr), Address(self.token1_addr)])
+        self.token0 = token0_meta['token']
+        self.token0_decimals = token0_meta['decimals']
+        self.token0_symbol = token0_meta['symbol']
+        self.token1 = token1_meta['token']
+        self.token1_decimals = token1_meta['decimals']
+        self.token1_symbol = token1_meta['symbol']
 
         if _pool_data is None:
             self.reserve0 = 0
@@ -196,6 +145,12 @@ class UniV2Pool(UniswapPoolBase):
         self.reserve0 = _pool_data['reserve0']
         self.reserve1 = _pool_data['reserve1']
 
+    def checkpoint_state(self):
+        return self.save(), {}, {}
+
+    def restore_checkpoint(self, state, _arrays):
+        self.load(state)
+
     def get_pool_price_info(self):
         full_tick_liquidity0 = self.token0.scaled(self.reserve0)
         full_tick_liquidity1 = self.token1.scaled(self.reserve1)
@@ -255,7 +210,7 @@ class UniV2Pool(UniswapPoolBase):
         return pool_price_info
 
     def proc_events(self, df_events):
-        for _n, event_row in df_events.iterrows():
+        for _n, event_row in self.events_after_state(df_events).iterrows():
             self.block_number = event_row['blockNumber']
             self.log_index = event_row['logIndex']
 
@@ -270,6 +225,8 @@ class UniV2Pool(UniswapPoolBase):
             else:
                 raise ValueError(f'Unknown event {event_row["event"]}')
 
+        self.save_checkpoint()
+
     def proc_sync(self, event_row):
         self.reserve0 = event_row['reserve0']
         self.reserve1 = event_row['reserve1']
@@ -1,4 +1,4 @@
-# pylint: disable = line-too-long
+# pylint: disable = line-too-long, invalid-name
 
 # LP Profit/loss = Rebalancing Profit/loss - LVR + Trading fee income
 
@@ -21,6 +21,8 @@
 # In DEX, we sold some risky asset $d_{x_t}$ with a mix of both prices
 # In CEX, we can rebalance directly at price $P_t + d P_t$ and sell $d_{x_t}$
 
+import numpy as np
+
 
 def calc_fee(amount, fee):
     return amount * fee
@@ -72,3 +74,54 @@ def lvr(row, which_token):
         raise ValueError("which_token must be 0 or 1")
 
     raise ValueError(f"Unhandled amount0/amount1 {row.amount0_scaled}/{row.amount1_scaled}")
+
+
+# Column versions of calc_swap_price and lvr, NaN where calc_swap_price/lvr return None.
+
+def calc_swap_price_columns(amount0_scaled, amount1_scaled, fee, which_token):
+    amount0_scaled = np.asarray(amount0_scaled, dtype=np.float64)
+    amount1_scaled = np.asarray(amount1_scaled, dtype=np.float64)
+
+    if which_token == 0:
+        amount_in, amount_out = amount1_scaled, amount0_scaled
+    elif which_token == 1:
+        amount_in, amount_out = amount0_scaled, amount1_scaled
+    else:
+        raise ValueError("which_token must be 0 or 1")
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        swap_price = np.where(amount_in > 0,
+                              amount_in * (1 - fee) / - amount_out,
+                              - amount_in / amount_out / (1 - fee))
+    return np.where((amount0_scaled == 0) | (amount1_scaled == 0), np.nan, swap_price)
+
+
+def lvr_columns(df, which_token):
+    """
+    lvr over the swap columns: amount0_scaled, amount1_scaled, token0_price, token1_price, swap0_price, swap1_price
+    """
+    if which_token not in (0, 1):
+        raise ValueError("which_token must be 0 or 1")
+
+    amount0_scaled = df.amount0_scaled.to_numpy(dtype=np.float64)
+    amount1_scaled = df.amount1_scaled.to_numpy(dtype=np.float64)
+    no_swap = (amount0_scaled == 0) | (amount1_scaled == 0)
+    sell0 = amount0_scaled <= 0
+    sell1 = amount1_scaled < 0
+
+    unhandled = ~no_swap & ~sell0 & ~sell1
+    if unhandled.any():
+        pos = np.flatnonzero(unhandled)[0]
+        raise ValueError(f"Unhandled amount0/amount1 {amount0_scaled[pos]}/{amount1_scaled[pos]}")
+
+    token0_price = df.token0_price.to_numpy(dtype=np.float64)
+    token1_price = df.token1_price.to_numpy(dtype=np.float64)
+    with np.errstate(invalid='ignore', over='ignore'):
+        lvr_sell0 = - amount0_scaled * (token0_price - df.swap0_price.to_numpy(dtype=np.float64))
+        lvr_sell1 = - amount1_scaled * (token1_price - df.swap1_price.to_numpy(dtype=np.float64))
+        if which_token == 0:
+            lvr_sell0 = lvr_sell0 * token1_price
+        else:
+            lvr_sell1 = lvr_sell1 * token0_price
+
+    return np.where(no_swap, np.nan, np.where(sell0, lvr_sell0, lvr_sell1))
@@ -170,3 +170,67 @@ def calculate_onetick_liquidity(
             one_tick_liquidity1_adj,
             adjusted_in_tick_amount0,
             adjusted_in_tick_amount1)
+
+
+# Array versions of the float helpers, for analysis over many rows.
+
+def tick_to_price_array(ticks):
+    """
+    tick_to_price over an array, in float. Agrees with tick_to_price up to the last bit of rounding.
+    """
+    return np.power(UNISWAP_TICK, np.asarray(ticks, dtype=np.float64))
+
+
+def sqrt_price_x_96_to_price_array(sqrt_prices_x_96, token0_decimals, token1_decimals):
+    """
+    sqrt_price_x_96_to_price over an array, in float. Zero sqrt price gives zero price.
+    """
+    sqrt_prices = np.asarray(sqrt_prices_x_96, dtype=object).astype(np.float64) / Q96
+    return sqrt_prices * sqrt_prices * 10.0 ** (token0_decimals - token1_decimals)
+
+
+def calculate_onetick_liquidity_array(current_tick, tick_spacing, liquidity, liquidity_net):
+    """
+    calculate_onetick_liquidity over arrays of pool states, before scaling to the tokens' units.
+
+    Returns (one_tick_liquidity0, one_tick_liquidity1, in_tick_amount0, in_tick_amount1).
+    """
+    current_tick = np.asarray(current_tick, dtype=np.int64)
+    liquidity = np.asarray(liquidity, dtype=object)
+    liquidity_net = np.asarray(liquidity_net, dtype=object)
+    liquidity_float = liquidity.astype(np.float64)
+
+    tick_bottom = current_tick // tick_spacing * tick_spacing
+    tick_top = tick_bottom + tick_spacing
+
+    sa = tick_to_price_array(tick_bottom / 2)
+    sb = tick_to_price_array(tick_top / 2)
+    # np.power, not ** that takes np.sqrt, to round as tick_to_price(tick) ** 0.5
+    sp = np.power(tick_to_price_array(current_tick), 0.5)
+
+    in_tick_amount0 = np.trunc(liquidity_float * (sb - sp) / (sb * sp))
+    in_tick_amount1 = np.trunc(liquidity_float * (sp - sa))
+
+    ratio_left = (in_tick_amount0 + liquidity_float / sb) * (in_tick_amount1 + liquidity_float * sa)
+    ratio_right = liquidity_float * liquidity_float
+    with np.errstate(divide='ignore', invalid='ignore'):
+        assert (np.isclose(ratio_left, ratio_right) |
+                ((0.99 < ratio_left / ratio_right) & (ratio_left / ratio_right < 1.01))).all()
+
+    sa_p = tick_to_price_array((current_tick - 1) / 2)
+    sb_p = tick_to_price_array((current_tick + 1) / 2)
+
+    at_bottom = current_tick == tick_bottom
+    at_top = current_tick == tick_top
+    tick1_amount0 = np.trunc(
+        np.where(at_top, (liquidity + liquidity_net).astype(np.float64), liquidity_float) *
+        (sb_p - sp) / (sb_p * sp))
+    tick1_amount1 = np.trunc(
+        np.where(at_bottom, (liquidity - liquidity_net).astype(np.float64), liquidity_float) *
+        (sp - sa_p))
+
+    # We match the two tokens' liquidity for the minimal available, a fix for the illiquid pools.
+    tick1_amount0_adj = np.minimum(tick1_amount0, tick1_amount1 / sp / sp)
+    tick1_amount1_adj = np.minimum(tick1_amount0 * sp * sp, tick1_amount1)
+
+    return tick1_amount0_adj, tick1_amount1_adj, in_tick_amount0, in_tick_amount1
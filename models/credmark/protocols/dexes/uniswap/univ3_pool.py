@@ -6,24 +6,26 @@ Uni V3 Pool
 
 import math
 import sys
-from functools import partial
 from typing import Optional, cast
 
+import numpy as np
 import pandas as pd
 from credmark.cmf.model import ModelContext
-from credmark.cmf.model.errors import ModelDataError
-from credmark.cmf.types import Address, Contract, Maybe, Token
+from credmark.cmf.types import Address, Contract
 from credmark.dto import DTO
 
 from models.credmark.protocols.dexes.uniswap.uni_pool_base import UniswapPoolBase, fetch_events_with_cols
 from models.credmark.protocols.dexes.uniswap.uniswap_v3_pool import fix_univ3_pool
-from models.credmark.protocols.dexes.uniswap.univ3_lvr import calc_fee, calc_swap_price, lvr
+from models.credmark.protocols.dexes.uniswap.univ3_lvr import calc_fee, calc_swap_price_columns, lvr_columns
 from models.credmark.protocols.dexes.uniswap.univ3_math import (
+    UNISWAP_V3_MIN_TICK,
     calculate_onetick_liquidity,
+    calculate_onetick_liquidity_array,
     in_range,
     out_of_range,
-    sqrt_price_x_96_to_price,
+    sqrt_price_x_96_to_price_array,
 )
+from models.credmark.tokens.token_metadata import TokenMetadataResolver
 from models.dtos.pool import PoolPriceInfoWithVolume
 
 
@@ -42,6 +44,63 @@ class Tick(DTO):
         return self.liquidityGross == 0 and self.liquidityNet == 0
 
 
+class TickTable:
+    """
+    Initialized ticks held as arrays sorted by tick index.
+
+    Liquidity values are kept as Python integers (object arrays) as they are
+    uint128/int128 on chain and do not fit in int64.
+    """
+
+    def __init__(self, ticks=None, liquidity_gross=None, liquidity_net=None):
+        self.ticks = np.asarray([] if ticks is None else ticks, dtype=np.int64)
+        self.liquidity_gross = np.asarray([] if liquidity_gross is None else liquidity_gross, dtype=object)
+        self.liquidity_net = np.asarray([] if liquidity_net is None else liquidity_net, dtype=object)
+
+    def __len__(self):
+        return self.ticks.shape[0]
+
+    @classmethod
+    def from_dict(cls, ticks: dict):
+        sorted_ticks = sorted(ticks)
+        return cls(sorted_ticks,
+                   [ticks[t].liquidityGross for t in sorted_ticks],
+                   [ticks[t].liquidityNet for t in sorted_ticks])
+
+    def to_dict(self) -> dict:
+        return {int(t): Tick(liquidityGross=g, liquidityNet=n)
+                for t, g, n in zip(self.ticks, self.liquidity_gross, self.liquidity_net)}
+
+    def lookup_net(self, ticks: np.ndarray) -> np.ndarray:
+        """
+        liquidityNet for each of the ticks, 0 for uninitialized ticks
+        """
+        ticks = np.asarray(ticks, dtype=np.int64)
+        result = np.zeros(ticks.shape[0], dtype=object)
+        if len(self) == 0 or ticks.shape[0] == 0:
+            return result
+        pos = np.searchsorted(self.ticks, ticks).clip(max=len(self) - 1)
+        found = self.ticks[pos] == ticks
+        result[found] = self.liquidity_net[pos[found]]
+        return result
+
+    def apply(self, ticks: np.ndarray, gross_delta: np.ndarray, net_delta: np.ndarray):
+        """
+        Add liquidity changes to the table and drop the ticks left with no liquidity.
+        """
+        all_ticks, inverse = np.unique(np.concatenate([self.ticks, np.asarray(ticks, dtype=np.int64)]),
+                                       return_inverse=True)
+        gross = np.zeros(all_ticks.shape[0], dtype=object)
+        net = np.zeros(all_ticks.shape[0], dtype=object)
+        np.add.at(gross, inverse, np.concatenate([self.liquidity_gross, gross_delta]))
+        np.add.at(net, inverse, np.concatenate([self.liquidity_net, net_delta]))
+
+        keep = (gross != 0) | (net != 0)
+        self.ticks = all_ticks[keep]
+        self.liquidity_gross = gross[keep]
+        self.liquidity_net = net[keep]
+
+
 class UniV3Pool(UniswapPoolBase):
     """
     Uniswap V3 Pool
@@ -77,65 +136,14 @@ class UniV3Pool(UniswapPoolBase):
 
         context = ModelContext.current_context()
 
-        try:
-            self.token0 = Token(Address(self.token0_addr).checksum)
-            self.token0_decimals = self.token0.decimals
-            self.token0_symbol = self.token0.symbol
-        except (ModelDataError, OverflowError):
-            try:
-                self.token0 = Token(Address(
-                    self.token0_addr).checksum).as_erc20(set_loaded=True, use_alt=True)
-                self.token0_decimals = self.token0.decimals
-                self.token0_symbol = self.token0.symbol
-            except (ModelDataError, OverflowError):
-                try:
-                    self.token0 = Token(Address(
-                        self.token0_addr).checksum).as_erc20(set_loaded=True)
-                    self.token0_decimals = self.token0.decimals
-                    self.token0_symbol = self.token0.symbol
-                except (ModelDataError, OverflowError):
-                    deployment = context.run_model(
-                        'token.deployment-maybe', {'address': self.token0_addr}, return_type=Maybe[dict])
-                    if not deployment.just:
-                        raise ValueError(
-                            f"Unable to find token deployment for {self.token0}") from None
-
-                    deployment_block_number = deployment.just["deployed_block_number"]
-                    with context.fork(block_number=deployment_block_number) as _past_context:
-                        self.token0 = Token(Address(
-                            self.token0_addr).checksum).as_erc20(set_loaded=True)
-                        self.token0_decimals = self.token0.decimals
-                        self.token0_symbol = self.token0.symbol
-
-        try:
-            self.token1 = Token(Address(self.token1_addr).checksum)
-            self.token1_decimals = self.token1.decimals
-            self.token1_symbol = self.token1.symbol
-        except (ModelDataError, OverflowError):
-            try:
-                self.token1 = Token(address=Address(
-                    self.token1_addr).checksum).as_erc20(set_loaded=True, use_alt=True)
-                self.token1_decimals = self.token1.decimals
-                self.token1_symbol = self.token1.symbol
-            except (ModelDataError, OverflowError):
-                try:
-                    self.token1 = Token(address=Address(
-                        self.token1_addr).checksum).as_erc20(set_loaded=True)
-                    self.token1_decimals = self.token1.decimals
-                    self.token1_symbol = self.token1.symbol
-                except (ModelDataError, OverflowError):
-                    deployment = context.run_model(
-                        'token.deployment-maybe', {'address': self.token1_addr}, return_type=Maybe[dict])
-                    if not deployment.just:
-                        raise ValueError(
-                            f"Unable to find token deployment for {self.token1}") from None
-
-                    deployment_block_number = deployment.just["deployed_block_number"]
-                    with context.fork(block_number=deployment_block_number) as _past_context:
-                        self.token1 = Token(address=Address(
-                            self.token1_addr).checksum).as_erc20(set_loaded=True)
-                        self.token1_decimals = self.token1.decimals
-                        self.token1_symbol = self.token1.symbol
+        token0_meta, token1_meta = TokenMetadataResolver(context).resolve(
+            [Address(self.token0_addr), Address(self.token1_addr)])
+        self.token0 = token0_meta['token']
+        self.token0_decimals = token0_meta['decimals']
+        self.token0_symbol = token0_meta['symbol']
+        self.token1 = token1_meta['token']
+        self.token1_decimals = token1_meta['decimals']
+        self.token1_symbol = token1_meta['symbol']
 
         if _pool_data is None:
             self.pool_tick = None
@@ -296,6 +304,16 @@ class UniV3Pool(UniswapPoolBase):
         self.token0_flash = _pool_data.get('token0_flash', 0)
         self.token1_flash = _pool_data.get('token1_flash', 0)
 
+    def checkpoint_state(self):
+        tick_table = TickTable.from_dict(self.ticks)
+        return ({k: v for k, v in self.save().items() if k != 'ticks'},
+                {'liquidity_gross': tick_table.liquidity_gross, 'liquidity_net': tick_table.liquidity_net},
+                {'ticks': tick_table.ticks})
+
+    def restore_checkpoint(self, state, arrays):
+        self.load(state | {'ticks': {}})
+        self.ticks = TickTable(arrays['ticks'], arrays['liquidity_gross'], arrays['liquidity_net']).to_dict()
+
     def _self_check_events(self, df_comb_evt):
         token0_balance = \
             sum(self.df_evt['Mint'].amount0.to_list()) - \
@@ -335,11 +353,12 @@ class UniV3Pool(UniswapPoolBase):
 
         return price0, price1
 
-    def get_pool_price_info(self):
-        if self.pool_tick is not None and self.pool_tick in self.ticks:
-            _liquidityNet = self.ticks[self.pool_tick].liquidityNet
-        else:
-            _liquidityNet = 0
+    def get_pool_price_info(self, _liquidityNet=None):
+        if _liquidityNet is None:
+            if self.pool_tick is not None and self.pool_tick in self.ticks:
+                _liquidityNet = self.ticks[self.pool_tick].liquidityNet
+            else:
+                _liquidityNet = 0
 
         (one_tick_liquidity0_adj, one_tick_liquidity1_adj,
          adjusted_in_tick_amount0, adjusted_in_tick_amount1) = calculate_onetick_liquidity(
@@ -439,27 +458,321 @@ class UniV3Pool(UniswapPoolBase):
 
         return pool_price_info
 
-    def proc_events(self, df_events):
-        for _n, event_row in df_events.iterrows():
-            self.block_number = event_row['blockNumber']
-            self.log_index = event_row['logIndex']
-
-            if event_row['event'] == 'Initialize':
-                yield self.proc_initialize(event_row)
-            elif event_row['event'] == 'Burn':
-                yield self.proc_burn(event_row)
-            elif event_row['event'] == 'Mint':
-                yield self.proc_mint(event_row)
-            elif event_row['event'] == 'Swap':
-                yield self.proc_swap(event_row)
-            elif event_row['event'] == 'Collect':
-                yield self.proc_collect(event_row)
-            elif event_row['event'] == 'CollectProtocol':
-                yield self.proc_collect_prot(event_row)
-            elif event_row['event'] == 'Flash':
-                yield self.proc_flash(event_row)
+    REPLAY_COUNTERS = ['token0_in', 'token0_out', 'token1_in', 'token1_out',
+                       'token0_add', 'token0_remove', 'token0_collect', 'token0_collect_prot',
+                       'token1_add', 'token1_remove', 'token1_collect', 'token1_collect_prot',
+                       'token0_flash', 'token1_flash', 'token0_reserve', 'token1_reserve']
+
+    PRICE_INFO_COUNTERS = ['token0_in', 'token0_out', 'token1_in', 'token1_out',
+                           'token0_add', 'token0_remove', 'token0_collect', 'token0_collect_prot',
+                           'token1_add', 'token1_remove', 'token1_collect', 'token1_collect_prot']
+
+    @staticmethod
+    def _event_col(df_events, name, mask):
+        """
+        Integer values of the column for the events in the mask, 0 for the others
+        """
+        values = np.zeros(df_events.shape[0], dtype=object)
+        if name in df_events and mask.any():
+            values[mask] = [int(v) for v in df_events[name].to_numpy()[mask]]
+        return values
+
+    @staticmethod
+    def _ffill(values, mask, initial):
+        """
+        Values carried forward from the last event in the mask, and the index of that event (-1 for none)
+        """
+        n_events = mask.shape[0]
+        last_set = np.maximum.accumulate(np.where(mask, np.arange(n_events), -1))
+        filled = np.full(n_events, initial, dtype=object)
+        filled[last_set >= 0] = values[last_set[last_set >= 0]]
+        return filled, last_set
+
+    def _replay_price(self, df_events, is_event):
+        """
+        Tick and price after each event, they are only set by Initialize and Swap.
+        """
+        is_set_price = is_event['Initialize'] | is_event['Swap']
+        pool_tick, _ = self._ffill(self._event_col(df_events, 'tick', is_set_price),
+                                   is_set_price, self.pool_tick)
+        pool_sqrtPrice, _ = self._ffill(self._event_col(df_events, 'sqrtPriceX96', is_set_price),
+                                        is_set_price, self.pool_sqrtPrice)
+        return pool_tick, pool_sqrtPrice
+
+    def _replay_liquidity(self, df_events, is_event, pool_tick, has_tick):
+        """
+        Pool liquidity after each event: the liquidity of the last Swap plus the Mint/Burn
+        in range of the current tick since then.
+        """
+        is_mint = is_event['Mint']
+        is_burn = is_event['Burn']
+        is_position = is_mint | is_burn
+        is_set_price = is_event['Initialize'] | is_event['Swap']
+
+        tick_lower = self._event_col(df_events, 'tickLower', is_position)
+        tick_upper = self._event_col(df_events, 'tickUpper', is_position)
+        amount = self._event_col(df_events, 'amount', is_position)
+        position_in_range = is_position & has_tick
+        position_in_range[position_in_range] = (
+            (tick_lower[position_in_range] <= pool_tick[position_in_range]) &
+            (pool_tick[position_in_range] < tick_upper[position_in_range])).astype(bool)
+        liquidity_delta = np.where(position_in_range & is_mint, amount, 0) - \
+            np.where(position_in_range & is_burn, amount, 0)
+        liquidity_cumsum = np.cumsum(liquidity_delta)
+
+        set_liquidity, last_set = self._ffill(self._event_col(df_events, 'liquidity', is_event['Swap']),
+                                              is_set_price,
+                                              self.pool_liquidity if self.pool_liquidity is not None else 0)
+        cumsum_at_set = np.zeros(df_events.shape[0], dtype=object)
+        cumsum_at_set[last_set >= 0] = liquidity_cumsum[last_set[last_set >= 0]]
+        return set_liquidity + liquidity_cumsum - cumsum_at_set
+
+    def _replay_tick_deltas(self, df_events, is_event):
+        """
+        Tick table changes: (event row, tick, liquidityGross delta, liquidityNet delta),
+        one for each of the lower and upper ticks of a Mint/Burn.
+        """
+        is_mint = is_event['Mint']
+        is_position = is_mint | is_event['Burn']
+        tick_lower = self._event_col(df_events, 'tickLower', is_position)
+        tick_upper = self._event_col(df_events, 'tickUpper', is_position)
+        amount = self._event_col(df_events, 'amount', is_position)
+
+        position_rows = np.flatnonzero(is_position)
+        signed_amount = np.where(is_mint, amount, -amount)[position_rows]
+        return (np.concatenate([position_rows, position_rows]),
+                np.concatenate([tick_lower[position_rows], tick_upper[position_rows]]).astype(np.int64),
+                np.concatenate([signed_amount, signed_amount]),
+                np.concatenate([signed_amount, -signed_amount]))
+
+    @staticmethod
+    def _replay_liquidity_net(tick_table, pool_tick, has_tick, delta_rows, delta_ticks, delta_net):
+        """
+        liquidityNet at the current tick after each event, from the starting table plus
+        the cumulative changes to that tick up to the event.
+        """
+        n_events = pool_tick.shape[0]
+        query_ticks = np.array([0 if t is None else t for t in pool_tick], dtype=np.int64)
+        liquidity_net = tick_table.lookup_net(query_ticks)
+        if delta_rows.shape[0] > 0:
+            key_scale = n_events + 1
+            delta_keys = (delta_ticks - UNISWAP_V3_MIN_TICK) * key_scale + delta_rows
+            order = np.argsort(delta_keys, kind='stable')
+            delta_keys = delta_keys[order]
+            sorted_ticks = delta_ticks[order]
+            sorted_net = np.cumsum(delta_net[order])
+            group_start = np.searchsorted(sorted_ticks, sorted_ticks)
+            net_before_group = np.zeros(sorted_net.shape[0], dtype=object)
+            net_before_group[group_start > 0] = sorted_net[group_start[group_start > 0] - 1]
+            group_net = sorted_net - net_before_group
+
+            query_keys = (query_ticks - UNISWAP_V3_MIN_TICK) * key_scale + np.arange(n_events)
+            pos = np.searchsorted(delta_keys, query_keys, side='right') - 1
+            found = (pos >= 0) & has_tick
+            found[found] = sorted_ticks[pos[found]] == query_ticks[found]
+            liquidity_net[found] = liquidity_net[found] + group_net[pos[found]]
+        liquidity_net[~has_tick] = 0
+        return liquidity_net
+
+    def _replay_counters(self, df_events, is_event):
+        """
+        Cumulative amounts after each event
+        """
+        swap0 = self._event_col(df_events, 'amount0', is_event['Swap'])
+        swap1 = self._event_col(df_events, 'amount1', is_event['Swap'])
+        mint0 = self._event_col(df_events, 'amount0', is_event['Mint'])
+        mint1 = self._event_col(df_events, 'amount1', is_event['Mint'])
+        collect0 = self._event_col(df_events, 'amount0', is_event['Collect'])
+        collect1 = self._event_col(df_events, 'amount1', is_event['Collect'])
+        prot0 = self._event_col(df_events, 'amount0', is_event['CollectProtocol'])
+        prot1 = self._event_col(df_events, 'amount1', is_event['CollectProtocol'])
+        paid0 = self._event_col(df_events, 'paid0', is_event['Flash'])
+        paid1 = self._event_col(df_events, 'paid1', is_event['Flash'])
+
+        deltas = {
+            'token0_in': np.where(swap0 > 0, swap0, 0),
+            'token0_out': np.where(swap0 < 0, -swap0, 0),
+            'token1_in': np.where(swap1 > 0, swap1, 0),
+            'token1_out': np.where(swap1 < 0, -swap1, 0),
+            'token0_add': mint0,
+            'token0_remove': self._event_col(df_events, 'amount0', is_event['Burn']),
+            'token0_collect': collect0,
+            'token0_collect_prot': prot0,
+            'token1_add': mint1,
+            'token1_remove': self._event_col(df_events, 'amount1', is_event['Burn']),
+            'token1_collect': collect1,
+            'token1_collect_prot': prot1,
+            'token0_flash': self._event_col(df_events, 'amount0', is_event['Flash']),
+            'token1_flash': self._event_col(df_events, 'amount1', is_event['Flash']),
+            # burn amounts only leave the pool with Collect
+            'token0_reserve': mint0 + swap0 - collect0 - prot0 + paid0,
+            'token1_reserve': mint1 + swap1 - collect1 - prot1 + paid1,
+        }
+        return {k: getattr(self, k) + np.cumsum(v) for k, v in deltas.items()}
+
+    def replay_events(self, df_events) -> tuple[pd.DataFrame, Optional[TickTable]]:
+        """
+        Replay events on column arrays. Return the pool state after each event and
+        the tick table after the last event.
+
+        Equivalent to applying proc_* row by row, except the reserves are derived from
+        the events only; proc_events() re-syncs them with balanceOf for each block.
+        The pool itself is not changed.
+        """
+        if df_events.empty:
+            return pd.DataFrame(), None
+
+        event = df_events['event'].to_numpy()
+        unknown = ~np.isin(event, self.EVENT_LIST)
+        if unknown.any():
+            raise ValueError(f'Unknown event {event[unknown][0]}')
+        is_event = {name: event == name for name in self.EVENT_LIST}
+
+        pool_tick, pool_sqrtPrice = self._replay_price(df_events, is_event)
+        has_tick = np.array([t is not None for t in pool_tick], dtype=bool)
+
+        delta_rows, delta_ticks, delta_gross, delta_net = self._replay_tick_deltas(df_events, is_event)
+        tick_table = TickTable.from_dict(self.ticks)
+        liquidity_net = self._replay_liquidity_net(
+            tick_table, pool_tick, has_tick, delta_rows, delta_ticks, delta_net)
+        tick_table.apply(delta_ticks, delta_gross, delta_net)
+
+        df_state = pd.DataFrame({
+            'blockNumber': df_events['blockNumber'].to_numpy(),
+            'logIndex': df_events['logIndex'].to_numpy(),
+            'event': event,
+            'pool_tick': pool_tick,
+            'pool_sqrtPrice': pool_sqrtPrice,
+            'pool_liquidity': self._replay_liquidity(df_events, is_event, pool_tick, has_tick),
+            'liquidityNet': liquidity_net,
+            **self._replay_counters(df_events, is_event)})
+
+        return df_state, tick_table
+
+    def _replay_reserves(self, block_numbers):
+        """
+        Balances of the pool at each block, from the cache or balanceOf
+        """
+        reserve0 = np.zeros(block_numbers.shape[0], dtype=object)
+        reserve1 = np.zeros(block_numbers.shape[0], dtype=object)
+        for block_number in pd.unique(block_numbers):
+            block_number = int(block_number)
+            self._call_balance += 1
+            try_balance = self._balance.get(block_number)
+            if try_balance:
+                self._call_balance_skip += 1
             else:
-                raise ValueError(f'Unknown event {event_row["event"]}')
+                context = ModelContext.current_context()
+                with context.fork(block_number=block_number):
+                    try_balance = (self.token0.balance_of(self.pool.address.checksum),
+                                   self.token1.balance_of(self.pool.address.checksum))
+                self._balance[block_number] = try_balance
+            at_block = block_numbers == block_number
+            reserve0[at_block] = try_balance[0]
+            reserve1[at_block] = try_balance[1]
+        return reserve0, reserve1
+
+    def replay_price_info(self, df_state):
+        """
+        get_pool_price_info() over the pool states of replay_events(), with the reserves
+        from balanceOf at each block.
+        """
+        has_tick = np.array([t is not None for t in df_state.pool_tick], dtype=bool)
+        pool_tick = np.where(has_tick, df_state.pool_tick, 0)
+        pool_liquidity = np.where(has_tick, df_state.pool_liquidity, 0)
+        pool_sqrtPrice = np.array([0 if p is None else p for p in df_state.pool_sqrtPrice], dtype=object)
+
+        scale0 = 10 ** self.token0_decimals
+        scale1 = 10 ** self.token1_decimals
+
+        (one_tick_liquidity0_adj, one_tick_liquidity1_adj,
+         in_tick_amount0, in_tick_amount1) = calculate_onetick_liquidity_array(
+            pool_tick, self.tick_spacing, pool_liquidity, df_state.liquidityNet.to_numpy())
+        one_tick_liquidity0_adj = one_tick_liquidity0_adj / scale0
+        one_tick_liquidity1_adj = one_tick_liquidity1_adj / scale1
+
+        price0 = sqrt_price_x_96_to_price_array(pool_sqrtPrice, self.token0_decimals, self.token1_decimals)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            price1 = np.where(price0 != 0, 1 / price0, 0)
+
+        reserve0, reserve1 = self._replay_reserves(df_state.blockNumber.to_numpy())
+        reserve0_scaled = (reserve0 / scale0).astype(np.float64)
+        reserve1_scaled = (reserve1 / scale1).astype(np.float64)
+
+        # Use reserve to cap the one tick liquidity
+        # Example: 0xf1d2172d6c6051960a289e0d7dca9e16b65bfc64, around block 17272381, May 16 2023 8pm GMT+8
+        need_cap = (reserve0_scaled < one_tick_liquidity0_adj) | (reserve1_scaled < one_tick_liquidity1_adj)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            balance2liquidity0_ratio = reserve0_scaled / one_tick_liquidity0_adj
+            balance2liquidity1_ratio = reserve1_scaled / one_tick_liquidity1_adj
+            cap_by0 = balance2liquidity0_ratio < balance2liquidity1_ratio
+            one_tick_liquidity0 = np.where(
+                need_cap,
+                np.where(cap_by0, reserve0_scaled, balance2liquidity1_ratio * one_tick_liquidity0_adj),
+                one_tick_liquidity0_adj)
+            one_tick_liquidity1 = np.where(
+                need_cap,
+                np.where(cap_by0, balance2liquidity0_ratio * one_tick_liquidity1_adj, reserve1_scaled),
+                one_tick_liquidity1_adj)
+
+        columns = {
+            'price0': price0,
+            'price1': price1,
+            'one_tick_liquidity0': one_tick_liquidity0,
+            'one_tick_liquidity1': one_tick_liquidity1,
+            'full_tick_liquidity0': in_tick_amount0 / scale0,
+            'full_tick_liquidity1': in_tick_amount1 / scale1,
+            **{counter: df_state[counter].to_numpy(dtype=object) / (scale0 if counter.startswith('token0') else scale1)
+               for counter in self.PRICE_INFO_COUNTERS},
+            'reserve0': reserve0_scaled,
+            'reserve1': reserve1_scaled,
+        }
+
+        pool_price_infos = [
+            PoolPriceInfoWithVolume(
+                src=self.src,
+                token0_address=self.token0.address,
+                token1_address=self.token1.address,
+                token0_symbol=self.token0_symbol,
+                token1_symbol=self.token1_symbol,
+                ref_price=1,
+                pool_address=self.pool.address,
+                tick_spacing=self.tick_spacing,
+                **{name: values[n] for name, values in columns.items()})
+            for n in range(df_state.shape[0])]
+        return pool_price_infos, reserve0, reserve1
+
+    def proc_events(self, df_events):
+        """
+        Move the pool along the events and yield the price info after each.
+
+        The price info of all rows is computed from the replayed columns first and the pool
+        moves to the state after the last event before the first row is yielded.
+        """
+        df_state, tick_table = self.replay_events(self.events_after_state(df_events))
+        if df_state.empty:
+            return
+
+        pool_price_infos, reserve0, reserve1 = self.replay_price_info(df_state)
+
+        last = df_state.iloc[-1]
+        self.block_number = last.blockNumber
+        self.log_index = last.logIndex
+        self.pool_tick = last.pool_tick
+        self.pool_sqrtPrice = last.pool_sqrtPrice
+        self.pool_liquidity = last.pool_liquidity
+        for counter in self.REPLAY_COUNTERS:
+            setattr(self, counter, last[counter])
+        self.token0_reserve = reserve0[-1]
+        self.token1_reserve = reserve1[-1]
+        if tick_table is not None:
+            self.ticks = tick_table.to_dict()
+        self.previous_block_number = self.block_number
+        self.previous_log_index = self.log_index
+        self.previous_price_info = pool_price_infos[-1]
+        self.save_checkpoint()
+
+        yield from zip(df_state.blockNumber, df_state.logIndex, pool_price_infos)
 
     def proc_initialize(self, event_row):
         self.pool_tick = event_row['tick']
@@ -585,34 +898,34 @@ class UniV3Pool(UniswapPoolBase):
         if self.df_evt['Swap'].empty:
             return
 
+        # Columns are computed over whole arrays, float from the amounts and sqrt prices.
+        df_swap = self.df_evt['Swap']
+        with np.errstate(divide='ignore'):
+            token0_price = sqrt_price_x_96_to_price_array(df_swap.sqrtPriceX96.to_numpy(),
+                                                          token0_decimals=self.token0.decimals,
+                                                          token1_decimals=self.token1.decimals)
+            token1_price = 1 / token0_price
+        amount0_scaled = df_swap.amount0.to_numpy(dtype=object).astype(np.float64) / 10 ** self.token0.decimals
+        amount1_scaled = df_swap.amount1.to_numpy(dtype=object).astype(np.float64) / 10 ** self.token1.decimals
+
         self.df_evt['Swap'] = (
-            self.df_evt['Swap']
-            .assign(token0_price=lambda df: df.sqrtPriceX96.apply(partial(sqrt_price_x_96_to_price,
-                                                                          token0_decimals=self.token0.decimals,
-                                                                          token1_decimals=self.token1.decimals)),
-                    token1_price=lambda df: 1 / df.token0_price,
+            df_swap
+            .assign(token0_price=token0_price,
+                    token1_price=token1_price,
 
-                    amount0_scaled=lambda df: df.amount0.apply(
-                        self.token0.scaled),
-                    amount1_scaled=lambda df: df.amount1.apply(
-                        self.token1.scaled),
+                    amount0_scaled=amount0_scaled,
+                    amount1_scaled=amount1_scaled,
 
                     # When a token is swapped in, only ((1 - fee) * amount) was used, (fee * amount) is the fee.
                     # We use positive for swap-in token, negative for swap-out token.
-                    fee0=lambda df: df.amount0_scaled.apply(
-                        partial(calc_fee, fee=pool_fee)),
-                    fee1=lambda df: df.amount1_scaled.apply(
-                        partial(calc_fee, fee=pool_fee)),
+                    fee0=calc_fee(amount0_scaled, pool_fee),
+                    fee1=calc_fee(amount1_scaled, pool_fee),
 
                     # We calculate the swap price
-                    swap0_price=lambda df, pool_fee=pool_fee: df.apply(
-                        partial(calc_swap_price, fee=pool_fee, which_token=0), axis=1),
-                    swap1_price=lambda df, pool_fee=pool_fee: df.apply(
-                        partial(calc_swap_price, fee=pool_fee, which_token=1), axis=1),
-
-                    # lvr0 is lvr in token0
-                    # lvr1 is lvr in token1
-                    lvr0=lambda df: df.apply(
-                        partial(lvr, which_token=0), axis=1),
-                    lvr1=lambda df: df.apply(partial(lvr, which_token=1), axis=1))
+                    swap0_price=calc_swap_price_columns(amount0_scaled, amount1_scaled, pool_fee, which_token=0),
+                    swap1_price=calc_swap_price_columns(amount0_scaled, amount1_scaled, pool_fee, which_token=1))
+            # lvr0 is lvr in token0
+            # lvr1 is lvr in token1
+            .assign(lvr0=lambda df: lvr_columns(df, which_token=0),
+                    lvr1=lambda df: lvr_columns(df, which_token=1))
         )
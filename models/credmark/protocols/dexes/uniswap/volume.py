@@ -1,15 +1,26 @@
-# pylint:disable=locally-disabled,protected-access,line-too-long,unsubscriptable-object
+# pylint:disable=locally-disabled,protected-access,line-too-long,unsubscriptable-object,invalid-name
 
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from contextvars import copy_context
 from typing import List
 
+import numpy as np
 import pandas as pd
 from credmark.cmf.model import Model
 from credmark.cmf.model.errors import ModelDataError, ModelRunError
-from credmark.cmf.types import BlockNumber, Contract, Some, Token
+from credmark.cmf.types import BlockNumber, Contract, JoinType, Some, Token
+from credmark.cmf.types.compose import MapInputsOutput
 from credmark.cmf.types.series import BlockSeries, BlockSeriesRow
 
 from models.credmark.protocols.dexes.uniswap.uniswap_v3_pool import fix_univ3_pool
-from models.dtos.volume import TokenTradingVolume, VolumeInput, VolumeInputHistorical
+from models.dtos.volume import (
+    PoolSwapVolumeSeries,
+    TokenTradingVolume,
+    VolumeInput,
+    VolumeInputHistorical,
+    VolumeInputHistoricalPools,
+)
 from models.tmp_abi_lookup import CURVE_STABLESWAP_ABI
 
 
@@ -184,8 +195,151 @@ class DexPoolSwapVolumeHistorical(Model):
         return pool_volume_history
 
 
+def load_volume_pool(address, pool_info_model: str) -> Contract:
+    pool = Contract(address=address)
+
+    try:
+        _ = pool.abi
+    except ModelDataError:
+        if pool_info_model == 'uniswap-v2.pool-tvl':
+            pool = fix_univ3_pool(Contract(address=address))
+        elif pool_info_model == 'curve-fi.pool-tvl':
+            pool = Contract(address=address).set_abi(
+                CURVE_STABLESWAP_ABI, set_loaded=True)
+        else:
+            raise
+
+    if pool.abi is None:
+        raise ModelRunError('Input contract\'s ABI is empty')
+
+    return pool
+
+
+def _select_swap_intervals(q, amount_aggregates, block_number: int, interval: int, count: int,
+                           block=None, joins=None) -> pd.DataFrame:
+    block = q.BLOCK_NUMBER if block is None else block
+    df = (q.select(
+        aggregates=(
+            amount_aggregates +
+            [(f'floor(({block_number} - {block}) / {interval})', 'interval_n')] +
+            [(block.func_(func), f'{func}_block_number') for func in ['max', 'count']]),
+        where=block.gt(block_number - interval * count).and_(
+            block.le(block_number)),
+        joins=joins,
+        group_by=['"interval_n"'],
+        bigint_cols=[f'{func}_block_number' for func in ['max', 'count']])
+        .to_dataframe())
+    df.columns = pd.Index([c.lower() for c in df.columns])  # type: ignore
+    return df
+
+
+def _uniswap_swap_intervals(pool: Contract, tokens_n: int, block_number: int, interval: int, count: int) -> list[pd.DataFrame]:
+    with pool.ledger.events.Swap as q:
+        amount_fields = {c.lower(): c for c in q.colnames if c.lower().startswith('evt_amount')}
+
+        def _sum_pos(field):
+            return f'sum((sign({q[amount_fields[field]]})+1) / 2 * {q[amount_fields[field]]})'
+
+        def _sum_neg(field):
+            return f'sum((sign({q[amount_fields[field]]})-1) / 2 * {q[amount_fields[field]]})'
+
+        if sorted(amount_fields) == sorted(['evt_amount0in', 'evt_amount1in', 'evt_amount0out', 'evt_amount1out']):
+            # Pool uses In/Out to represent
+            amount_aggregates = ([(_sum_pos(f'evt_amount{n}in'), f'amount{n}_in') for n in range(tokens_n)] +
+                                 [(_sum_pos(f'evt_amount{n}out'), f'amount{n}_out') for n in range(tokens_n)])
+        else:
+            # Pool uses two records per Swap (+/-) sign.
+            amount_aggregates = ([(_sum_pos(f'evt_amount{n}'), f'amount{n}_in') for n in range(tokens_n)] +
+                                 [(_sum_neg(f'evt_amount{n}'), f'amount{n}_out') for n in range(tokens_n)])
+
+        return [_select_swap_intervals(q, amount_aggregates, block_number, interval, count)]
+
+
+def _curve_swap_intervals(pool: Contract, tokens_n: int, block_number: int, interval: int, count: int) -> list[pd.DataFrame]:
+    event_names = [event_name for event_name in ['TokenExchange', 'TokenExchangeUnderlying']
+                   if event_name in pool.abi.events]
+    if len(event_names) == 0:
+        return []
+
+    for event_name in event_names:
+        event_tokenexchange_args = [
+            'EVT_' + s.upper() for s in getattr(pool.abi.events, event_name).args]
+        assert sorted(event_tokenexchange_args) == sorted(
+            ['EVT_BUYER', 'EVT_SOLD_ID', 'EVT_TOKENS_SOLD', 'EVT_BOUGHT_ID', 'EVT_TOKENS_BOUGHT'])
+
+    try:
+        with ExitStack() as stack:
+            # The events share their arguments. A full outer join on false is the union of their rows,
+            # so that both are grouped in one query.
+            qs = [stack.enter_context(getattr(pool.ledger.events, event_name).as_(f'e{n}'))
+                  for n, event_name in enumerate(event_names)]
+            q = qs[0]
+
+            def _col(name):
+                return q.field(f'COALESCE({", ".join(str(getattr(qe, name)) for qe in qs)})')
+
+            sold_id, tokens_sold = _col('EVT_SOLD_ID'), _col('EVT_TOKENS_SOLD')
+            bought_id, tokens_bought = _col('EVT_BOUGHT_ID'), _col('EVT_TOKENS_BOUGHT')
+
+            # In: Sold to the pool
+            # Out: Bought from the pool
+            amount_aggregates = (
+                [(f'SUM(CASE WHEN {sold_id.as_bigint().eq(n)} '
+                  f'THEN {tokens_sold.as_numeric()} ELSE 0::INTEGER END)', f'amount{n}_in')
+                 for n in range(tokens_n)] +
+                [(f'SUM(CASE WHEN {bought_id.as_bigint().eq(n)} '
+                  f'THEN {tokens_bought.as_numeric()} ELSE 0::INTEGER END)', f'amount{n}_out')
+                 for n in range(tokens_n)])
+            return [_select_swap_intervals(q, amount_aggregates, block_number, interval, count,
+                                           block=_col('BLOCK_NUMBER'),
+                                           joins=[(JoinType.FULL_OUTER, qe, qe.field('FALSE')) for qe in qs[1:]])]
+    except ModelDataError:
+        return []
+
+
+def swap_volume_intervals(pool: Contract, pool_info_model: str, tokens_n: int,
+                          block_number: int, interval: int, count: int) -> dict[str, np.ndarray]:
+    """
+    Swaps of a pool in count intervals of blocks up to block_number, earliest first,
+    from one grouped ledger query.
+
+    Returns arrays by interval of start_block_number/end_block_number (exclusive/inclusive),
+    max_block_number (of the last swap) and swap_count, and arrays (token, interval)
+    of amount_in (sold to the pool) and amount_out (bought from the pool) before scaling.
+    """
+    if pool_info_model == 'uniswap-v2.pool-tvl':
+        dfs = _uniswap_swap_intervals(pool, tokens_n, block_number, interval, count)
+    elif pool_info_model == 'curve-fi.pool-tvl':
+        dfs = _curve_swap_intervals(pool, tokens_n, block_number, interval, count)
+    else:
+        raise ModelRunError(
+            f'Unknown pool info model {pool_info_model=}')
+
+    n_from_end = np.arange(count - 1, -1, -1, dtype=np.int64)
+    intervals = {
+        'start_block_number': block_number - (n_from_end + 1) * interval,
+        'end_block_number': block_number - n_from_end * interval,
+        'max_block_number': np.zeros(count, dtype=np.int64),
+        'swap_count': np.zeros(count, dtype=np.int64),
+        'amount_in': np.zeros((tokens_n, count)),
+        'amount_out': np.zeros((tokens_n, count)),
+    }
+
+    for df in dfs:
+        if df.empty:
+            continue
+        cc = count - df['interval_n'].to_numpy(dtype=np.int64) - 1
+        np.maximum.at(intervals['max_block_number'], cc, df['max_block_number'].to_numpy(dtype=np.int64))
+        np.add.at(intervals['swap_count'], cc, df['count_block_number'].to_numpy(dtype=np.int64))
+        for n in range(tokens_n):
+            np.add.at(intervals['amount_in'][n], cc, df[f'amount{n}_in'].to_numpy(dtype=float))
+            np.add.at(intervals['amount_out'][n], cc, df[f'amount{n}_out'].to_numpy(dtype=float))
+
+    return intervals
+
+
 @Model.describe(slug='dex.pool-volume-historical-ledger',
-                version='1.12',
+                version='1.13',
                 display_name='Uniswap/SushiSwap/Curve Pool Swap Volumes - Historical',
                 description=('The volume of each token swapped in a pool '
                              'during the block interval from the current - Historical'),
@@ -195,21 +349,7 @@ class DexPoolSwapVolumeHistorical(Model):
                 output=BlockSeries[Some[TokenTradingVolume]])
 class DexPoolSwapVolumeHistoricalLedger(Model):
     def run(self, input: VolumeInputHistorical) -> BlockSeries[Some[TokenTradingVolume]]:
-        pool = Contract(address=input.address)
-
-        try:
-            _ = pool.abi
-        except ModelDataError:
-            if input.pool_info_model == 'uniswap-v2.pool-tvl':
-                pool = fix_univ3_pool(Contract(address=input.address))
-            elif input.pool_info_model == 'curve-fi.pool-tvl':
-                pool = Contract(address=input.address).set_abi(
-                    CURVE_STABLESWAP_ABI, set_loaded=True)
-            else:
-                raise
-
-        if pool.abi is None:
-            raise ModelRunError('Input contract\'s ABI is empty')
+        pool = load_volume_pool(input.address, input.pool_info_model)
 
         pool_info = self.context.run_model(input.pool_info_model, input=input)
         tokens_n = len(pool_info['portfolio']['positions'])
@@ -225,188 +365,26 @@ class DexPoolSwapVolumeHistoricalLedger(Model):
                     for _ in range(input.count)],
             errors=None)
 
-        if input.pool_info_model == 'uniswap-v2.pool-tvl':
-            with pool.ledger.events.Swap as q:
-                event_swap_args = [
-                    c for c in q.colnames if c.lower().startswith('evt_amount')]
-                df_all_swaps = (q.select(
-                    aggregates=(
-                        [(f'sum((sign({q[field]})+1) / 2 * {q[field]})', f'sum_pos_{q[field]}')
-                         for field in event_swap_args] +
-                        [(f'sum((sign({q[field]})-1) / 2 * {q[field]})', f'sum_neg_{q[field]}')
-                         for field in event_swap_args] +
-                        [(f'floor(({self.context.block_number} - {q.BLOCK_NUMBER}) / {input.interval})',
-                            'interval_n')] +
-                        [(q.BLOCK_NUMBER.func_(func), f'{func}_block_number')
-                         for func in ['min', 'max', 'count']]),
-                    where=q.BLOCK_NUMBER.gt(self.context.block_number - input.interval * input.count).and_(
-                        q.BLOCK_NUMBER.le(self.context.block_number)),
-                    group_by=['"interval_n"'],
-                    bigint_cols=[f'{func}_block_number' for func in [
-                        'min', 'max', 'count']]
-                ).to_dataframe())
-
-            if len(df_all_swaps) == 0:
-                return pool_volume_history
-
-            df_all_swaps.columns = pd.Index(
-                [c.lower() for c in df_all_swaps.columns])  # type: ignore
-
-            event_swap_args_lower = sorted(
-                [c.lower() for c in event_swap_args])
-            if event_swap_args_lower == sorted(['evt_amount0in', 'evt_amount1in', 'evt_amount0out', 'evt_amount1out']):
-                # Pool uses In/Out to represent
-                df_all_swaps = (df_all_swaps.drop(
-                    columns=([f'sum_neg_evt_amount{n}in' for n in range(tokens_n)] +  # type: ignore
-                             [f'sum_neg_evt_amount{n}out' for n in range(tokens_n)]))  # type: ignore
-                    .rename(columns=(
-                        {f'sum_pos_evt_amount{n}in': f'evt_amount{n}_in' for n in range(tokens_n)} |
-                        {f'sum_pos_evt_amount{n}out': f'evt_amount{n}_out' for n in range(tokens_n)}))
-                    .sort_values('min_block_number')
-                    .reset_index(drop=True))
-            else:
-                # Pool uses two records per Swap (+/-) sign.
-                df_all_swaps = (df_all_swaps.rename(columns=(
-                    {f'sum_pos_evt_amount{n}': f'evt_amount{n}_in' for n in range(tokens_n)} |
-                    {f'sum_neg_evt_amount{n}': f'evt_amount{n}_out' for n in range(tokens_n)}))
-                    .sort_values('min_block_number')
-                    .reset_index(drop=True))
-
-            for n in range(tokens_n):
-                for col in [f'evt_amount{n}_in', f'evt_amount{n}_out']:
-                    df_all_swaps[col] = df_all_swaps.loc[:,
-                                                         col].astype(float)  # type: ignore
-
-        elif input.pool_info_model == 'curve-fi.pool-tvl':
-            df_all_swap_1 = pd.DataFrame()
-            if 'TokenExchange' in pool.abi.events:
-                try:
-                    event_tokenexchange_args = [
-                        'EVT_' + s.upper() for s in pool.abi.events.TokenExchange.args]
-                    assert sorted(event_tokenexchange_args) == sorted(
-                        ['EVT_BUYER', 'EVT_SOLD_ID', 'EVT_TOKENS_SOLD', 'EVT_BOUGHT_ID', 'EVT_TOKENS_BOUGHT'])
-
-                    with pool.ledger.events.TokenExchange as q:
-                        df_all_swap_1 = (q.select(
-                            aggregates=(
-                                [(q[field].as_numeric().sum_().str(), q[field].str())
-                                 for field in ['EVT_TOKENS_SOLD', 'EVT_TOKENS_BOUGHT']] +
-                                [(f'floor(({self.context.block_number} - {q.BLOCK_NUMBER}) / {input.interval})',
-                                  'interval_n')] +
-                                [(f'{func}({q.BLOCK_NUMBER})', f'{func}_block_number')
-                                 for func in ['min', 'max', 'count']]),
-                            where=q.BLOCK_NUMBER.gt(self.context.block_number - input.interval * input.count).and_(
-                                q.BLOCK_NUMBER.le(self.context.block_number)),
-                            group_by=['"interval_n"',
-                                      q.EVT_SOLD_ID,
-                                      q.EVT_BOUGHT_ID],
-                            bigint_cols=[f'{func}_block_number' for func in ['min', 'max', 'count']])
-                            .to_dataframe())
-                except ModelDataError:
-                    pass
-
-            df_all_swap_2 = pd.DataFrame()
-            if 'TokenExchangeUnderlying' in pool.abi.events:
-                event_tokenexchange_args = [
-                    'EVT_' + s.upper() for s in pool.abi.events.TokenExchangeUnderlying.args]
-                assert sorted(event_tokenexchange_args) == sorted(
-                    ['EVT_BUYER', 'EVT_SOLD_ID', 'EVT_TOKENS_SOLD', 'EVT_BOUGHT_ID', 'EVT_TOKENS_BOUGHT'])
-                try:
-                    with pool.ledger.events.TokenExchangeUnderlying as q:
-                        df_all_swap_2 = (q.select(
-                            aggregates=(
-                                [(q[field].as_numeric().sum_().str(), f'{q[field]}')
-                                    for field in ['EVT_TOKENS_SOLD', 'EVT_TOKENS_BOUGHT']] +
-                                [(f'floor(({self.context.block_number} - {q.BLOCK_NUMBER}) / {input.interval})',
-                                    'interval_n')] +
-                                [(q.BLOCK_NUMBER.func_(func), f'{func}_block_number')
-                                    for func in ['min', 'max', 'count']]),
-                            where=q.BLOCK_NUMBER.gt(self.context.block_number - input.interval * input.count).and_(
-                                q.BLOCK_NUMBER.le(self.context.block_number)),
-                            group_by=['"interval_n"',
-                                      q.EVT_SOLD_ID,
-                                      q.EVT_BOUGHT_ID],
-                            bigint_cols=[f'{func}_block_number' for func in ['min', 'max', 'count']])
-                            .to_dataframe())
-                except ModelDataError:
-                    pass
-
-            df_all_swaps = pd.concat(
-                [df_all_swap_1, df_all_swap_2]).reset_index(drop=True)
-
-            if len(df_all_swaps) == 0:
-                return pool_volume_history
-
-            df_all_swaps.columns = pd.Index(
-                [c.lower() for c in df_all_swaps.columns])  # type: ignore
-
-            for col in ['evt_tokens_bought', 'evt_tokens_sold']:
-                df_all_swaps[col] = df_all_swaps.loc[:,
-                                                     col].astype(float)  # type: ignore
-
-            for n in range(tokens_n):
-                # In: Sold to the pool
-                # Out: Bought from the pool
-                # type: ignore
-                df_all_swaps[f'evt_amount{n}_in'] = df_all_swaps.loc[:,
-                                                                     'evt_tokens_sold']
-                # type: ignore
-                df_all_swaps[f'evt_amount{n}_out'] = df_all_swaps.loc[:,
-                                                                      'evt_tokens_bought']
-                # type: ignore
-                df_all_swaps.loc[df_all_swaps.evt_sold_id !=
-                                 n, f'evt_amount{n}_in'] = 0
-                df_all_swaps.loc[df_all_swaps.evt_bought_id != n,
-                                 f'evt_amount{n}_out'] = 0             # type: ignore
-
-            df_all_swaps = (df_all_swaps
-                            .groupby(['interval_n'], as_index=False)
-                            .agg({'min_block_number': ['min'],
-                                 'max_block_number': ['max'],
-                                  'count_block_number': ['sum']} |
-                                 {f'evt_amount{n}_in': ['sum'] for n in range(tokens_n)} |
-                                 {f'evt_amount{n}_out': ['sum'] for n in range(tokens_n)}))  # type: ignore
-
-            df_all_swaps.columns = pd.Index(
-                [a for a, _ in df_all_swaps.columns])  # type: ignore
-            df_all_swaps = df_all_swaps.sort_values(
-                'min_block_number').reset_index(drop=True)
-        else:
-            raise ModelRunError(
-                f'Unknown pool info model {input.pool_info_model=}')
+        intervals = swap_volume_intervals(pool, input.pool_info_model, tokens_n,
+                                          int(self.context.block_number), input.interval, input.count)
 
-        df_all_swaps['interval_n'] = input.count - df_all_swaps.loc[:, 'interval_n'] - 1
-        df_all_swaps['start_block_number'] = (
-            int(self.context.block_number) - (df_all_swaps.interval_n + 1) * input.interval)
-        df_all_swaps['end_block_number'] = (
-            int(self.context.block_number) - (df_all_swaps.interval_n) * input.interval)
+        if intervals['swap_count'].sum() == 0:
+            return pool_volume_history
 
         # TODO: get price for each block when composer model is ready
-        # all_blocks = df_all_swaps.loc[:, ['evt_block_number']]  # type: ignore
-        # for n in range(tokens_n):
-        #     for n_row, row in all_blocks[::-1].iterrows():
-        #         all_blocks.loc[n_row, f'token{n}_price'] = self.context.run_model(
-        #             'price.quote',
-        #             input=tokens[n], block_number=row.BLOCK_NUMBER, return_type=Price).price
-
-        # df_all_swaps = df_all_swaps.merge(all_blocks, on=['evt_block_number'], how='left')
-
-        # Use current block's price, instead.
+        # Use the price at the last swap of each interval, instead.
         for cc in range(input.count):
-            df_swap_sel = df_all_swaps.loc[df_all_swaps.interval_n == cc, :]
-
-            if df_swap_sel.empty:  # type: ignore
-                block_number = self.context.block_number + (cc - input.count + 1) * input.interval
-                pool_volume_history.series[cc].blockNumber = int(block_number)
+            if intervals['swap_count'][cc] == 0:
+                block_number = int(intervals['end_block_number'][cc])
+                pool_volume_history.series[cc].blockNumber = block_number
                 pool_volume_history.series[cc].blockTimestamp = int(
                     BlockNumber(block_number).timestamp)
                 pool_volume_history.series[cc].sampleTimestamp = BlockNumber(
                     block_number).timestamp
                 continue
 
-            block_number = df_swap_sel.max_block_number.to_list()[
-                0]  # type: ignore
-            pool_volume_history.series[cc].blockNumber = int(block_number)
+            block_number = int(intervals['max_block_number'][cc])
+            pool_volume_history.series[cc].blockNumber = block_number
             pool_volume_history.series[cc].blockTimestamp = int(
                 BlockNumber(block_number).timestamp)
             pool_volume_history.series[cc].sampleTimestamp = BlockNumber(
@@ -415,12 +393,9 @@ class DexPoolSwapVolumeHistoricalLedger(Model):
             pool_info_past = self.context.run_model(
                 input.pool_info_model, input=input, block_number=block_number)
             for n in range(tokens_n):
-                # type: ignore
                 token_price = pool_info_past['prices'][n]['price']
-                # type: ignore
-                token_out = df_swap_sel[f'evt_amount{n}_out'].sum()
-                # type: ignore
-                token_in = df_swap_sel[f'evt_amount{n}_in'].sum()
+                token_out = intervals['amount_out'][n, cc]
+                token_in = intervals['amount_in'][n, cc]
 
                 pool_volume_history.series[cc].output[n].sellAmount = tokens[n].scaled(
                     token_out)
@@ -434,6 +409,81 @@ class DexPoolSwapVolumeHistoricalLedger(Model):
         return pool_volume_history
 
 
+@Model.describe(slug='dex.pool-volume-historical-ledger-pools',
+                version='0.2',
+                display_name='Uniswap/SushiSwap/Curve Pool Swap Volumes - Historical for Pools',
+                description=('The volume of each token swapped in each of the pools '
+                             'during the block interval from the current - Historical. '
+                             'Values are at the current prices. The pool info of all pools '
+                             'is run in one batch, then the swaps of the pools are queried concurrently. '
+                             'A pool that fails has its error in the result instead of failing the others.'),
+                category='protocol',
+                subcategory='dex',
+                input=VolumeInputHistoricalPools,
+                output=Some[PoolSwapVolumeSeries])
+class DexPoolsSwapVolumeHistoricalLedger(Model):
+    MAX_WORKERS = 4
+
+    def run(self, input: VolumeInputHistoricalPools) -> Some[PoolSwapVolumeSeries]:
+        block_number = int(self.context.block_number)
+
+        pool_infos_results = self.context.run_model(
+            slug='compose.map-inputs',
+            input={'modelSlug': input.pool_info_model,
+                   'modelInputs': [{'address': address} for address in input.addresses]},
+            return_type=MapInputsOutput[dict, dict])
+
+        def _pool_intervals(address, pool_info_result):
+            if pool_info_result.output is None:
+                if pool_info_result.error is not None:
+                    return (f'Error with models({block_number}).' +
+                            f'{input.pool_info_model.replace("-","_")}({address}). ' +
+                            pool_info_result.error.message)
+                return 'compose.map-inputs: output/error cannot be both None'
+
+            try:
+                pool = load_volume_pool(address, input.pool_info_model)
+                return swap_volume_intervals(pool, input.pool_info_model,
+                                             len(pool_info_result.output['portfolio']['positions']),
+                                             block_number, input.interval, input.count)
+            except (ModelDataError, ModelRunError) as err:
+                return f'Error with swaps of {address}. {err}'
+
+        with ThreadPoolExecutor(max_workers=self.MAX_WORKERS) as executor:
+            futures = [executor.submit(copy_context().run, _pool_intervals, address, pool_info_result)
+                       for address, pool_info_result in zip(input.addresses, pool_infos_results)]
+            pools_intervals = [future.result() for future in futures]
+
+        results = []
+        for address, pool_info_result, intervals in zip(input.addresses, pool_infos_results, pools_intervals):
+            if isinstance(intervals, str):
+                self.logger.error(intervals)
+                results.append(PoolSwapVolumeSeries.failed(address, intervals))
+                continue
+
+            pool_info = pool_info_result.output
+            tokens = [Token(**token_info['asset'])
+                      for token_info in pool_info['portfolio']['positions']]
+            prices = np.array([price['price'] for price in pool_info['prices']], dtype=float)
+            scales = np.array([10 ** token.decimals for token in tokens], dtype=float)
+
+            sell_amount = intervals['amount_out'] / scales[:, None]
+            buy_amount = intervals['amount_in'] / scales[:, None]
+            results.append(PoolSwapVolumeSeries(
+                address=address,
+                tokens=tokens,
+                prices=prices.tolist(),
+                startBlockNumber=intervals['start_block_number'].tolist(),
+                endBlockNumber=intervals['end_block_number'].tolist(),
+                swapCount=intervals['swap_count'].tolist(),
+                sellAmount=sell_amount.tolist(),
+                buyAmount=buy_amount.tolist(),
+                sellValue=(sell_amount * prices[:, None]).tolist(),
+                buyValue=(buy_amount * prices[:, None]).tolist()))
+
+        return Some(some=results)
+
+
 @Model.describe(slug='dex.pool-volume',
                 version='1.11',
                 display_name='Uniswap/SushiSwap/Curve Pool Swap Volumes',
@@ -23,6 +23,7 @@ from pyxirr import InvalidPaymentsError, xirr
 
 from models.credmark.chain.contract import ContractEventsInput, ContractEventsOutput, fetch_events_with_range
 from models.credmark.protocols.dexes.uniswap.univ3_math import tick_to_price
+from models.credmark.tokens.token_metadata import TokenMetadataResolver
 from models.tmp_abi_lookup import ICHI_VAULT, ICHI_VAULT_DEPOSIT_GUARD, ICHI_VAULT_FACTORY, UNISWAP_V3_POOL_ABI
 
 # ICHI Vault
@@ -111,6 +112,43 @@ class IchiVaultMeta:
 
         return VaultTokens(token0, token1)
 
+    VAULT_CHUNK_SIZE = 500
+
+    def get_vaults(self, context, vault_addrs: List[str]) -> List['IchiVault']:
+        """
+        Vaults' info with the reads of all vaults in chunks of web3 batch calls and
+        the symbols of all their tokens resolved together by TokenMetadataResolver.
+        """
+        fields = ['token0', 'token1', 'owner', 'pool', 'allowToken0', 'allowToken1', 'totalSupply', 'decimals']
+        calls = []
+        for vault_addr in vault_addrs:
+            vault = Token(vault_addr).set_abi(abi=ICHI_VAULT, set_loaded=True)
+            calls.extend([getattr(vault.functions, field)() for field in fields])
+
+        results = []
+        for i in range(0, len(calls), self.VAULT_CHUNK_SIZE):
+            results.extend(context.web3_batch.call(
+                calls[i:i + self.VAULT_CHUNK_SIZE], unwrap=True, require_success=True))
+
+        reads = [dict(zip(fields, results[n * len(fields):(n + 1) * len(fields)]))
+                 for n in range(len(vault_addrs))]
+
+        tokens = TokenMetadataResolver(context).resolve(
+            [Address(read['token0']) for read in reads] + [Address(read['token1']) for read in reads])
+        tokens0, tokens1 = tokens[:len(reads)], tokens[len(reads):]
+
+        return [IchiVault(vault=vault_addr,
+                          owner=read['owner'],
+                          pool=read['pool'],
+                          token0_address=Address(read['token0']),
+                          token1_address=Address(read['token1']),
+                          token0_symbol=token0['symbol'],
+                          token1_symbol=token1['symbol'],
+                          allow_token0=read['allowToken0'],
+                          allow_token1=read['allowToken1'],
+                          total_supply_scaled=read['totalSupply'] / 10 ** read['decimals'])
+                for vault_addr, read, token0, token1 in zip(vault_addrs, reads, tokens0, tokens1)]
+
     ONLY_USE_CHAINLINK_PRICE = True
 
     def get_price(self, context, token_address):
@@ -170,7 +208,7 @@ class IchiVault(DTO):
 
 
 @IncrementalModel.describe(slug='ichi.vaults-block-series',
-                           version='0.5',
+                           version='0.6',
                            display_name='ICHI vaults block series',
                            description='ICHI vaults block series',
                            category='protocol',
@@ -215,29 +253,11 @@ class IchiVaultsBlock(IncrementalModel, IchiVaultMeta):
 
         outputs_by_block: DefaultDict[int, List[IchiVault]] = defaultdict(list)
 
-        for _n_row, event in vault_created_events.iterrows():
-            vault_addr = event['ichiVault']
-            block_number = int(event['blockNumber'])
+        if not vault_created_events.empty:
+            vault_infos = self.get_vaults(self.context, list(vault_created_events['ichiVault']))
 
-            vault = Token(vault_addr).set_abi(abi=ICHI_VAULT, set_loaded=True)
-            vault_tokens = self.get_tokens(vault)
-            token0 = vault_tokens.token0
-            token1 = vault_tokens.token1
-
-            vault_info = IchiVault(
-                vault=vault_addr,
-                owner=vault.functions.owner().call(),
-                pool=vault.functions.pool().call(),
-                token0_address=token0.address,
-                token1_address=token1.address,
-                token0_symbol=token0.symbol,
-                token1_symbol=token1.symbol,
-                allow_token0=vault.functions.allowToken0().call(),
-                allow_token1=vault.functions.allowToken1().call(),
-                total_supply_scaled=vault.total_supply_scaled,
-            )
-
-            outputs_by_block[block_number].append(vault_info)
+            for block_number, vault_info in zip(vault_created_events['blockNumber'], vault_infos):
+                outputs_by_block[int(block_number)].append(vault_info)
 
         series = []
         for block_number, vaults in outputs_by_block.items():
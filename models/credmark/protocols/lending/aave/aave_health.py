@@ -0,0 +1,181 @@
+# pylint:disable=line-too-long, invalid-name
+
+"""
+Health factor of all borrowers of an Aave lending pool
+"""
+
+from typing import Callable, Optional
+
+from credmark.cmf.model import ModelContext
+from credmark.cmf.types import Address, Contract, Maybe
+from credmark.dto import DTO, DTOField, IterableListGenericDTO, PrivateAttr
+
+from models.credmark.chain.contract import fetch_events_with_range
+
+
+class AaveHealthFactorScanInput(DTO):
+    limit: int = DTOField(100, gt=0, description='Limit the number of accounts that are returned, lowest health factor first')
+    max_health_factor: Optional[float] = DTOField(None, description='Return only accounts with health factor below this')
+    incremental: bool = DTOField(False, description=(
+        'Update the accounts of the last scan: re-read only the borrowers with events since the last scan '
+        'and those with health factor below refresh_below. Otherwise all borrowers are read at the block. '
+        'The other accounts keep the data of their last read (see blockNumber), which does not reflect the '
+        'price moves since, so an account may now be below a health factor of 1 and be reported as healthy.'))
+    refresh_below: float = DTOField(1.5, ge=0, description='Health factor below which accounts are re-read in incremental mode')
+
+    class Config:
+        schema_extra = {
+            'examples': [{'limit': 10, '_test_multi': {'chain_id': 1, 'block_number': 17718495}},
+                         {'limit': 10, 'incremental': True, '_test_multi': {'chain_id': 1, 'block_number': 17718495}}],
+            'test_multi': True,
+        }
+
+
+class AaveAccountHealth(DTO):
+    address: Address = DTOField(description='Borrower')
+    totalCollateral: float = DTOField(description='Total collateral in base currency')
+    totalDebt: float = DTOField(description='Total debt in base currency')
+    availableBorrows: float = DTOField(description='Available borrows in base currency')
+    currentLiquidationThreshold: float
+    ltv: float
+    healthFactor: float
+    blockNumber: int = DTOField(description='Block of the account data')
+
+
+class AaveHealthFactorScanOutput(IterableListGenericDTO[AaveAccountHealth]):
+    accounts: list[AaveAccountHealth] = DTOField(default=[], description='Accounts with debt, lowest health factor first')
+    total_borrowers: int = DTOField(description='Number of borrowers from the events of the lending pool')
+    total_accounts: int = DTOField(description='Number of accounts with debt')
+    refreshed_accounts: int = DTOField(description='Number of accounts read at the block')
+    stale_accounts: int = DTOField(description=(
+        'Number of accounts returned with the data of an earlier block in incremental mode. '
+        'Their health factor does not reflect the price moves since their blockNumber.'))
+
+    _iterator: str = PrivateAttr('accounts')
+
+
+class AaveBorrowerIndex:
+    """
+    Borrowers of a lending pool and their getUserAccountData, kept between runs.
+
+    The borrowers are the onBehalfOf of Borrow and the user of Repay and LiquidationCall
+    from the pool's deployment, extended as later blocks are asked. A scan reads
+    getUserAccountData of the borrowers in batches of BATCH_SIZE calls. An incremental scan
+    at a later block re-reads only the borrowers with events since the last scan, those not
+    read before and those close to liquidation; the rest keep the data of their last read.
+
+    The index is shared by the runs of the process, so the context of a run is passed to each
+    call and not kept.
+    """
+
+    # (chain id, lending pool address) => index
+    INDEXES: dict[tuple[int, Address], 'AaveBorrowerIndex'] = {}
+    # event name => argument of the borrower
+    BORROWER_EVENTS = {'Borrow': 'onBehalfOf', 'Repay': 'user', 'LiquidationCall': 'user'}
+    BATCH_SIZE = 500
+
+    def __init__(self, context: ModelContext, lending_pool: Contract):
+        self.lending_pool = lending_pool
+
+        deployment = context.run_model(
+            'token.deployment-maybe', {'address': lending_pool.address}, return_type=Maybe[dict])
+        self.from_block = deployment.just['deployed_block_number'] if deployment.just else 0
+
+        self.borrowers: set[Address] = set()
+        # events are reflected up to this block
+        self.synced_to = self.from_block - 1
+
+        # borrower => (block number, getUserAccountData)
+        self.account_data: dict[Address, tuple[int, tuple]] = {}
+        self.scanned_to: Optional[int] = None
+
+    @classmethod
+    def get(cls, context: ModelContext, lending_pool: Contract) -> 'AaveBorrowerIndex':
+        key = (context.chain_id, lending_pool.address)
+        if key not in cls.INDEXES:
+            cls.INDEXES[key] = cls(context, lending_pool)
+        return cls.INDEXES[key]
+
+    def sync(self, context: ModelContext, block_number: int) -> set[Address]:
+        """
+        Borrowers with events after the last synced block up to the block.
+        """
+        if block_number <= self.synced_to:
+            return set()
+
+        event_contract = self.lending_pool.proxy_for if self.lending_pool.proxy_for is not None else self.lending_pool
+        touched = set()
+        for event_name, borrower_arg in self.BORROWER_EVENTS.items():
+            df_events = fetch_events_with_range(context.logger,
+                                                self.lending_pool,
+                                                getattr(event_contract.events, event_name),
+                                                from_block=self.synced_to + 1,
+                                                to_block=block_number,
+                                                contract_address=self.lending_pool.address)
+            if not df_events.empty:
+                touched.update(Address(addr) for addr in df_events[borrower_arg].unique())
+
+        self.borrowers.update(touched)
+        self.synced_to = block_number
+        return touched
+
+    def read_account_data(self, context: ModelContext, borrowers: list[Address]):
+        block_number = int(context.block_number)
+        for n in range(0, len(borrowers), self.BATCH_SIZE):
+            batch = borrowers[n:n + self.BATCH_SIZE]
+            results = context.web3_batch.call(
+                [self.lending_pool.functions.getUserAccountData(addr.checksum) for addr in batch],
+                unwrap=True, require_success=False)
+            for addr, result in zip(batch, results):
+                if result is not None:
+                    self.account_data[addr] = (block_number, tuple(result))
+
+    def scan(self,
+             context: ModelContext,
+             input: AaveHealthFactorScanInput,
+             scaled: Callable[[int], float]) -> AaveHealthFactorScanOutput:
+        """
+        Accounts with debt by health factor at the block of the context. scaled() converts the
+        collateral, debt and available borrows of getUserAccountData to the base currency.
+        """
+        block_number = int(context.block_number)
+        # the last scan is up to date with the events it has seen
+        scan_synced = self.scanned_to is not None and self.scanned_to == self.synced_to
+        touched = self.sync(context, block_number)
+
+        if input.incremental and scan_synced and block_number >= self.synced_to:
+            refresh = [addr for addr in self.borrowers
+                       if (addr in touched or
+                           addr not in self.account_data or
+                           self.account_data[addr][1][5] < input.refresh_below * 1e18)]
+        else:
+            # An account may have borrowed after the block, then it has no debt at the block.
+            refresh = list(self.borrowers)
+
+        self.read_account_data(context, refresh)
+        self.scanned_to = block_number
+
+        accounts = []
+        for addr in self.borrowers:
+            if addr not in self.account_data:
+                continue
+            read_at, (collateral, debt, available, threshold, ltv, health_factor) = self.account_data[addr]
+            if debt == 0 or read_at > block_number:
+                continue
+            if input.max_health_factor is not None and health_factor >= input.max_health_factor * 1e18:
+                continue
+            accounts.append(AaveAccountHealth(address=addr,
+                                              totalCollateral=scaled(collateral),
+                                              totalDebt=scaled(debt),
+                                              availableBorrows=scaled(available),
+                                              currentLiquidationThreshold=threshold / 10000,
+                                              ltv=ltv / 10000,
+                                              healthFactor=health_factor / 1e18,
+                                              blockNumber=read_at))
+
+        accounts.sort(key=lambda account: account.healthFactor)
+        return AaveHealthFactorScanOutput(accounts=accounts[:input.limit],
+                                          total_borrowers=len(self.borrowers),
+                                          total_accounts=len(accounts),
+                                          refreshed_accounts=len(refresh),
+                                          stale_accounts=sum(account.blockNumber < block_number for account in accounts))
@@ -0,0 +1,109 @@
+# pylint:disable=line-too-long
+
+"""
+Net aToken transfers of all holders of an Aave aToken
+"""
+
+from bisect import bisect_right
+
+import pandas as pd
+from credmark.cmf.model import ModelContext
+from credmark.cmf.types import Address, Contract, Maybe
+
+from models.credmark.chain.contract import ContractEventsInput, ContractEventsOutput
+from models.credmark.chain.event_store import DEFAULT_CONFIRMATIONS
+
+
+class ATokenTransferIndex:
+    """
+    Net of the Transfer events of an aToken for each holder by block, kept between runs.
+
+    The events are read with contract.events from the aToken's deployment and extended as later
+    blocks are asked. Only blocks at least CONFIRMATIONS deep are kept in the index, so that a reorg
+    does not leave stale transfers in it; the blocks above are read for each query. For each holder
+    the index keeps the blocks of its transfers and the running net (received less sent) after each,
+    so that the net at a block is found by binary search.
+    """
+
+    # (chain id, aToken address) => index
+    INDEXES: dict[tuple[int, Address], 'ATokenTransferIndex'] = {}
+    MAX_KEYS = 100
+
+    CONFIRMATIONS = DEFAULT_CONFIRMATIONS
+
+    def __init__(self, context: ModelContext, atoken: Contract):
+        self.atoken = atoken
+
+        deployment = context.run_model(
+            'token.deployment-maybe', {'address': atoken.address}, return_type=Maybe[dict])
+        self.from_block = deployment.just['deployed_block_number'] if deployment.just else 0
+
+        # holder address in lower case => (blocks, running net after the block)
+        self.transfers: dict[str, tuple[list[int], list[int]]] = {}
+        # events are reflected up to this block
+        self.synced_to = self.from_block - 1
+
+    @classmethod
+    def get(cls, context: ModelContext, atoken: Contract) -> 'ATokenTransferIndex':
+        key = (context.chain_id, atoken.address)
+        if key not in cls.INDEXES:
+            while len(cls.INDEXES) >= cls.MAX_KEYS:
+                del cls.INDEXES[next(iter(cls.INDEXES))]
+            cls.INDEXES[key] = cls(context, atoken)
+        return cls.INDEXES[key]
+
+    def _add(self, holder: str, block_number: int, value: int):
+        blocks, net = self.transfers.setdefault(holder.lower(), ([], []))
+        if len(blocks) > 0 and blocks[-1] == block_number:
+            net[-1] += value
+        else:
+            blocks.append(block_number)
+            net.append((net[-1] if len(net) > 0 else 0) + value)
+
+    def fetch_transfers(self, context: ModelContext, from_block: int, to_block: int) -> pd.DataFrame:
+        event_contract = self.atoken.proxy_for if self.atoken.proxy_for is not None else self.atoken
+        df_events = context.run_model(
+            'contract.events',
+            ContractEventsInput(
+                address=self.atoken.address,
+                event_name='Transfer',
+                event_abi=event_contract.abi.events.Transfer.raw_abi,
+                from_block=from_block),
+            return_type=ContractEventsOutput,
+            block_number=to_block).records.to_dataframe()
+        if df_events.empty:
+            return df_events
+        return df_events.sort_values(['blockNumber', 'logIndex'])
+
+    def sync(self, context: ModelContext, block_number: int):
+        final_block = block_number - self.CONFIRMATIONS
+        if final_block <= self.synced_to:
+            return
+
+        df_events = self.fetch_transfers(context, self.synced_to + 1, final_block)
+        if not df_events.empty:
+            for block, from_addr, to_addr, value in zip(df_events['blockNumber'], df_events['from'], df_events['to'], df_events['value']):
+                self._add(to_addr, int(block), int(value))
+                self._add(from_addr, int(block), -int(value))
+        self.synced_to = final_block
+
+    def net_at(self, context: ModelContext, holder: Address, block_number: int) -> int:
+        """
+        Unscaled aToken received less sent by the holder up to the block
+        """
+        self.sync(context, block_number)
+
+        holder_address = str(holder).lower()
+        net_value = 0
+        if holder_address in self.transfers:
+            blocks, net = self.transfers[holder_address]
+            n = bisect_right(blocks, block_number)
+            net_value = net[n - 1] if n > 0 else 0
+
+        if block_number > self.synced_to:
+            df_recent = self.fetch_transfers(context, self.synced_to + 1, block_number)
+            if not df_recent.empty:
+                values = df_recent['value'].map(int)
+                net_value += (values[df_recent['to'].str.lower() == holder_address].sum() -
+                              values[df_recent['from'].str.lower() == holder_address].sum())
+        return int(net_value)
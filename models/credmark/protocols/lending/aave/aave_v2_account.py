@@ -24,9 +24,15 @@ from credmark.cmf.types.compose import MapInputsOutput
 from credmark.cmf.types.series import BlockSeries
 from credmark.dto import DTOField
 
-from models.credmark.chain.contract import ContractEventsInput, ContractEventsOutput, fetch_events_with_range
+from models.credmark.chain.contract import ContractEventsInput, ContractEventsOutput
+from models.credmark.protocols.lending.aave.aave_health import (
+    AaveBorrowerIndex,
+    AaveHealthFactorScanInput,
+    AaveHealthFactorScanOutput,
+)
+from models.credmark.protocols.lending.aave.aave_transfers import ATokenTransferIndex
 from models.credmark.tokens.token import get_eip1967_proxy_err
-from models.tmp_abi_lookup import AAVE_DATA_PROVIDER, STAKED_AAVE
+from models.tmp_abi_lookup import AAVE_DATA_PROVIDER, AAVE_LENDING_POOL, STAKED_AAVE
 
 
 class AAVEUserReserveData(NamedTuple):
@@ -90,7 +96,7 @@ class AaveV2AccountHistorical(AaveV2LPAccount):
 
 
 @Model.describe(slug="aave-v2.account-info-reserve",
-                version="0.5",
+                version="0.6",
                 display_name="Aave V2 user account info for one reserve token",
                 description="Aave V2 user balance (principal and interest) and debt",
                 category="protocol",
@@ -142,75 +148,9 @@ class AaveV2GetAccountInfoAsset(Model):
 
         aToken = Token(aToken_addresses[0]).as_erc20(set_loaded=True)
 
-        # Fetch aToken transfer for an account
-        def _use_fetch_events():
-            _received = fetch_events_with_range(
-                self.logger,
-                aToken,
-                aToken.events.Transfer,
-                from_block=0,
-                to_block=None,
-                argument_filters={'to': user_address},
-                contract_address=aToken.address.checksum)
-            _sent = fetch_events_with_range(
-                self.logger,
-                aToken,
-                aToken.events.Transfer,
-                from_block=0,
-                to_block=None,
-                argument_filters={'from': user_address},
-                contract_address=aToken.address.checksum)
-            return _received, _sent
-
-        def use_contract_events():
-            if aToken.proxy_for and aToken.proxy_for.abi:
-                transfer_abi = aToken.proxy_for.abi.events.Transfer.raw_abi
-            elif aToken.abi:
-                transfer_abi = aToken.abi.events.Transfer.raw_abi
-            else:
-                raise ModelRunError('No abi found for aToken')
-
-            _received = self.context.run_model(
-                'contract.events',
-                ContractEventsInput(
-                    address=aToken.address,
-                    event_name='Transfer',
-                    event_abi=transfer_abi,
-                    argument_filters={'to': user_address},
-                    from_block=0),
-                return_type=ContractEventsOutput).records.to_dataframe()
-
-            _sent = self.context.run_model(
-                'contract.events',
-                ContractEventsInput(
-                    address=aToken.address,
-                    event_name='Transfer',
-                    event_abi=transfer_abi,
-                    argument_filters={'from': user_address},
-                    from_block=0),
-                return_type=ContractEventsOutput).records.to_dataframe()
-            return _received, _sent
-
-        _received, _sent = use_contract_events()
-
-        if _received.empty and _sent.empty:
-            atoken_tx = 0.0
-        elif _received.empty or _sent.empty:
-            _combined = pd.DataFrame()
-            if _received.empty:
-                _combined = _sent.assign(value=lambda x: x.value*-1)
-            elif _sent.empty:
-                _combined = _received
-            atoken_tx = aToken.scaled(_combined.value.sum())
-        else:
-            _combined = (pd.concat(
-                [_received.loc[:, ['blockNumber', 'logIndex', 'from', 'to', 'value']],
-                    (_sent.loc[:, ['blockNumber', 'logIndex', 'from',
-                                   'to', 'value']].assign(value=lambda x: x.value*-1))
-                 ])
-                .sort_values(['blockNumber', 'logIndex'])
-                .reset_index(drop=True))
-            atoken_tx = aToken.scaled(_combined.value.sum())
+        # Net aToken transfer of the account
+        atoken_tx = aToken.scaled(
+            ATokenTransferIndex.get(self.context, aToken).net_at(self.context, input.address, int(self.context.block_number)))
 
         token_info = {}
         token_info['tokenSymbol'] = reserve_token.symbol
@@ -551,6 +491,35 @@ class AaveV2GetAccountSummary(Model):
         return user_account_data
 
 
+# credmark-dev run aave-v2.health-factor-scan -i '{"limit": 10}' -b 16325819 -j
+# credmark-dev run aave-v2.health-factor-scan -i '{"limit": 10, "incremental": true}' -b 16325919 -j
+
+@Model.describe(slug="aave-v2.health-factor-scan",
+                version="0.1",
+                display_name="Aave V2 health factor scan",
+                description=("Aave V2 borrowers from the lending pool's Borrow/Repay/LiquidationCall events, "
+                             "ranked by health factor with their total collateral, debt and available borrows in ETH. "
+                             "The incremental mode re-reads only the borrowers with events since the last scan and those close to liquidation."),
+                category="protocol",
+                subcategory="aave-v2",
+                input=AaveHealthFactorScanInput,
+                output=AaveHealthFactorScanOutput)
+class AaveV2HealthFactorScan(Model):
+    def run(self, input: AaveHealthFactorScanInput) -> AaveHealthFactorScanOutput:
+        aave_lending_pool = self.context.run_model(
+            'aave-v2.get-lending-pool', {}, return_type=Contract, local=True)
+
+        aave_lending_pool = get_eip1967_proxy_err(self.context,
+                                                  self.logger,
+                                                  aave_lending_pool.address,
+                                                  True)
+        if aave_lending_pool.proxy_for is not None:
+            aave_lending_pool.proxy_for.set_abi(AAVE_LENDING_POOL, set_loaded=True)
+
+        native_token = NativeToken()
+        return AaveBorrowerIndex.get(self.context, aave_lending_pool).scan(self.context, input, native_token.scaled)
+
+
 # credmark-dev run aave-v2.account-summary-historical -i '{"address": "0x57E04786E231Af3343562C062E0d058F25daCE9E", "window": "10 days", "interval": "1 days"}'  -b 16325819 -j
 
 @Model.describe(slug="aave-v2.account-summary-historical",
@@ -19,7 +19,13 @@ from credmark.cmf.types.compose import MapInputsOutput
 from credmark.cmf.types.series import BlockSeries
 from credmark.dto import DTOField
 
-from models.credmark.chain.contract import ContractEventsInput, ContractEventsOutput, fetch_events_with_range
+from models.credmark.chain.contract import ContractEventsInput, ContractEventsOutput
+from models.credmark.protocols.lending.aave.aave_health import (
+    AaveBorrowerIndex,
+    AaveHealthFactorScanInput,
+    AaveHealthFactorScanOutput,
+)
+from models.credmark.protocols.lending.aave.aave_transfers import ATokenTransferIndex
 from models.credmark.protocols.lending.aave.aave_v3_deployment import AaveV3
 
 
@@ -85,6 +91,30 @@ class AaveV3GetAccountSummary(AaveV3):
         return user_account_data
 
 
+# credmark-dev run aave-v3.health-factor-scan -i '{"limit": 10}' -b 17718495 -j
+# credmark-dev run aave-v3.health-factor-scan -i '{"limit": 10, "incremental": true}' -b 17718595 -j
+
+@Model.describe(slug="aave-v3.health-factor-scan",
+                version="0.1",
+                display_name="Aave V3 health factor scan",
+                description=("Aave V3 borrowers from the lending pool's Borrow/Repay/LiquidationCall events, "
+                             "ranked by health factor with their total collateral, debt and available borrows in base currency. "
+                             "The incremental mode re-reads only the borrowers with events since the last scan and those close to liquidation."),
+                category="protocol",
+                subcategory="aave-v3",
+                input=AaveHealthFactorScanInput,
+                output=AaveHealthFactorScanOutput)
+class AaveV3HealthFactorScan(AaveV3):
+    def run(self, input: AaveHealthFactorScanInput) -> AaveHealthFactorScanOutput:
+        base_info = self.get_ui_data_provider().base_info
+
+        def scaled(x):
+            return x / 10 ** base_info.networkBaseTokenPriceDecimals
+
+        aave_lending_pool = self.get_lending_pool()
+        return AaveBorrowerIndex.get(self.context, aave_lending_pool).scan(self.context, input, scaled)
+
+
 # credmark-dev run aave-v3.account-info -i '{"address": "0x8130ed5f79aA83d2dB5165EB35bc420B1A48898E"}' -b 17718495 -j
 # credmark-dev run aave-v3.account-info -i '{"address": "0x9b556c24ed6a8b0de593355ba2f6e43830b53699"}' -j -b 45221317 -c 137
 
@@ -215,7 +245,7 @@ class AaveV3LPAccountInfo4Reserve(AaveV3LPAccount):
 
 
 @Model.describe(slug="aave-v3.account-info-reserve",
-                version="1.1",
+                version="1.2",
                 display_name="Aave V3 user account info for one reserve token",
                 description="Aave V3 user balance (principal and interest) and debt",
                 category="protocol",
@@ -260,76 +290,9 @@ class AaveV3GetAccountInfoAsset(AaveV3):
 
         aToken = self.get_atoken(aToken_addresses[0])
 
-        # Fetch aToken transfer for an account
-        def _use_fetch_events():
-            _received = fetch_events_with_range(
-                self.logger,
-                aToken,
-                aToken.events.Transfer,
-                from_block=0,
-                to_block=None,
-                argument_filters={'to': user_address},
-                contract_address=aToken.address.checksum)
-            _sent = fetch_events_with_range(
-                self.logger,
-                aToken,
-                aToken.events.Transfer,
-                from_block=0,
-                to_block=None,
-                argument_filters={'from': user_address},
-                contract_address=aToken.address.checksum)
-
-            return _received, _sent
-
-        def use_contract_events():
-            if aToken.proxy_for and aToken.proxy_for.abi:
-                transfer_abi = aToken.proxy_for.abi.events.Transfer.raw_abi
-            elif aToken.abi:
-                transfer_abi = aToken.abi.events.Transfer.raw_abi
-            else:
-                raise ModelRunError('No abi found for aToken')
-
-            _received = self.context.run_model(
-                'contract.events',
-                ContractEventsInput(
-                    address=aToken.address,
-                    event_name='Transfer',
-                    event_abi=transfer_abi,
-                    argument_filters={'to': user_address},
-                    from_block=0),
-                return_type=ContractEventsOutput).records.to_dataframe()
-
-            _sent = self.context.run_model(
-                'contract.events',
-                ContractEventsInput(
-                    address=aToken.address,
-                    event_name='Transfer',
-                    event_abi=transfer_abi,
-                    argument_filters={'from': user_address},
-                    from_block=0),
-                return_type=ContractEventsOutput).records.to_dataframe()
-            return _received, _sent
-
-        _received, _sent = use_contract_events()
-
-        if _received.empty and _sent.empty:
-            atoken_tx = 0.0
-        elif _received.empty or _sent.empty:
-            _combined = pd.DataFrame()
-            if _received.empty:
-                _combined = _sent.assign(value=lambda x: x.value*-1)
-            elif _sent.empty:
-                _combined = _received
-            atoken_tx = aToken.scaled(_combined.value.sum())
-        else:
-            _combined = (pd.concat(
-                [_received.loc[:, ['blockNumber', 'logIndex', 'from', 'to', 'value']],
-                    (_sent.loc[:, ['blockNumber', 'logIndex', 'from',
-                                   'to', 'value']].assign(value=lambda x: x.value*-1))
-                 ])
-                .sort_values(['blockNumber', 'logIndex'])
-                .reset_index(drop=True))
-            atoken_tx = aToken.scaled(_combined.value.sum())
+        # Net aToken transfer of the account
+        atoken_tx = aToken.scaled(
+            ATokenTransferIndex.get(self.context, aToken).net_at(self.context, input.address, int(self.context.block_number)))
 
         token_info = {}
         token_info['tokenSymbol'] = reserve_token.symbol
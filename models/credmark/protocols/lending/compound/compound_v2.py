@@ -2,7 +2,7 @@
 
 import math
 from collections import namedtuple
-from typing import cast
+from typing import List, cast
 
 import numpy as np
 from credmark.cmf.model import Model
@@ -10,6 +10,7 @@ from credmark.cmf.model.errors import ModelRunError
 from credmark.cmf.types import (
     Account,
     Address,
+    BlockNumber,
     Contract,
     Maybe,
     Network,
@@ -20,8 +21,10 @@ from credmark.cmf.types import (
     Token,
 )
 from credmark.cmf.types.compose import MapInputsOutput
-from credmark.dto import DTO
+from credmark.cmf.types.series import BlockSeries, BlockSeriesRow
+from credmark.dto import DTO, DTOField
 
+from models.credmark.tokens.token_metadata import TokenMetadataResolver
 from models.dtos.tvl import LendingPoolPortfolios
 
 np.seterr(all='raise')
@@ -185,8 +188,12 @@ class CompoundV2Meta(Model):
         return token
 
     def get_rates(self, ctoken):
-        borrowRate = cast(int, ctoken.functions.borrowRatePerBlock().call()) / self.ETH_MANTISSA
-        supplyRate = cast(int, ctoken.functions.supplyRatePerBlock().call()) / self.ETH_MANTISSA
+        return self.calc_rates(cast(int, ctoken.functions.borrowRatePerBlock().call()),
+                               cast(int, ctoken.functions.supplyRatePerBlock().call()))
+
+    def calc_rates(self, borrow_rate_per_block: int, supply_rate_per_block: int):
+        borrowRate = borrow_rate_per_block / self.ETH_MANTISSA
+        supplyRate = supply_rate_per_block / self.ETH_MANTISSA
 
         supplyAPY = (supplyRate * self.BLOCKS_PER_DAY +
                      1) ** self.DAYS_PER_YEAR - 1
@@ -196,6 +203,165 @@ class CompoundV2Meta(Model):
         Rates = namedtuple('Point', ['borrowRate', 'supplyRate', 'supplyAPY', 'borrowAPY'])
         return Rates(borrowRate, supplyRate, supplyAPY, borrowAPY)
 
+    def get_pool_infos(self, context, ctoken_addresses: list[Address]) -> list[CompoundV2PoolInfo]:
+        """
+        Info of the markets at the block of the context (see compound-v2.pool-info).
+
+        The reads of all cTokens and the comptroller go in one batch of calls. The cToken and
+        underlying metadata, with the symbols at the block (cSAI is renamed to cDAI), go in
+        another batch.
+        """
+        comptroller = self.get_comptroller()
+        cTokens = [Token(address=addr) for addr in ctoken_addresses]
+        cTokens_meta = TokenMetadataResolver(context).resolve([cToken.address for cToken in cTokens])
+
+        cSAI = Address(self.CTOKENS[self.context.network]['cSAI'])
+        fixed_underlying = {}
+        for cToken, cToken_meta in zip(cTokens, cTokens_meta):
+            if cToken_meta['symbol'] == 'cETH':
+                fixed_underlying[cToken.address] = Address(self.ASSETS[self.context.network]['WETH'])
+            elif cToken.address == cSAI and cToken_meta['symbol'] == 'cDAI':
+                # When input = cSAI, it has been renamed to cDAI in the contract.
+                # We will still call up SAI
+                fixed_underlying[cToken.address] = Address(self.ASSETS[self.context.network]['SAI'])
+
+        fields = ['markets', 'isCToken', 'admin', 'comptroller', 'interestRateModel',
+                  'getCash', 'totalBorrows', 'totalReserves', 'totalSupply', 'exchangeRateCurrent',
+                  'reserveFactorMantissa', 'borrowRatePerBlock', 'supplyRatePerBlock', 'underlying']
+        calls = []
+        for cToken in cTokens:
+            calls.extend([comptroller.functions.markets(cToken.address.checksum),
+                          cToken.functions.isCToken(),
+                          cToken.functions.admin(),
+                          cToken.functions.comptroller(),
+                          cToken.functions.interestRateModel(),
+                          cToken.functions.getCash(),
+                          cToken.functions.totalBorrows(),
+                          cToken.functions.totalReserves(),
+                          cToken.functions.totalSupply(),
+                          cToken.functions.exchangeRateCurrent(),
+                          cToken.functions.reserveFactorMantissa(),
+                          cToken.functions.borrowRatePerBlock(),
+                          cToken.functions.supplyRatePerBlock()])
+            if cToken.address not in fixed_underlying:
+                calls.append(cToken.functions.underlying())
+
+        results = iter(context.web3_batch.call(calls, unwrap=True, require_success=True))
+        reads = []
+        for cToken in cTokens:
+            read = dict(zip(fields, results))
+            if cToken.address in fixed_underlying:
+                read['underlying'] = fixed_underlying[cToken.address]
+            reads.append(read)
+
+        tokens_meta = TokenMetadataResolver(context).resolve([Address(read['underlying']) for read in reads])
+
+        block_dt = context.block_number.timestamp_datetime.replace(
+            tzinfo=None).isoformat()
+
+        pool_infos = []
+        for cToken, cToken_meta, token_meta, read in zip(cTokens, cTokens_meta, tokens_meta, reads):
+            isListed, collateralFactorMantissa, isComped = cast(tuple[bool, int, bool], read['markets'])
+
+            # Check for cToken to be matched with a Token
+            assert read['isCToken']
+            assert read['admin'] == Address(self.TIMELOCK[self.context.network])
+            assert read['comptroller'] == Address(comptroller.address)
+
+            token = Token(address=read['underlying'])
+            token_scale = pow(10, token_meta['decimals'])
+
+            cash = read['getCash'] / token_scale
+            totalBorrows = read['totalBorrows'] / token_scale
+            totalReserves = read['totalReserves'] / token_scale
+            totalcTokenSupply = read['totalSupply'] / pow(10, cToken_meta['decimals'])
+
+            exchangeRate = read['exchangeRateCurrent'] / token_scale
+            invExchangeRate = 1 / exchangeRate * pow(10, 10)
+            totalLiability = totalcTokenSupply / invExchangeRate
+
+            reserveFactor = read['reserveFactorMantissa'] / self.ETH_MANTISSA
+
+            if math.isclose(cash + totalBorrows - totalReserves, 0):
+                utilizationRate = 0
+            else:
+                utilizationRate = totalBorrows / (cash + totalBorrows - totalReserves)
+
+            rates = self.calc_rates(read['borrowRatePerBlock'], read['supplyRatePerBlock'])
+
+            pool_infos.append(CompoundV2PoolInfo(
+                tokenSymbol=cToken_meta['symbol'],
+                cTokenSymbol=cToken_meta['symbol'],
+                tokenDecimal=token_meta['decimals'],
+                cTokenDecimal=cToken_meta['decimals'],
+                token=token,
+                cToken=cToken,
+                cash=cash,
+                totalReserves=totalReserves,
+                totalBorrows=totalBorrows,
+                totalLiability=totalLiability,
+                totalcTokenSupply=totalcTokenSupply,
+                exchangeRate=exchangeRate,
+                invExchangeRate=invExchangeRate,
+                borrowRate=rates.borrowRate,
+                supplyRate=rates.supplyRate,
+                supplyAPY=rates.supplyAPY,
+                borrowAPY=rates.borrowAPY,
+                utilizationRate=utilizationRate,
+                reserveFactor=reserveFactor,
+                isListed=isListed,
+                collateralFactor=collateralFactorMantissa / pow(10, 18),
+                isComped=isComped,
+                block_number=int(context.block_number),
+                block_datetime=block_dt,
+                ir_model=Contract(address=read['interestRateModel']),
+            ))
+
+        return pool_infos
+
+    def get_pool_values(self, pool_infos: list[CompoundV2PoolInfo], prices: list[Maybe[PriceWithQuote]]) -> list[CompoundV2PoolValue]:
+        pool_values = []
+        for pool_info, price in zip(pool_infos, prices):
+            tp = price.just
+            if tp is None or tp.price is None or tp.src is None:
+                raise ModelRunError(
+                    f'Can not get price for token {pool_info.tokenSymbol=}/{pool_info.token.address=}')
+
+            pool_values.append(CompoundV2PoolValue(
+                token=pool_info.token,
+                cToken=pool_info.cToken,
+                tokenSymbol=pool_info.tokenSymbol,
+                cTokenSymbol=pool_info.cTokenSymbol,
+                token_price=tp,
+                qty_cash=pool_info.cash,
+                qty_borrow=pool_info.totalBorrows,
+                qty_liability=pool_info.totalLiability,
+                qty_reserve=pool_info.totalReserves,
+                qty_net=(pool_info.totalLiability +
+                         pool_info.totalReserves - pool_info.totalBorrows),
+                cash=tp.price * pool_info.cash,
+                borrow=tp.price * pool_info.totalBorrows,
+                liability=tp.price * pool_info.totalLiability,
+                reserve=tp.price * pool_info.totalReserves,
+                net=tp.price * (pool_info.totalLiability +
+                                pool_info.totalReserves - pool_info.totalBorrows),
+                block_number=pool_info.block_number,
+                block_datetime=pool_info.block_datetime,
+            ))
+        return pool_values
+
+    def get_prices(self, context, pool_infos: list[CompoundV2PoolInfo]) -> list[Maybe[PriceWithQuote]]:
+        """
+        Prices of the underlying tokens from price.dex-maybe at the block of the context, in one batch
+        """
+        prices = context.run_model(
+            'compose.map-inputs',
+            {'modelSlug': 'price.dex-maybe',
+             'modelInputs': [{'base': pool_info.token} for pool_info in pool_infos]},
+            return_type=MapInputsOutput[dict, Maybe[PriceWithQuote]])
+        return [price.output if price.output is not None else Maybe[PriceWithQuote].none()
+                for price in prices]
+
 
 @Model.describe(slug="compound-v2.get-comptroller",
                 version="1.2",
@@ -235,103 +401,77 @@ class CompoundV2GetAllPools(CompoundV2Meta):
 
 
 @Model.describe(slug="compound-v2.all-pools-info",
-                version="1.6",
+                version="1.7",
                 display_name="Compound V2 - get all pool info",
                 description="Get all pools and query for their info (deposit, borrow, rates)",
                 category='protocol',
                 subcategory='compound',
                 output=Some[CompoundV2PoolInfo])
-class CompoundV2AllPoolsInfo(Model):
+class CompoundV2AllPoolsInfo(CompoundV2Meta):
     def run(self, _) -> Some[CompoundV2PoolInfo]:
-        pools = self.context.run_model('compound-v2.get-pools', {})
-
-        model_slug = 'compound-v2.pool-info'
-        model_inputs = [Token(address=cTokenAddress)
-                        for cTokenAddress in pools['some']]
-
-        def _use_compose():
-            all_pool_infos_results = self.context.run_model(
-                slug='compose.map-inputs',
-                input={'modelSlug': model_slug,
-                       'modelInputs': model_inputs},
-                return_type=MapInputsOutput[dict, CompoundV2PoolInfo]
-            )
-
-            pool_infos = []
-            for pool_n, pool_result in enumerate(all_pool_infos_results):
-                if pool_result.output is not None:
-                    pool_infos.append(pool_result.output)
-                elif pool_result.error is not None:
-                    self.logger.error(pool_result.error)
-                    raise ModelRunError(f'Error with {model_slug}({model_inputs[pool_n]}). ' +
-                                        pool_result.error.message)
-                else:
-                    raise ModelRunError(
-                        'compose.map-inputs: output/error cannot be both None')
-            return pool_infos
-
-        def _use_for():
-            pool_infos = [self.context.run_model(model_slug, m_input, return_type=CompoundV2PoolInfo)
-                          for m_input in model_inputs]
-            return pool_infos
-
-        pool_infos = _use_for()
-
-        ret = Some[CompoundV2PoolInfo](some=pool_infos)
-        return ret
+        pools = self.context.run_model('compound-v2.get-pools', {}, return_type=Some[Address])
+        pool_infos = self.get_pool_infos(self.context, pools.some)
+        return Some[CompoundV2PoolInfo](some=pool_infos)
 
 
 @Model.describe(slug="compound-v2.all-pools-value",
-                version="0.6",
+                version="0.7",
                 display_name="Compound V2 - get all pools value",
                 description="Compound V2 - convert pool's info to value",
                 category='protocol',
                 subcategory='compound',
                 output=Some[CompoundV2PoolValue])
-class CompoundV2AllPoolsValue(Model):
+class CompoundV2AllPoolsValue(CompoundV2Meta):
     def run(self, _) -> Some[CompoundV2PoolValue]:
-        pools = self.context.run_model(
-            'compound-v2.get-pools', {}, return_type=Some[Address])
-        model_slug = 'compound-v2.pool-value'
-        model_inputs = [Token(address=cTokenAddress.checksum)
-                        for cTokenAddress in pools.some]
-
-        def _use_compose():
-            all_pool_infos = self.context.run_model(
-                slug='compose.map-inputs',
-                input={'modelSlug': model_slug,
-                       'modelInputs': model_inputs},
-                return_type=MapInputsOutput[dict, CompoundV2PoolValue]
-            )
-
-            pool_infos = []
-            for pool_n, pool_result in enumerate(all_pool_infos):
-                if pool_result.output is not None:
-                    pool_infos.append(pool_result.output)
-                elif pool_result.error is not None:
-                    self.logger.error(pool_result.error)
-                    raise ModelRunError(f'Error with {model_slug}({model_inputs[pool_n]}). ' +
-                                        pool_result.error.message)
-                else:
-                    raise ModelRunError(
-                        'compose.map-inputs: output/error cannot be both None')
-            return pool_infos
-
-        def _use_for():
-            pool_values = []
-            for pool_token in model_inputs:
-                pool_value = self.context.run_model(
-                    slug='compound-v2.pool-value',
-                    input=pool_token,
-                    return_type=CompoundV2PoolValue)
-                pool_values.append(pool_value)
-            return pool_values
-
-        # use_for() here, use_compose() would cause problem
-        pool_infos = _use_for()
-
-        ret = Some[CompoundV2PoolValue](some=pool_infos)
-        return ret
+        pools = self.context.run_model('compound-v2.get-pools', {}, return_type=Some[Address])
+        pool_infos = self.get_pool_infos(self.context, pools.some)
+
+        prices = self.get_prices(self.context, pool_infos)
+
+        return Some[CompoundV2PoolValue](some=self.get_pool_values(pool_infos, prices))
+
+
+class CompoundV2BlocksInput(DTO):
+    block_numbers: List[int] = DTOField(description="List of blocks to run")
+
+    class Config:
+        schema_extra = {
+            "examples": [{"block_numbers": [17_000_000, 17_007_200, 17_014_400]}]}
+
+# credmark-dev run compound-v2.all-pools-value-blocks -i '{"block_numbers": [17000000, 17007200, 17014400]}' -b 17014400 -j
+
+
+@Model.describe(slug="compound-v2.all-pools-value-blocks",
+                version="0.1",
+                display_name="Compound V2 - get all pools value for blocks",
+                description=("Compound V2 - value of all markets at each of the blocks, "
+                             "with the market reads and the prices batched per block"),
+                category='protocol',
+                subcategory='compound',
+                input=CompoundV2BlocksInput,
+                output=BlockSeries[List[CompoundV2PoolValue]])
+class CompoundV2AllPoolsValueBlocks(CompoundV2Meta):
+    def run(self, input: CompoundV2BlocksInput) -> BlockSeries[List[CompoundV2PoolValue]]:
+        block_numbers = sorted(set(input.block_numbers))
+        if len(block_numbers) > 0 and block_numbers[-1] > self.context.block_number:
+            raise ModelRunError(f'Request block number ({block_numbers[-1]}) is '
+                                f'larger than current block number {self.context.block_number}')
+
+        series = []
+        for block_number in block_numbers:
+            with self.context.fork(block_number=block_number) as past_context:
+                pools = past_context.run_model('compound-v2.get-pools', {}, return_type=Some[Address])
+                pool_infos = self.get_pool_infos(past_context, pools.some)
+                prices = self.get_prices(past_context, pool_infos)
+
+            block = BlockNumber(block_number)
+            series.append(BlockSeriesRow(
+                blockNumber=block_number,
+                blockTimestamp=block.timestamp,
+                sampleTimestamp=block.sample_timestamp,
+                output=self.get_pool_values(pool_infos, prices)))
+
+        return BlockSeries(series=series)
 
 
 class CompoundV2Token(Token):
@@ -343,7 +483,7 @@ class CompoundV2Token(Token):
 
 
 @Model.describe(slug="compound-v2.pool-info",
-                version="1.8",
+                version="1.9",
                 display_name="Compound V2 - pool/market information",
                 description="Compound V2 - pool/market information",
                 category='protocol',
@@ -389,107 +529,7 @@ class CompoundV2GetPoolInfo(CompoundV2Meta):
         assert assets == compound_ctokens
 
     def run(self, input: CompoundV2Token) -> CompoundV2PoolInfo:
-        comptroller = self.get_comptroller()
-
-        cToken = Token(address=input.address)
-
-        # self.logger.info(f'{cToken._meta.is_transparent_proxy}')
-        # self.logger.info(f'{cToken.is_transparent_proxy}')
-
-        isListed, collateralFactorMantissa, isComped = \
-            cast(tuple[bool, int, bool],
-                 comptroller.functions.markets(cToken.address).call())
-
-        collateralFactorMantissa /= pow(10, 18)
-
-        # From cToken to Token
-        token = self.get_token_from_ctoken(input)
-
-        self.logger.info(f'{cToken.address, cToken.symbol}')
-
-        # Check for cToken to be matched with a Token
-        assert cToken.functions.isCToken().call()
-
-        # TODO: disable this test as we did not have loading ABI by block_number
-        # if cToken.proxy_for is not None:
-        #    try:
-        #        assert cToken.functions.implementation().call() == cToken.proxy_for.address
-        #    except AssertionError:
-        #        self.logger.error(f'{cToken.functions.implementation().call()}, '
-        #                          f'{cToken.proxy_for.address=}')
-
-        assert cToken.functions.admin().call() == Address(
-            self.TIMELOCK[self.context.network])
-        assert cToken.functions.comptroller().call() == Address(comptroller.address)
-        assert cToken.functions.symbol().call()
-        if cToken.name != 'Compound Ether':
-            assert cToken.functions.underlying().call() == token.address
-
-        # Get/calculate info
-
-        irModel = Contract(address=cToken.functions.interestRateModel().call())
-        _ = irModel.functions.isInterestRateModel().call()
-        # self.logger.info(f'{irModel.address=}, {irModel.functions.isInterestRateModel().call()=}')
-
-        # Cash is market liquidity ~ Liability + Reserve - Borrow, use it for TVL
-        # totalLiability is converted from cToken's supply to the actual redeemable amount
-
-        cash = token.scaled(cToken.functions.getCash().call())
-        totalBorrows = token.scaled(cToken.functions.totalBorrows().call())
-        totalReserves = token.scaled(cToken.functions.totalReserves().call())
-        totalcTokenSupply = cToken.scaled(
-            cToken.functions.totalSupply().call())
-
-        exchangeRate = token.scaled(
-            cToken.functions.exchangeRateCurrent().call())
-        invExchangeRate = 1 / exchangeRate * pow(10, 10)
-        totalLiability = totalcTokenSupply / invExchangeRate
-
-        reserveFactor = cast(
-            int, cToken.functions.reserveFactorMantissa().call()) / self.ETH_MANTISSA
-
-        if math.isclose(cash + totalBorrows - totalReserves, 0):
-            utilizationRate = 0
-        else:
-            utilizationRate = totalBorrows / (cash + totalBorrows - totalReserves)
-
-        # By definition, this is how supplyRate is derived.
-        # supplyRate ~= borrowRate * utilizationRate * (1 - reserveFactor)
-        # borrowRate, supplyRate, borrowAPY, supplyAPY
-        rates = self.get_rates(cToken)
-
-        block_dt = self.context.block_number.timestamp_datetime.replace(
-            tzinfo=None).isoformat()
-
-        pool_info = CompoundV2PoolInfo(
-            tokenSymbol=input.symbol,
-            cTokenSymbol=cToken.symbol,
-            tokenDecimal=token.decimals,
-            cTokenDecimal=cToken.decimals,
-            token=token,
-            cToken=cToken,
-            cash=cash,
-            totalReserves=totalReserves,
-            totalBorrows=totalBorrows,
-            totalLiability=totalLiability,
-            totalcTokenSupply=totalcTokenSupply,
-            exchangeRate=exchangeRate,
-            invExchangeRate=invExchangeRate,
-            borrowRate=rates.borrowRate,
-            supplyRate=rates.supplyRate,
-            supplyAPY=rates.supplyAPY,
-            borrowAPY=rates.borrowAPY,
-            utilizationRate=utilizationRate,
-            reserveFactor=reserveFactor,
-            isListed=isListed,
-            collateralFactor=collateralFactorMantissa,
-            isComped=isComped,
-            block_number=int(self.context.block_number),
-            block_datetime=block_dt,
-            ir_model=irModel,
-        )
-
-        return pool_info
+        return self.get_pool_infos(self.context, [input.address])[0]
 
 
 @Model.describe(slug="compound-v2.pool-value",
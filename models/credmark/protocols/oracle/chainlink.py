@@ -6,6 +6,7 @@ from typing import Any, cast
 from credmark.cmf.model import Model
 from credmark.cmf.model.errors import ModelDataError, ModelEngineError, ModelRunError
 from credmark.cmf.types import (
+    Address,
     BlockNumberOutOfRangeError,
     Contract,
     Maybe,
@@ -17,6 +18,7 @@ from credmark.dto import DTO, DTOField
 from ens import ENS
 from web3.exceptions import ContractLogicError
 
+from models.credmark.protocols.oracle.chainlink_rounds import ChainlinkRoundIndex
 from models.dtos.price import PriceInput
 from models.tmp_abi_lookup import CHAINLINK_AGG, FEED_REGISTRY
 
@@ -94,7 +96,7 @@ class ChainlinkFeedContract(Contract):
 
 @Model.describe(
     slug="chainlink.price-by-feed",
-    version="1.4",
+    version="1.5",
     display_name="Chainlink - Price by feed",
     description="Input a Chainlink valid feed",
     category="protocol",
@@ -110,23 +112,32 @@ class ChainLinkPriceByFeed(Model):
         except (ModelDataError, ModelEngineError):
             feed_contract = feed_contract.set_abi(CHAINLINK_AGG, set_loaded=True)
 
-        (_roundId, answer, _startedAt, _updatedAt, _answeredInRound) = cast(
-            tuple[int, int, int, int, int], feed_contract.functions.latestRoundData().call()
-        )
-        decimals = cast(int, feed_contract.functions.decimals().call())
-        description = cast(str, feed_contract.functions.description().call())
-        version = cast(int, feed_contract.functions.version().call())
-
         feed = input.address
+        aggregator = None
         if feed_contract.abi is not None and "aggregator" in feed_contract.abi.functions:
             try:
                 feed = feed_contract.functions.aggregator().call()
+                aggregator = feed
             except Exception:
                 # Exception might occur when ABI is set manually
                 pass
 
         isFeedEnabled = None
 
+        round_data = None
+        if aggregator is not None:
+            round_data = ChainlinkRoundIndex.latest_round(self.context, Address(aggregator))
+
+        if round_data is not None:
+            (_roundId, answer, _updatedAt, _answeredInRound), (decimals, description, version) = round_data
+        else:
+            (_roundId, answer, _startedAt, _updatedAt, _answeredInRound) = cast(
+                tuple[int, int, int, int, int], feed_contract.functions.latestRoundData().call()
+            )
+            decimals = cast(int, feed_contract.functions.decimals().call())
+            description = cast(str, feed_contract.functions.description().call())
+            version = cast(int, feed_contract.functions.version().call())
+
         time_diff = self.context.block_number.timestamp - _updatedAt
         round_diff = _answeredInRound - _roundId
         return Price(
@@ -177,7 +188,7 @@ class ChainLinkFeedFromRegistryMaybe(Model):
 
 @Model.describe(
     slug="chainlink.price-by-registry",
-    version="1.7",
+    version="1.8",
     display_name="Chainlink - Price by Registry",
     description="Looking up Registry for two tokens' addresses",
     category="protocol",
@@ -196,27 +207,32 @@ class ChainLinkPriceByRegistry(Model):
         try:
             sys.tracebacklimit = 0
             feed = registry.functions.getFeed(base_address, quote_address).call()
-            [round_data, decimals, description, version, is_feed_enabled] = (
-                self.context.web3_batch.call(
-                    [
-                        registry.functions.latestRoundData(base_address, quote_address),
-                        registry.functions.decimals(base_address, quote_address),
-                        registry.functions.description(base_address, quote_address),
-                        registry.functions.version(base_address, quote_address),
-                        registry.functions.isFeedEnabled(feed),
-                    ],
-                    unwrap=True,
-                    require_success=True,
+            round_index_data = ChainlinkRoundIndex.latest_round(self.context, Address(feed))
+            if round_index_data is not None:
+                (_roundId, answer, _updatedAt, _answeredInRound), (decimals, description, version) = round_index_data
+                is_feed_enabled = cast(bool, registry.functions.isFeedEnabled(feed).call())
+            else:
+                [round_data, decimals, description, version, is_feed_enabled] = (
+                    self.context.web3_batch.call(
+                        [
+                            registry.functions.latestRoundData(base_address, quote_address),
+                            registry.functions.decimals(base_address, quote_address),
+                            registry.functions.description(base_address, quote_address),
+                            registry.functions.version(base_address, quote_address),
+                            registry.functions.isFeedEnabled(feed),
+                        ],
+                        unwrap=True,
+                        require_success=True,
+                    )
                 )
-            )
 
-            (_roundId, answer, _startedAt, _updatedAt, _answeredInRound) = cast(
-                tuple[int, int, int, int, int], round_data
-            )
-            decimals = cast(int, decimals)
-            description = cast(str, description)
-            version = cast(int, version)
-            is_feed_enabled = cast(bool, is_feed_enabled)
+                (_roundId, answer, _startedAt, _updatedAt, _answeredInRound) = cast(
+                    tuple[int, int, int, int, int], round_data
+                )
+                decimals = cast(int, decimals)
+                description = cast(str, description)
+                version = cast(int, version)
+                is_feed_enabled = cast(bool, is_feed_enabled)
 
             time_diff = self.context.block_number.timestamp - _updatedAt
             round_diff = _answeredInRound - _roundId
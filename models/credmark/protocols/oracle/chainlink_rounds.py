@@ -0,0 +1,141 @@
+# pylint: disable=line-too-long
+
+"""
+Rounds of Chainlink aggregators from their events
+"""
+
+from typing import Optional, cast
+
+import numpy as np
+from credmark.cmf.model import ModelContext
+from credmark.cmf.model.errors import ModelDataError
+from credmark.cmf.types import Address, Contract
+from requests.exceptions import HTTPError
+from web3.exceptions import BadFunctionCallOutput, ContractLogicError
+
+from models.credmark.chain.contract import fetch_events_with_range
+from models.tmp_abi_lookup import CHAINLINK_AGG
+
+# (roundId, answer, updatedAt, answeredInRound)
+ChainlinkRound = tuple[int, int, int, int]
+
+
+class ChainlinkRoundIndex:
+    """
+    Rounds of a Chainlink aggregator by block, from its AnswerUpdated events.
+
+    The index starts at the first block it is asked for, with the latest round read from the
+    aggregator there, and follows the AnswerUpdated events as later blocks are asked. A series
+    of blocks then reads the events once instead of the aggregator at each block, while a single
+    read costs no more than reading the aggregator. The round at a block is the last one at or
+    before it, found by binary search.
+
+    Blocks before the start are not answered, to be read from the feed instead. A block more than
+    MAX_EVENT_BLOCKS after the last one asked starts the index again there.
+
+    An index answers for the aggregator only. The caller resolves the aggregator of a proxy
+    or the registry at the block, as it changes when a feed is upgraded.
+    """
+
+    # (chain id, aggregator address) => index, None for an aggregator without one
+    INDEXES: dict[tuple[int, Address], Optional['ChainlinkRoundIndex']] = {}
+    MAX_EVENT_BLOCKS = 100_000
+
+    def __init__(self, aggregator_addr: Address):
+        self.aggregator = Contract(address=aggregator_addr).set_abi(CHAINLINK_AGG, set_loaded=True)
+        # (decimals, description, version)
+        self.feed_info: tuple[int, str, int] = (0, '', 0)
+
+        # rounds in the order of (block number, log index)
+        self.block_numbers = np.array([], dtype=np.int64)
+        self.rounds: list[ChainlinkRound] = []
+        # the index answers for blocks from start_block, with events up to synced_to
+        self.start_block = -1
+        self.synced_to = -1
+
+    @classmethod
+    def latest_round(cls, context: ModelContext, aggregator_addr: Address) -> Optional[tuple[ChainlinkRound, tuple[int, str, int]]]:
+        """
+        ((roundId, answer, updatedAt, answeredInRound), (decimals, description, version)) of the
+        aggregator at the current block, None to read the feed instead.
+        """
+        key = (context.chain_id, Address(aggregator_addr))
+        block_number = int(context.block_number)
+
+        if key not in cls.INDEXES:
+            index = cls(Address(aggregator_addr))
+            try:
+                index.start(context, block_number)
+            except (ContractLogicError, BadFunctionCallOutput, ModelDataError, OverflowError, ValueError):
+                # The aggregator may not implement the interface of CHAINLINK_AGG
+                cls.INDEXES[key] = None
+                return None
+            cls.INDEXES[key] = index
+
+        index = cls.INDEXES[key]
+        if index is None:
+            return None
+
+        round_at = index.round_at(context, block_number)
+        if round_at is None:
+            return None
+        return round_at, index.feed_info
+
+    def start(self, context: ModelContext, block_number: int):
+        """
+        Start the index at the block with the latest round of the aggregator
+        """
+        round_data, decimals, description, version = context.web3_batch.call(
+            [self.aggregator.functions.latestRoundData(),
+             self.aggregator.functions.decimals(),
+             self.aggregator.functions.description(),
+             self.aggregator.functions.version()],
+            unwrap=True)
+        round_id, answer, _started_at, updated_at, answered_in_round = cast(
+            tuple[int, int, int, int, int], round_data)
+
+        self.feed_info = (cast(int, decimals), cast(str, description), cast(int, version))
+        self.block_numbers = np.array([block_number], dtype=np.int64)
+        self.rounds = [(round_id, answer, updated_at, answered_in_round)]
+        self.start_block = block_number
+        self.synced_to = block_number
+
+    def sync(self, block_number: int):
+        if block_number <= self.synced_to:
+            return
+
+        df_events = fetch_events_with_range(None,
+                                            self.aggregator,
+                                            self.aggregator.events.AnswerUpdated,
+                                            from_block=self.synced_to + 1,
+                                            to_block=block_number)
+        if not df_events.empty:
+            df_events = df_events.sort_values(['blockNumber', 'logIndex'])
+            self.block_numbers = np.concatenate(
+                [self.block_numbers, df_events['blockNumber'].to_numpy(dtype=np.int64)])
+            # A round updated by AnswerUpdated is answered in itself
+            self.rounds.extend((int(round_id), int(answer), int(updated_at), int(round_id))
+                               for round_id, answer, updated_at
+                               in zip(df_events['roundId'], df_events['current'], df_events['updatedAt']))
+        self.synced_to = block_number
+
+    def round_at(self, context: ModelContext, block_number: int) -> Optional[ChainlinkRound]:
+        """
+        The last round at or before the block, None if the block is before the start of the index
+        or the events can not be read.
+        """
+        if block_number < self.start_block:
+            return None
+
+        try:
+            if block_number - self.synced_to > self.MAX_EVENT_BLOCKS:
+                self.start(context, block_number)
+            else:
+                self.sync(block_number)
+        except (HTTPError, ValueError, ContractLogicError, BadFunctionCallOutput, ModelDataError):
+            return None
+
+        n = int(np.searchsorted(self.block_numbers, block_number, side='right')) - 1
+        if n < 0:
+            return None
+        return self.rounds[n]
@@ -1,6 +1,7 @@
 # pylint:disable=line-too-long
 from typing import List, Union
 
+import pandas as pd
 from credmark.cmf.model import Model
 from credmark.cmf.model.errors import ModelRunError
 from credmark.cmf.types import (
@@ -14,6 +15,8 @@ from credmark.cmf.types import (
 )
 from credmark.dto import DTO, DTOField, IterableListGenericDTO, PrivateAttr
 
+from models.credmark.tokens.rolling_segments import RollingSegments
+
 
 class TokenNetflowBlockInput(DTO):
     netflow_address: Address = DTOField(..., description="Netflow address")
@@ -265,6 +268,13 @@ class TokenOutflowWindow(Model):
 
 class TokenNetflowSegmentBlockInput(TokenNetflowBlockInput):
     n: int = DTOField(2, ge=1, description="Number of interval to count")
+    rolling: bool = DTOField(
+        default=False,
+        description=(
+            "Align the segments to multiples of the segment length, the last one ending at the current block, "
+            "and keep the completed segments for the next runs"
+        ),
+    )
 
 
 class TokenNetflowSegmentOutput(DTO):
@@ -274,7 +284,7 @@ class TokenNetflowSegmentOutput(DTO):
 
 @Model.describe(
     slug="token.netflow-segment-block",
-    version="1.5",
+    version="1.6",
     display_name="Token netflow by segment by block",
     description="The Current Credmark Supported netflow algorithm",
     category="protocol",
@@ -327,8 +337,79 @@ class TokenVolumeSegmentBlock(Model):
             )
 
         native_token = NativeToken()
-        if token_address == native_token.address:
-            input_token = native_token
+        input_token = native_token if token_address == native_token.address else input.token
+
+        if input.rolling:
+            segments = RollingSegments(
+                self.context, ("netflow", token_address, input.netflow_address), block_seg, input.n
+            )
+
+            def _aggregate(from_block: int, to_block: int) -> pd.DataFrame:
+                if token_address == native_token.address:
+                    with self.context.ledger.Transaction as q:
+                        return q.select(
+                            aggregates=[
+                                segments.segment_aggregate(q.BLOCK_NUMBER),
+                                (
+                                    f"SUM(CASE WHEN {q.TO_ADDRESS.eq(input.netflow_address)} "
+                                    f"THEN {q.VALUE} ELSE 0::INTEGER END)",
+                                    "inflow",
+                                ),
+                                (
+                                    f"SUM(CASE WHEN {q.FROM_ADDRESS.eq(input.netflow_address)} "
+                                    f"THEN {q.VALUE} ELSE 0::INTEGER END)",
+                                    "outflow",
+                                ),
+                                (
+                                    f"SUM(CASE WHEN {q.TO_ADDRESS.eq(input.netflow_address)} "
+                                    f"THEN {q.VALUE} ELSE {q.VALUE.neg_()} END)",
+                                    "netflow",
+                                ),
+                            ],
+                            where=q.BLOCK_NUMBER.ge(from_block)
+                            .and_(q.BLOCK_NUMBER.le(to_block))
+                            .and_(
+                                q.TO_ADDRESS.eq(input.netflow_address)
+                                .or_(q.FROM_ADDRESS.eq(input.netflow_address))
+                                .parentheses_()
+                            ),
+                            group_by=['"seg_n"'],
+                            bigint_cols=["seg_n"],
+                        ).to_dataframe()
+                with self.context.ledger.TokenTransfer as q:
+                    return q.select(
+                        aggregates=[
+                            segments.segment_aggregate(q.BLOCK_NUMBER),
+                            (
+                                f"SUM(CASE WHEN {q.TO_ADDRESS.eq(input.netflow_address)} "
+                                f"THEN {q.RAW_AMOUNT} ELSE 0::INTEGER END)",
+                                "inflow",
+                            ),
+                            (
+                                f"SUM(CASE WHEN {q.FROM_ADDRESS.eq(input.netflow_address)} "
+                                f"THEN {q.RAW_AMOUNT} ELSE 0::INTEGER END)",
+                                "outflow",
+                            ),
+                            (
+                                f"SUM(CASE WHEN {q.TO_ADDRESS.eq(input.netflow_address)} "
+                                f"THEN {q.RAW_AMOUNT} ELSE {q.RAW_AMOUNT.neg_()} END)",
+                                "netflow",
+                            ),
+                        ],
+                        where=q.TOKEN_ADDRESS.eq(token_address)
+                        .and_(q.BLOCK_NUMBER.ge(from_block))
+                        .and_(q.BLOCK_NUMBER.le(to_block))
+                        .and_(
+                            q.TO_ADDRESS.eq(input.netflow_address)
+                            .or_(q.FROM_ADDRESS.eq(input.netflow_address))
+                            .parentheses_()
+                        ),
+                        group_by=['"seg_n"'],
+                        bigint_cols=["seg_n"],
+                    ).to_dataframe()
+
+            df = pd.DataFrame(segments.rows(_aggregate, ["inflow", "outflow", "netflow"]))
+        elif token_address == native_token.address:
             with self.context.ledger.Transaction.as_("t") as t, self.context.ledger.Block.as_(
                 "s"
             ) as s, self.context.ledger.Block.as_("e") as e:
@@ -385,8 +466,9 @@ class TokenVolumeSegmentBlock(Model):
                 ).to_dataframe()
 
                 from_iso8601_str = t.field("").from_iso8601_str
+            df["from_timestamp"] = df["from_timestamp"].apply(from_iso8601_str)
+            df["to_timestamp"] = df["to_timestamp"].apply(from_iso8601_str)
         else:
-            input_token = input.token
             with self.context.ledger.TokenTransfer.as_("t") as t, self.context.ledger.Block.as_(
                 "s"
             ) as s, self.context.ledger.Block.as_("e") as e:
@@ -439,6 +521,8 @@ class TokenVolumeSegmentBlock(Model):
                 ).to_dataframe()
 
                 from_iso8601_str = t.field("").from_iso8601_str
+            df["from_timestamp"] = df["from_timestamp"].apply(from_iso8601_str)
+            df["to_timestamp"] = df["to_timestamp"].apply(from_iso8601_str)
 
         df["from_block"] = df["from_block"].astype("int")
         df["to_block"] = df["to_block"].astype("int")
@@ -446,9 +530,6 @@ class TokenVolumeSegmentBlock(Model):
         df["outflow"] = df["outflow"].astype("float64")
         df["netflow"] = df["netflow"].astype("float64")
 
-        df["from_timestamp"] = df["from_timestamp"].apply(from_iso8601_str)
-        df["to_timestamp"] = df["to_timestamp"].apply(from_iso8601_str)
-
         df = df.fillna(0)
         netflows = []
         for _, r in df.iterrows():
@@ -502,6 +583,13 @@ class TokenVolumeSegmentBlock(Model):
 
 class TokenNetflowSegmentWindowInput(TokenNetflowWindowInput):
     n: int = DTOField(2, ge=1, description="Number of interval to count")
+    rolling: bool = DTOField(
+        default=False,
+        description=(
+            "Align the segments to multiples of the segment length, the last one ending at the current block, "
+            "and keep the completed segments for the next runs"
+        ),
+    )
 
     class Config:
         schema_extra = {
@@ -516,7 +604,7 @@ class TokenNetflowSegmentWindowInput(TokenNetflowWindowInput):
 
 @Model.describe(
     slug="token.netflow-segment-window",
-    version="1.4",
+    version="1.5",
     display_name="Token netflow by segment in window",
     description="The current Credmark supported netflow algorithm",
     category="protocol",
@@ -538,6 +626,7 @@ class TokenNetflowSegmentWindow(Model):
                 block_number=old_block,
                 n=input.n,
                 include_price=input.include_price,
+                rolling=input.rolling,
             ),
             return_type=TokenNetflowSegmentOutput,
         )
@@ -18,6 +18,8 @@ from credmark.cmf.types import Address, Contract, JoinType, Token
 from credmark.dto import DTO, DTOField
 from web3.exceptions import ABIFunctionNotFound, BadFunctionCallOutput, ContractLogicError
 
+from models.credmark.ledger.pagination import iter_ledger_pages
+
 AZUKI_NFT = "0xED5AF388653567Af2F388E6224dC7C4b3241C544"
 RTFKT_MNLTH_NFT = "0x86825dFCa7A6224cfBd2DA48e85DF2fc3Aa7C4B1"
 
@@ -62,7 +64,7 @@ class NFTAbout(Model):
 
 @Model.describe(
     slug="nft.mint",
-    version="0.4",
+    version="0.5",
     display_name="NFT mint in ETH",
     description="nft",
     input=NFTContract,
@@ -70,42 +72,33 @@ class NFTAbout(Model):
 )
 class NFTMint(Model):
     def get_mint_and_tx_with_join(self, contract):
-        pg = 0
         dfs = []
         with contract.ledger.events.Transfer.as_("ts") as ts:
             with self.context.ledger.Transaction.as_("tx") as tx:
-                while True:
-                    df = ts.select(
-                        aggregates=[
-                            (tx.VALUE, "value"),
-                            (ts.EVT_FROM, "evt_from"),
-                            (ts.EVT_TO, "evt_to"),
-                            (ts.EVT_TOKENID, "evt_tokenid"),
-                            (ts.BLOCK_NUMBER, "block_number"),
-                            (tx.BLOCK_TIMESTAMP.extract_epoch().as_integer(), "block_timestamp"),
-                            (tx.FROM_ADDRESS, "from_address"),
-                            (tx.TO_ADDRESS, "to_address"),
-                            (tx.TRANSACTION_INDEX, "transaction_index"),
-                            (ts.TXN_HASH, "hash"),
-                        ],
-                        where=ts.EVT_FROM.eq(Address.null()).and_(
-                            tx.TO_ADDRESS.eq(contract.address)
-                        ),
-                        joins=[(JoinType.LEFT_OUTER, tx, tx.HASH.eq(ts.TXN_HASH))],
-                        # When use limit/offset, the order_by must be unique
-                        order_by=tx.BLOCK_NUMBER.comma_(tx.TRANSACTION_INDEX).comma_(
-                            ts.EVT_TOKENID
-                        ),
-                        limit=5000,
-                        offset=pg * 5000,
-                    ).to_dataframe()
-
-                    self.logger.info(f"get_mint_and_tx_with_join {pg=} {df.shape[0]=}")
-                    if not df.empty:
-                        dfs.append(df)
-                    pg += 1
-                    if df.shape[0] < 5000:
-                        break
+                # Pages follow the unique (block_number, log_index) of the Transfer events
+                for df in iter_ledger_pages(
+                    ts,
+                    [(ts.BLOCK_NUMBER, "block_number"), (ts.LOG_INDEX, "log_index")],
+                    where=ts.EVT_FROM.eq(Address.null()).and_(
+                        tx.TO_ADDRESS.eq(contract.address)
+                    ),
+                    aggregates=[
+                        (tx.VALUE, "value"),
+                        (ts.EVT_FROM, "evt_from"),
+                        (ts.EVT_TO, "evt_to"),
+                        (ts.EVT_TOKENID, "evt_tokenid"),
+                        (ts.BLOCK_NUMBER, "block_number"),
+                        (ts.LOG_INDEX, "log_index"),
+                        (tx.BLOCK_TIMESTAMP.extract_epoch().as_integer(), "block_timestamp"),
+                        (tx.FROM_ADDRESS, "from_address"),
+                        (tx.TO_ADDRESS, "to_address"),
+                        (tx.TRANSACTION_INDEX, "transaction_index"),
+                        (ts.TXN_HASH, "hash"),
+                    ],
+                    joins=[(JoinType.LEFT_OUTER, tx, tx.HASH.eq(ts.TXN_HASH))],
+                ):
+                    self.logger.info(f"get_mint_and_tx_with_join {len(dfs)=} {df.shape[0]=}")
+                    dfs.append(df)
 
         if len(dfs) == 0:
             return None
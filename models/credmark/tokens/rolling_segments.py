@@ -0,0 +1,124 @@
+# pylint:disable=line-too-long
+
+"""
+Block segments rolled forward with the head block
+"""
+
+from typing import Callable
+
+import pandas as pd
+from credmark.cmf.model import ModelContext
+from credmark.cmf.model.errors import ModelRunError
+from credmark.cmf.types import BlockNumber
+
+
+class RollingSegments:
+    """
+    Aggregates of segments of block_seg blocks on a fixed grid, kept between runs so that a window
+    of n_segments segments rolls forward with the head block.
+
+    Segment k covers blocks (k * block_seg, (k + 1) * block_seg]. The window is the n segments up to
+    the one of the current block, which ends at the current block. Completed segments do not change
+    and are kept once the ledger has all their blocks, as it lags the head; a run aggregates only the
+    segments not kept, usually the latest ones, and drops those that fall out of the window.
+    """
+
+    # (chain id, key, block_seg) => segment index => row
+    SEGMENTS: dict[tuple, dict[int, dict]] = {}
+    MAX_KEYS = 256
+
+    def __init__(self, context: ModelContext, key: tuple, block_seg: int, n_segments: int):
+        self.context = context
+        self.key = key
+        self.block_seg = block_seg
+        self.n_segments = n_segments
+
+    def segment_aggregate(self, block_number_column) -> tuple[str, str]:
+        return (f'floor(({block_number_column} - 1) / {self.block_seg})', 'seg_n')
+
+    def block_timestamps(self, block_numbers: list[int]) -> dict[int, int]:
+        """
+        Timestamps of the blocks from the ledger, or from the node for blocks not in the ledger yet.
+        """
+        with self.context.ledger.Block as b:
+            df = b.select(aggregates=[(b.NUMBER, 'number'), (b.TIMESTAMP, 'timestamp')],
+                          where=b.NUMBER.in_(block_numbers),
+                          bigint_cols=['number']).to_dataframe()
+            from_iso8601_str = b.field('').from_iso8601_str
+        timestamps = {int(number): from_iso8601_str(timestamp) for number, timestamp in zip(df['number'], df['timestamp'])}
+        for block_number in block_numbers:
+            if block_number not in timestamps:
+                timestamps[block_number] = BlockNumber(block_number).timestamp
+        return timestamps
+
+    def ledger_block(self) -> int:
+        """
+        Last block of the ledger up to the current block, -1 if there is none.
+        """
+        with self.context.ledger.Block as b:
+            rows = b.select(aggregates=[(b.NUMBER.max_(), 'max_number')],
+                            where=b.NUMBER.le(int(self.context.block_number)),
+                            bigint_cols=['max_number']).data
+        max_number = rows[0].get('max_number') if len(rows) > 0 else None
+        return int(max_number) if max_number is not None else -1
+
+    def rows(self,
+             aggregate: Callable[[int, int], pd.DataFrame],
+             value_columns: list[str]) -> list[dict]:
+        """
+        Rows of from_block/from_timestamp/to_block/to_timestamp and the value columns for the window.
+
+        aggregate(from_block, to_block) returns the value columns of the segments in the blocks,
+        with the segment index from segment_aggregate() as seg_n.
+        """
+        if self.block_seg < 1:
+            raise ModelRunError(f'Segment length shall be positive: {self.block_seg}')
+
+        block_end = int(self.context.block_number)
+        head = (block_end - 1) // self.block_seg
+        first = head - self.n_segments + 1
+        if first < 0:
+            raise ModelRunError(
+                'Start block shall be larger than zero: '
+                f'{first} * {self.block_seg} = {first * self.block_seg}')
+
+        cache_key = (self.context.chain_id, self.key, self.block_seg)
+        if cache_key not in self.SEGMENTS:
+            while len(self.SEGMENTS) >= self.MAX_KEYS:
+                del self.SEGMENTS[next(iter(self.SEGMENTS))]
+            self.SEGMENTS[cache_key] = {}
+        segments = self.SEGMENTS[cache_key]
+
+        for k in [k for k in segments if k < first or k > head]:
+            del segments[k]
+
+        head_complete = block_end == (head + 1) * self.block_seg
+        missing = [k for k in range(first, head + 1)
+                   if k not in segments or (k == head and not head_complete)]
+
+        new_rows = {}
+        if len(missing) > 0:
+            df = aggregate(missing[0] * self.block_seg + 1, min((missing[-1] + 1) * self.block_seg, block_end))
+            values = {int(r['seg_n']): r for _, r in df.iterrows()}
+
+            for k in missing:
+                new_rows[k] = {'from_block': k * self.block_seg + 1,
+                               'to_block': min((k + 1) * self.block_seg, block_end)}
+                for column in value_columns:
+                    value = values[k][column] if k in values else None
+                    new_rows[k][column] = 0 if value is None or pd.isna(value) else value
+
+            timestamps = self.block_timestamps(
+                sorted({row[col] for row in new_rows.values() for col in ['from_block', 'to_block']}))
+            for row in new_rows.values():
+                row['from_timestamp'] = timestamps[row['from_block']]
+                row['to_timestamp'] = timestamps[row['to_block']]
+
+            complete = {k: row for k, row in new_rows.items() if k < head or head_complete}
+            if len(complete) > 0:
+                ledger_block = self.ledger_block()
+                for k, row in complete.items():
+                    if row['to_block'] <= ledger_block:
+                        segments[k] = row
+
+        return [new_rows[k] if k in new_rows else segments[k] for k in range(first, head + 1)]
@@ -253,7 +253,7 @@ class TokenInfoDeploymentMaybe(Model):
 
 @ImmutableModel.describe(
     slug="token.deployment",
-    version="0.12",
+    version="0.13",
     display_name="Token Information - deployment",
     developer="Credmark",
     category="protocol",
@@ -266,58 +266,165 @@ class TokenInfoDeployment(ImmutableModel):
     Return token's information on deployment
     """
 
-    code_by_block = {}
+    # Deployment blocks found in this process by chain id and address:
+    # (deployment block, hash of the code when it was found)
+    DEPLOYMENT_INDEX: dict[int, dict[str, tuple[int, str]]] = {}
+
+    # Bounds from code probes by chain id and address:
+    # (last block without code, first block with code), -1 for not known
+    CODE_BOUNDS: dict[int, dict[str, tuple[int, int]]] = {}
+
+    # Addresses kept per chain in each of the above
+    MAX_ADDRESSES = 10_000
+
+    def remember(self, index: dict, contract_address, value):
+        addresses = index.setdefault(self.context.chain_id, {})
+        if contract_address.lower() not in addresses:
+            while len(addresses) >= self.MAX_ADDRESSES:
+                del addresses[next(iter(addresses))]
+        addresses[contract_address.lower()] = value
+
+    def code_bounds(self, contract_address) -> tuple[int, int]:
+        return self.CODE_BOUNDS.setdefault(self.context.chain_id, {}).get(
+            contract_address.lower(), (-1, -1))
+
+    def forget(self, contract_address):
+        """
+        Drop what is known of the address, e.g. after it self-destructed and was deployed again.
+        """
+        self.CODE_BOUNDS.setdefault(self.context.chain_id, {}).pop(contract_address.lower(), None)
+        self.DEPLOYMENT_INDEX.setdefault(self.context.chain_id, {}).pop(contract_address.lower(), None)
+
+    def record_code(self, contract_address, block_number: int, has_code: bool):
+        low, high = self.code_bounds(contract_address)
+        # A probe against the bounds means the code was removed and deployed again
+        if (has_code and block_number <= low) or (not has_code and high != -1 and block_number >= high):
+            self.forget(contract_address)
+            low, high = -1, -1
+
+        if has_code:
+            high = block_number if high == -1 else min(high, block_number)
+        else:
+            low = max(low, block_number)
+        self.remember(self.CODE_BOUNDS, contract_address, (low, high))
+
+    def has_code(self, contract_address, block_number: int) -> bool:
+        low, high = self.code_bounds(contract_address)
+        if block_number <= low:
+            return False
+        if high != -1 and block_number >= high:
+            return True
+        has_code = self.context.web3.eth.get_code(contract_address, block_number).hex() != "0x"
+        self.record_code(contract_address, block_number, has_code)
+        return has_code
+
+    def ledger_deployment_block(self, contract_address) -> Optional[int]:
+        """
+        Deployment block known to the ledger: the creation block of the token,
+        or else the block of the receipt that created the contract.
+        """
+        block_number = int(self.context.block_number)
+        with self.context.ledger.Token as q:
+            rows = q.select(aggregates=[(q.BLOCK_NUMBER.min_(), 'min_block_number')],
+                            where=q.ADDRESS.eq(contract_address.lower()).and_(q.BLOCK_NUMBER.le(block_number)),
+                            bigint_cols=['min_block_number']).data
+        if len(rows) == 0 or rows[0].get('min_block_number') is None:
+            with self.context.ledger.Receipt as q:
+                rows = q.select(aggregates=[(q.BLOCK_NUMBER.min_(), 'min_block_number')],
+                                where=q.CONTRACT_ADDRESS.eq(contract_address.lower()).and_(q.BLOCK_NUMBER.le(block_number)),
+                                bigint_cols=['min_block_number']).data
+        min_block_number = rows[0].get('min_block_number') if len(rows) > 0 else None
+        return int(min_block_number) if min_block_number is not None else None
+
+    def narrow_window(self, contract_address):
+        """
+        Probe the deployment block known to the ledger and the block before it. When the ledger is right,
+        the bounds meet and the binary search needs no further probe; otherwise the probes still narrow it.
+        """
+        ledger_block = self.ledger_deployment_block(contract_address)
+        if ledger_block is None:
+            return
+        if self.has_code(contract_address, ledger_block) and ledger_block > 0:
+            self.has_code(contract_address, ledger_block - 1)
 
     def binary_search(self, low: int, high: int, contract_address) -> int:
-        # Check base case
-        if high >= low:
+        """
+        Search the first block with code in [low, high], starting from the bounds of earlier probes.
+        """
+        known_low, known_high = self.code_bounds(contract_address)
+        low = max(low, known_low + 1)
+        if known_high != -1:
+            high = min(high, known_high)
+
+        if high < low:
+            return -1
+
+        while high > low:
             msg = f"[{self.slug}] Searching block {low}-{high} for {contract_address}"
             self.logger.info(msg)
-            # print(msg)
             mid = (high + low) // 2
-            if high == low:
-                return low
-
-            mid_hex = hex(mid)
-            if self.code_by_block.get(mid_hex) is None:
-                try_get_code = self.context.web3.eth.get_code(contract_address, mid).hex()
-                self.code_by_block[mid_hex] = try_get_code
+            if self.has_code(contract_address, mid):
+                high = mid
             else:
-                try_get_code = self.code_by_block[mid_hex]
-            if try_get_code != "0x":
-                return self.binary_search(low, mid, contract_address)
-            elif try_get_code == "0x":
-                return self.binary_search(mid + 1, high, contract_address)
-            else:
-                return -1
-        else:
-            return -1
+                low = mid + 1
+        return low
+
+    def get_deployer(self, block, contract_address) -> Optional[Address]:
+        txs = block["transactions"] if "transactions" in block else []
+        if len(txs) == 0:
+            return None
+
+        try:
+            # All receipts of the block in one request
+            receipts = self.context.web3.manager.request_blocking(
+                "eth_getBlockReceipts", [hex(block["number"])])
+        except (ValueError, requests.exceptions.HTTPError):
+            # The node does not support eth_getBlockReceipts
+            receipts = None
+
+        if receipts is None:
+            # Contract creations first, as they are most likely the deployment
+            txs = sorted(txs, key=lambda tx: tx["to"] is not None)
+            receipts = (self.context.web3.eth.get_transaction_receipt(tx["hash"])  # type: ignore
+                        for tx in txs)
+
+        for receipt in receipts:
+            if receipt["contractAddress"] is not None and Address(receipt["contractAddress"]) == contract_address:
+                return Address(receipt["from"])
+            for log in receipt["logs"]:
+                if Address(log["address"]) == contract_address:
+                    return Address(receipt["from"])
+        return None
 
     def run(self, input: TokenDeploymentInput) -> TokenDeploymentOutput:
-        self.code_by_block = {}
+        contract_address = input.address.checksum
+        deployments = self.DEPLOYMENT_INDEX.setdefault(self.context.chain_id, {})
 
-        if self.context.web3.eth.get_code(input.address.checksum).hex() == "0x":
+        code = self.context.web3.eth.get_code(contract_address, int(self.context.block_number))
+        self.record_code(contract_address, int(self.context.block_number), code.hex() != "0x")
+        if code.hex() == "0x":
             raise ModelDataError(
                 f"{input.address} is not an EOA account on block {self.context.block_number}"
             )
 
-        res = self.binary_search(0, int(self.context.block_number), input.address.checksum)
-
-        if res == -1:
-            raise ModelDataError(f"Can not find deployment information for {input.address}")
+        code_hash = Web3.keccak(code).hex()
+        deployment = deployments.get(contract_address.lower())
+        if deployment is not None and deployment[1] != code_hash:
+            # Other code at the address than when the deployment was found
+            self.forget(contract_address)
+            deployment = None
+
+        if deployment is None:
+            self.narrow_window(contract_address)
+            res = self.binary_search(0, int(self.context.block_number), contract_address)
+            if res == -1:
+                raise ModelDataError(f"Can not find deployment information for {input.address}")
+            self.remember(self.DEPLOYMENT_INDEX, contract_address, (res, code_hash))
+        else:
+            res = deployment[0]
 
-        block = self.context.web3.eth.get_block(res)
-        txs = block["transactions"] if "transactions" in block else []
-        deployer = None
-        for tx in txs:
-            receipt = self.context.web3.eth.get_transaction_receipt(tx.hex())  # type: ignore
-            if receipt["contractAddress"] == input.address:
-                deployer = receipt["from"]
-                break
-            for log in receipt["logs"]:
-                if log["address"] == input.address:
-                    deployer = receipt["from"]
-                    break
+        block = self.context.web3.eth.get_block(res, full_transactions=True)
+        deployer = self.get_deployer(block, input.address)
 
         # TODO: remove when we have loaded ABI for non-mainnet chains
         if self.context.chain_id == Network.Mainnet and not input.ignore_proxy:
@@ -0,0 +1,115 @@
+# pylint: disable=line-too-long
+
+"""
+Token metadata for many tokens
+"""
+
+from typing import Optional
+
+from credmark.cmf.model import ModelContext
+from credmark.cmf.model.errors import ModelDataError
+from credmark.cmf.types import Address, Maybe, Token
+from web3.exceptions import ContractLogicError
+
+TOKEN_LOAD_ERRORS = (ModelDataError, OverflowError, ContractLogicError)
+
+
+class TokenMetadataResolver:
+    """
+    Token objects with their decimals, symbol and name at the current block.
+
+    Decimals do not change and are kept for the life of the process. Symbol and name are read
+    at each block, as a token can be renamed (e.g. SAI), and Token objects are made for each
+    call so that none is shared between contexts.
+
+    Metadata of the tokens is read in one batch of ERC20 calls. A token that fails in the
+    batch goes through the fallbacks one by one: the token as it is, the ERC20 ABI with bytes32
+    symbol/name (use_alt), the ERC20 ABI, the token's own ABI and last the ERC20 ABI at the
+    token's deployment block. The fallback that worked is kept, and the token is read with it
+    instead of in the batch afterwards.
+    """
+
+    # (chain id, token address) => decimals
+    DECIMALS: dict[tuple[int, Address], int] = {}
+    # (chain id, token address) => index of the fallback in resolve_one for tokens not read in the batch
+    FALLBACKS: dict[tuple[int, Address], int] = {}
+
+    def __init__(self, context: ModelContext):
+        self.context = context
+
+    @staticmethod
+    def token_metadata(token: Token) -> dict:
+        metadata = {'token': token, 'decimals': token.decimals, 'symbol': token.symbol}
+        try:
+            metadata['name'] = token.name
+        except TOKEN_LOAD_ERRORS:
+            metadata['name'] = None
+        return metadata
+
+    def resolve_one(self, token_addr: Address) -> dict:
+        loaders = [lambda: Token(token_addr.checksum),
+                   lambda: Token(token_addr.checksum).as_erc20(set_loaded=True, use_alt=True),
+                   lambda: Token(token_addr.checksum).as_erc20(set_loaded=True),
+                   lambda: Token(token_addr.checksum).as_erc20()]
+        key = (self.context.chain_id, token_addr)
+        for n, load in enumerate(loaders):
+            if n < self.FALLBACKS.get(key, 0):
+                continue
+            try:
+                metadata = self.token_metadata(load())
+                self.FALLBACKS[key] = n
+                return metadata
+            except TOKEN_LOAD_ERRORS:
+                pass
+
+        deployment = self.context.run_model(
+            'token.deployment-maybe', {'address': token_addr}, return_type=Maybe[dict])
+        if not deployment.just:
+            raise ValueError(f"Unable to find token deployment for {token_addr}") from None
+
+        with self.context.fork(block_number=deployment.just["deployed_block_number"]) as _past_context:
+            metadata = self.token_metadata(Token(token_addr.checksum).as_erc20(set_loaded=True))
+        self.FALLBACKS[key] = len(loaders)
+        return metadata
+
+    def batch_call(self, calls) -> Optional[list]:
+        try:
+            return self.context.web3_batch.call(calls, unwrap=True, require_success=False)
+        except (OverflowError, ValueError):
+            # e.g. bytes32 symbol/name fails decoding the batch
+            return None
+
+    def resolve(self, token_addrs: list[Address]) -> list[dict]:
+        chain_id = self.context.chain_id
+        addrs = list(dict.fromkeys(Address(addr) for addr in token_addrs))
+
+        tokens = {addr: Token(addr.checksum).as_erc20(set_loaded=True)
+                  for addr in addrs if (chain_id, addr) not in self.FALLBACKS}
+        token_calls = {}
+        for addr, token in tokens.items():
+            calls = [] if (chain_id, addr) in self.DECIMALS else [token.functions.decimals()]
+            token_calls[addr] = calls + [token.functions.symbol(), token.functions.name()]
+
+        all_calls = [call for calls in token_calls.values() for call in calls]
+        results = self.batch_call(all_calls) if len(all_calls) > 0 else []
+        if results is None:
+            # Read each token on its own to find those that fail the batch
+            results = []
+            for calls in token_calls.values():
+                token_results = self.batch_call(calls)
+                results.extend(token_results if token_results is not None else [None] * len(calls))
+        results = iter(results)
+
+        metadata = {}
+        for addr in addrs:
+            if addr in tokens:
+                decimals = self.DECIMALS[(chain_id, addr)] if (chain_id, addr) in self.DECIMALS else next(results)
+                symbol = next(results)
+                name = next(results)
+                if decimals is not None and symbol is not None:
+                    metadata[addr] = {'token': tokens[addr], 'decimals': decimals, 'symbol': symbol, 'name': name}
+            if addr not in metadata:
+                metadata[addr] = self.resolve_one(addr)
+            self.DECIMALS[(chain_id, addr)] = metadata[addr]['decimals']
+
+        return [metadata[Address(addr)] for addr in token_addrs]
@@ -1,11 +1,14 @@
 # pylint: disable=locally-disabled, no-member, line-too-long
 from typing import List, Union
 
+import pandas as pd
 from credmark.cmf.model import Model
 from credmark.cmf.model.errors import ModelRunError
 from credmark.cmf.types import Address, BlockNumber, JoinType, NativeToken, PriceWithQuote, Token
 from credmark.dto import DTO, DTOField
 
+from models.credmark.tokens.rolling_segments import RollingSegments
+
 
 class TokenVolumeBlockInput(DTO):
     block_number: int = DTOField(
@@ -156,6 +159,10 @@ class TokenVolumeWindow(Model):
 
 class TokenVolumeSegmentBlockInput(TokenVolumeBlockInput):
     n: int = DTOField(2, ge=1, description='Number of interval to count')
+    rolling: bool = DTOField(
+        default=False,
+        description=('Align the segments to multiples of the segment length, the last one ending at the current block, '
+                     'and keep the completed segments for the next runs'))
 
 
 class TokenVolumeSegmentOutput(DTO):
@@ -168,7 +175,7 @@ class TokenVolumeSegmentOutput(DTO):
 
 
 @Model.describe(slug='token.volume-segment-block',
-                version='1.3',
+                version='1.4',
                 display_name='Token Volume By Segment by Block',
                 description='The Current Credmark Supported trading volume algorithm',
                 category='protocol',
@@ -196,8 +203,30 @@ class TokenVolumeSegmentBlock(Model):
                 f'{block_end} - {block_seg} * {input.n} = {block_start}')
 
         native_token = NativeToken()
-        if token_address == native_token.address:
-            input_token = native_token
+        input_token = native_token if token_address == native_token.address else input.token
+
+        if input.rolling:
+            segments = RollingSegments(self.context, ('volume', token_address), block_seg, input.n)
+
+            def _aggregate(from_block: int, to_block: int) -> pd.DataFrame:
+                if token_address == native_token.address:
+                    with self.context.ledger.Transaction as q:
+                        return q.select(aggregates=[segments.segment_aggregate(q.BLOCK_NUMBER),
+                                                    (q.VALUE.as_numeric().sum_(), 'sum_value')],
+                                        where=q.BLOCK_NUMBER.ge(from_block).and_(q.BLOCK_NUMBER.le(to_block)),
+                                        group_by=['"seg_n"'],
+                                        bigint_cols=['seg_n', 'sum_value']).to_dataframe()
+                with self.context.ledger.TokenTransfer as q:
+                    return q.select(aggregates=[segments.segment_aggregate(q.BLOCK_NUMBER),
+                                                (q.RAW_AMOUNT.as_numeric().sum_(), 'sum_value')],
+                                    where=(q.TOKEN_ADDRESS.eq(token_address)
+                                           .and_(q.BLOCK_NUMBER.ge(from_block))
+                                           .and_(q.BLOCK_NUMBER.le(to_block))),
+                                    group_by=['"seg_n"'],
+                                    bigint_cols=['seg_n', 'sum_value']).to_dataframe()
+
+            df = pd.DataFrame(segments.rows(_aggregate, ['sum_value']))
+        elif token_address == native_token.address:
             with self.context.ledger.Transaction.as_('t') as t, \
                     self.context.ledger.Block.as_('s') as s, \
                     self.context.ledger.Block.as_('e') as e:
@@ -222,8 +251,9 @@ class TokenVolumeSegmentBlock(Model):
                 ).to_dataframe()
 
                 from_iso8601_str = t.field('').from_iso8601_str
+            df['from_timestamp'] = df['from_timestamp'].apply(from_iso8601_str)
+            df['to_timestamp'] = df['to_timestamp'].apply(from_iso8601_str)
         else:
-            input_token = input.token
             with self.context.ledger.TokenTransfer.as_('t') as t, \
                     self.context.ledger.Block.as_('s') as s, \
                     self.context.ledger.Block.as_('e') as e:
@@ -250,10 +280,10 @@ class TokenVolumeSegmentBlock(Model):
                 ).to_dataframe()
 
                 from_iso8601_str = t.field('').from_iso8601_str
+            df['from_timestamp'] = df['from_timestamp'].apply(from_iso8601_str)
+            df['to_timestamp'] = df['to_timestamp'].apply(from_iso8601_str)
 
         df.sum_value = df.sum_value.fillna(0)
-        df['from_timestamp'] = df['from_timestamp'].apply(from_iso8601_str)
-        df['to_timestamp'] = df['to_timestamp'].apply(from_iso8601_str)
 
         volumes = []
         for _, r in df.iterrows():
@@ -285,6 +315,10 @@ class TokenVolumeSegmentBlock(Model):
 
 class TokenVolumeSegmentWindowInput(TokenVolumeWindowInput):
     n: int = DTOField(2, ge=1, description='Number of interval to count')
+    rolling: bool = DTOField(
+        default=False,
+        description=('Align the segments to multiples of the segment length, the last one ending at the current block, '
+                     'and keep the completed segments for the next runs'))
 
     class Config:
         schema_extra = {
@@ -293,7 +327,7 @@ class TokenVolumeSegmentWindowInput(TokenVolumeWindowInput):
 
 
 @Model.describe(slug='token.volume-segment-window',
-                version='1.1',
+                version='1.2',
                 display_name='Token Volume by Segment in Window',
                 description='The current Credmark supported trading volume algorithm',
                 category='protocol',
@@ -312,5 +346,6 @@ class TokenVolumeSegmentWindow(Model):
                 address=input.address,
                 block_number=old_block,
                 include_price=input.include_price,
-                n=input.n),
+                n=input.n,
+                rolling=input.rolling),
             return_type=TokenVolumeSegmentOutput)
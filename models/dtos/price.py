@@ -304,3 +304,24 @@ class PriceBlocksInput(PriceInputWithPreference):
                 },
             ]
         }
+
+
+class PriceInputWithBlock(PriceInputWithPreference):
+    block_number: Optional[int] = DTOField(
+        None, description="Block number to price at. Default to the current block"
+    )
+
+
+class PricesBlocksInput(Some[PriceInputWithBlock]):
+    class Config:
+        schema_extra = {
+            "examples": [
+                {
+                    "some": [
+                        {"base": {"symbol": "AAVE"}, "block_number": 16_000_000},
+                        {"base": {"symbol": "AAVE"}, "quote": {"symbol": "EUR"}},
+                        {"base": {"symbol": "CRV"}, "quote": {"symbol": "EUR"}},
+                    ],
+                }
+            ]
+        }
@@ -1,4 +1,6 @@
-from credmark.cmf.types import Contract, Token
+from typing import List, Optional
+
+from credmark.cmf.types import Address, Contract, Token
 from credmark.dto import DTO, DTOField
 
 
@@ -35,3 +37,44 @@ class VolumeInput(Contract):
 
 class VolumeInputHistorical(VolumeInput):
     count: int = DTOField(1, ge=1, description='Count')
+
+
+class VolumeInputHistoricalPools(DTO):
+    addresses: List[Address]
+    pool_info_model: str
+    interval: int = DTOField(7200, gt=0,
+                             description="Block interval to sum up volume (>0)")
+    count: int = DTOField(1, ge=1, description='Count')
+
+    class Config:
+        schema_extra = {
+            'example': {"pool_info_model": "uniswap-v2.pool-tvl", "interval": 216000, "count": 1,
+                        "addresses": ['0xB4e16d0168e52d35CaCD2c6185b44281Ec28C9Dc',
+                                      '0x0d4a11d5EEaaC28EC3F61d100daF4d40471f1852']}
+        }
+
+
+class PoolSwapVolumeSeries(DTO):
+    """
+    Swap volume of a pool in count intervals, earliest first.
+    Amounts and values are by token, then by interval. Values are at the current prices.
+    A pool that failed has the error and empty lists.
+    """
+    address: Address
+    tokens: List[Token]
+    prices: List[float]
+    startBlockNumber: List[int]
+    endBlockNumber: List[int]
+    swapCount: List[int]
+    sellAmount: List[List[float]]
+    buyAmount: List[List[float]]
+    sellValue: List[List[float]]
+    buyValue: List[List[float]]
+    error: Optional[str] = DTOField(None, description='Error of the pool, if it failed')
+
+    @classmethod
+    def failed(cls, address: Address, error: str):
+        return cls(address=address, tokens=[], prices=[],
+                   startBlockNumber=[], endBlockNumber=[], swapCount=[],
+                   sellAmount=[], buyAmount=[], sellValue=[], buyValue=[],
+                   error=error)
@@ -75,6 +75,15 @@ class TestAAVE(CMFTest):
                            "window": "10 days", "interval": "1 days"},
                        block_number=16040000)
 
+    def test_aave_health_factor_scan(self):
+        self.run_model("aave-v2.health-factor-scan",
+                       {"limit": 10},
+                       block_number=16325819)
+
+        self.run_model("aave-v2.health-factor-scan",
+                       {"limit": 10, "incremental": True},
+                       block_number=16325919)
+
     def test_aave_reward(self):
         self.run_model("aave-v2.get-lp-reward",
                        {"address": "0x5a7ED8CB7360db852E8AB5B10D10Abd806dB510D"},
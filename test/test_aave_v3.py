@@ -109,6 +109,17 @@ class TestAAVEV3(CMFTest):
                            chain_id=137,
                            block_number=polygon_block_number)
 
+        # credmark-dev run aave-v3.health-factor-scan -i '{"limit": 10}' -j -b 17718493
+        self.run_model('aave-v3.health-factor-scan',
+                       {"limit": 10},
+                       chain_id=1,
+                       block_number=mainnet_block_number)
+
+        self.run_model('aave-v3.health-factor-scan',
+                       {"limit": 10, "incremental": True},
+                       chain_id=1,
+                       block_number=mainnet_block_number + 100)
+
         if ENABLE_OTHER_NETWORKS:
             # credmark-dev run aave-v3.account-summary -i '{"address": "0x4aa63e8115c5b29a3e0e062a77c11592931453dc"}' -c 10 -j
             optimism_block_number = 107078524
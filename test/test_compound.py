@@ -37,6 +37,10 @@ class TestCompound(CMFTest):
         self.run_model('compound-v2.all-pools-value')
         self.run_model('compound-v2.all-pools-portfolio')
 
+        self.run_model('compound-v2.all-pools-value-blocks',
+                       {'block_numbers': [12756189, 12763389, 12770589]},
+                       block_number=12770589)
+
     def test_historical(self):
         dates = [
             datetime(2021, 9, 20, tzinfo=timezone.utc),
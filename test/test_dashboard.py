@@ -65,6 +65,13 @@ class TestDashboard(CMFTest):
                        "count": 2, "address": "0x5a6A4D54456819380173272A5E8E9B9904BdF41B"}, block_number=15048685)
         self.run_model('dex.pool-volume-historical', {"pool_info_model": "uniswap-v2.pool-tvl", "interval": 7200,
                        "count": 2, "address": "0x3041cbd36888becc7bbcbc0045e3b1f144466f5f"}, block_number=14048685)
+        self.run_model('dex.pool-volume-historical-ledger-pools',
+                       {"pool_info_model": "curve-fi.pool-tvl", "interval": 7200, "count": 2,
+                        "addresses": ["0xd632f22692FaC7611d2AA1C0D552930D43CAEd3B",
+                                      "0x5a6A4D54456819380173272A5E8E9B9904BdF41B"]}, block_number=15048685)
+        self.run_model('dex.pool-volume-historical-ledger-pools',
+                       {"pool_info_model": "uniswap-v2.pool-tvl", "interval": 7200, "count": 2,
+                        "addresses": ["0x3041cbd36888becc7bbcbc0045e3b1f144466f5f"]}, block_number=14048685)
 
     def test_lp_var(self):
         block_number = 14830357
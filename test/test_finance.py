@@ -64,6 +64,19 @@ class TestFinance(CMFTest):
                         'interval': 1,
                         'confidence': 0.01})
 
+        self.run_model('finance.var-engine-historical-multiple',
+                       {'portfolios': [
+                           {'positions': [
+                               {'amount': 10.0, 'asset': {'address': '0xbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbb'}}]},
+                           {'positions': [
+                               {'amount': -5.0, 'asset': {'address': '0xbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbb'}}]}],
+                        'priceLists': [
+                            {'prices': [23547.020325090474, 23844.242344321123, 23077.243286444373, 22875.89476602967, 23067.216659618203, 23356.221497884737, 22862.17574503791, 22929.488389327435, 22970.031179142676, 22648.10833878813],
+                             'tokenAddress': '0xbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbb',
+                             'src': 'dex|uniswap-v2,sushiswap,uniswap-v3|Non-zero:15|Zero:5|4.0'}],
+                        'intervals': [1, 2],
+                        'confidences': [0.01, 0.05]})
+
     def test1_var_engine_historical(self):
         self.title('VaR')
 
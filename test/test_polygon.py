@@ -19,6 +19,7 @@ class TestPolygon(CMFTest):
         last_block = last_block_output['output']['blockNumber'] - 100
 
         self.run_model('chain.get-block', {"timestamp": 1591824836}, chain_id=137)
+        self.run_model('chain.get-blocks', {"timestamps": [1591824836, 1591911236, 1591997636]}, chain_id=137)
 
         self.run_model('price.oracle-chainlink',
                        {"base": "0x5559edb74751a0ede9dea4dc23aee72cca6be3d5"}, block_number=last_block-10000, chain_id=137)
@@ -216,6 +216,13 @@ class TestPrice(CMFTest):
                        "interval": 86400, "count": 1, "exclusive": True})
         self.run_model('price.quote-multiple',
                        {"some": [{"base": {"symbol": "EUR"}}, {"base": {"symbol": "JPY"}}]})
+        self.run_model('price.quote-multiple',
+                       {"some": [{"base": {"symbol": "AAVE"}, "quote": {"symbol": "EUR"}},
+                                 {"base": {"symbol": "CRV"}, "quote": {"symbol": "EUR"}},
+                                 {"base": {"symbol": "EUR"}, "quote": {"symbol": "AAVE"}}]})
+        self.run_model('price.quote-multiple-blocks-maybe',
+                       {"some": [{"base": {"symbol": "AAVE"}, "block_number": 15000000},
+                                 {"base": {"symbol": "AAVE"}, "quote": {"symbol": "EUR"}}]})
         self.run_model('price.quote-historical-multiple',
                        {"some": [{"base": {"symbol": "AAVE"}}], "interval": 86400, "count": 1, "exclusive": True})
         self.run_model('finance.var-dex-lp', {"pool": {"address": "0xCEfF51756c56CeFFCA006cD410B03FFC46dd3a58"},
@@ -47,6 +47,11 @@ class TestToken(CMFTest):
         self.run_model("token.volume-segment-window",
                        {"address": "0x7fc66500c84a76ad7e9c93437bfc5ac33e2ddae9", "window": "2 hours", "n": 3})
 
+        self.run_model("token.volume-segment-block",
+                       {"address": "0x7fc66500c84a76ad7e9c93437bfc5ac33e2ddae9", "block_number": -100, "n": 3, "rolling": True})
+        self.run_model("token.volume-segment-block",
+                       {"address": "0xeeeeeeeeeeeeeeeeeeeeeeeeeeeeeeeeeeeeeeee", "block_number": -100, "n": 3, "rolling": True})
+
     def test_netflow(self):
         self.run_model("token.netflow-block",
                        {"address": "0x7fc66500c84a76ad7e9c93437bfc5ac33e2ddae9", "block_number": -1000, "netflow_address": "0xA9D1e08C7793af67e9d92fe308d5697FB81d3E43"})
@@ -99,6 +104,10 @@ class TestToken(CMFTest):
         self.run_model("token.netflow-segment-block",
                        {"address": "0xeeeeeeeeeeeeeeeeeeeeeeeeeeeeeeeeeeeeeeee",
                         "block_number": -1000, "netflow_address": "0xA9D1e08C7793af67e9d92fe308d5697FB81d3E43", "n": 4})
+        self.run_model("token.netflow-segment-block",
+                       {"address": "0x7fc66500c84a76ad7e9c93437bfc5ac33e2ddae9",
+                        "block_number": -1000, "netflow_address": "0xA9D1e08C7793af67e9d92fe308d5697FB81d3E43", "n": 4,
+                        "rolling": True})
 
     def test_holders(self):
         self.run_model("token.holders",
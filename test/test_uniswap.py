@@ -1,6 +1,19 @@
-# pylint:disable=locally-disabled,line-too-long
+# pylint:disable=locally-disabled,line-too-long,protected-access
 
+import math
+import tempfile
+
+import numpy as np
+import pandas as pd
 from cmf_test import CMFTest
+from credmark.cmf.types import Address
+
+from models.credmark.protocols.dexes.uniswap.pool_checkpoint import (
+    PoolCheckpointStore,
+    join_int128,
+    split_int128,
+)
+from models.credmark.protocols.dexes.uniswap.univ3_pool import UniV3Pool
 
 ENABLE_POLYGON = False
 
@@ -102,6 +115,9 @@ class TestUniswap(TestUniswapPools):
         # WETH/CMK pool: 0x59e1f901b5c33ff6fae15b61684ebf17cca7b9b3
         self.run_model("uniswap-v3.get-pool-info",
                        {"address": "0x59e1f901b5c33ff6fae15b61684ebf17cca7b9b3"})
+        self.run_model("uniswap-v3.get-pool-info-multiple",
+                       {"contracts": [{"address": "0x59e1f901b5c33ff6fae15b61684ebf17cca7b9b3"},
+                                      {"address": "0x88e6a0c2ddd26feeb64f039a2c41296fcb3f5640"}]})
         self.run_model("uniswap-v3.get-pool-info-token-price",
                        {"symbol": "MKR"})
 
@@ -115,6 +131,9 @@ class TestUniswap(TestUniswapPools):
                        {"address": "0x88e6a0c2ddd26feeb64f039a2c41296fcb3f5640",
                            "min_tick": 202000, "max_tick": 203000},
                        block_number=15276693)
+        self.run_model("uniswap-v3.get-liquidity-by-ticks",
+                       {"address": "0x88e6a0c2ddd26feeb64f039a2c41296fcb3f5640"},
+                       block_number=15276693)
 
         current_tick = 202180
 
@@ -257,3 +276,152 @@ class TestUniswap(TestUniswapPools):
 
         self.assertEqual({x['address'] for x in link_pools['output']['contracts']} | {x['address'] for x in mkr_pools['output']['contracts']},
                          {x['address'] for x in link_mkr_pools_alt['output']['contracts']})
+
+
+class TestPoolCheckpoint(CMFTest):
+    def test_int128_round_trip(self):
+        values = [0, 1, -1, 2 ** 64, -2 ** 64 - 1, 2 ** 127 - 1, -2 ** 127, 123456789 * 2 ** 70]
+        high, low = split_int128(values)
+        self.assertEqual(join_int128(high, low).tolist(), values)
+
+        with self.assertRaises(ValueError):
+            split_int128([2 ** 127])
+
+    def test_store_round_trip(self):
+        with tempfile.TemporaryDirectory() as root:
+            store = PoolCheckpointStore(root)
+            key = store.key(1, 'uniswap-v3', '0x88e6A0c2dDD26FEEb64F039a2c41296FcB3f5640')
+            state = {'block_number': np.int64(17_000_000), 'log_index': 12, 'sqrtPriceX96': 2 ** 100}
+            ticks = np.array([-887220, -60, 0, 60, 887220])
+            liquidity_net = [2 ** 90, -5, 0, 5, -2 ** 90]
+
+            store.save(key, 17_000_000, 12, state, {'liquidity_net': liquidity_net}, {'ticks': ticks})
+            store.save(key, 17_000_100, 3, state, {'liquidity_net': liquidity_net}, {'ticks': ticks})
+
+            self.assertEqual(store.nearest(key, 17_000_050), (17_000_000, 12))
+            self.assertIsNone(store.nearest(key, 16_999_999))
+
+            loaded = store.load(key, 17_000_000, 12)
+            assert loaded is not None
+            loaded_state, arrays = loaded
+            self.assertEqual(loaded_state, {'block_number': 17_000_000, 'log_index': 12, 'sqrtPriceX96': 2 ** 100})
+            self.assertEqual(arrays['ticks'].tolist(), ticks.tolist())
+            self.assertEqual(arrays['liquidity_net'].tolist(), liquidity_net)
+
+
+class _ReplayToken:
+    def __init__(self, address, decimals):
+        self.address = Address(address)
+        self.decimals = decimals
+
+    def scaled(self, value):
+        return value / 10 ** self.decimals
+
+
+class _ReplayPool:
+    address = Address('0x88e6A0c2dDD26FEEb64F039a2c41296FcB3f5640')
+
+
+class TestUniV3PoolReplay(CMFTest):
+    def new_pool(self):
+        pool = UniV3Pool.__new__(UniV3Pool)
+        pool.src = 'uniswap-v3.get-weighted-price'
+        pool.checkpoint_store = PoolCheckpointStore(None)
+        pool.pool = _ReplayPool()
+        pool.tick_spacing = 10
+        pool.token0 = _ReplayToken('0xA0b86991c6218b36c1d19D4a2e9Eb0cE3606eB48', 6)
+        pool.token1 = _ReplayToken('0xC02aaA39b223FE8D0A0e5C4F27eAD9083C756Cc2', 18)
+        pool.token0_decimals, pool.token0_symbol = 6, 'USDC'
+        pool.token1_decimals, pool.token1_symbol = 18, 'WETH'
+        pool.pool_tick = None
+        pool.pool_sqrtPrice = None
+        pool.pool_liquidity = None
+        pool.ticks = {}
+        pool.block_number = None
+        pool.log_index = None
+        pool.previous_block_number = None
+        pool.previous_log_index = None
+        pool.previous_price_info = None
+        for counter in UniV3Pool.REPLAY_COUNTERS:
+            setattr(pool, counter, 0)
+        pool._call_balance = 0
+        pool._call_balance_skip = 0
+        pool._balance = {block_number: (50_000 * 10 ** 6 + block_number, 20 * 10 ** 18 + block_number)
+                         for block_number in range(100, 110)}
+        return pool
+
+    def events(self):
+        sqrt_price = 1_950_000_000_000_000_000_000_000_000_000_000
+        rows = [
+            ('Initialize', 100, {'tick': 200_311, 'sqrtPriceX96': sqrt_price}),
+            ('Mint', 101, {'tickLower': 200_000, 'tickUpper': 200_600, 'amount': 3 * 10 ** 17,
+                           'amount0': 4_000 * 10 ** 6, 'amount1': 2 * 10 ** 18}),
+            ('Mint', 101, {'tickLower': 200_300, 'tickUpper': 200_320, 'amount': 10 ** 18,
+                           'amount0': 900 * 10 ** 6, 'amount1': 10 ** 17}),
+            ('Swap', 102, {'amount0': 1_000 * 10 ** 6, 'amount1': -5 * 10 ** 17, 'liquidity': 13 * 10 ** 17,
+                           'tick': 200_320, 'sqrtPriceX96': sqrt_price + 10 ** 30}),
+            ('Mint', 103, {'tickLower': 200_320, 'tickUpper': 200_400, 'amount': 7 * 10 ** 16,
+                           'amount0': 300 * 10 ** 6, 'amount1': 0}),
+            ('Burn', 104, {'tickLower': 200_300, 'tickUpper': 200_320, 'amount': 10 ** 18,
+                           'amount0': 800 * 10 ** 6, 'amount1': 3 * 10 ** 17}),
+            ('Collect', 104, {'amount0': 810 * 10 ** 6, 'amount1': 3 * 10 ** 17}),
+            ('Swap', 105, {'amount0': -2_000 * 10 ** 6, 'amount1': 10 ** 18, 'liquidity': 37 * 10 ** 16,
+                           'tick': 200_287, 'sqrtPriceX96': sqrt_price - 10 ** 30}),
+            ('Flash', 106, {'amount0': 10 ** 6, 'amount1': 0, 'paid0': 500, 'paid1': 0}),
+            ('CollectProtocol', 107, {'amount0': 400, 'amount1': 10 ** 12}),
+            ('Burn', 108, {'tickLower': 200_000, 'tickUpper': 200_600, 'amount': 0,
+                           'amount0': 0, 'amount1': 0}),
+        ]
+        columns = ['tick', 'sqrtPriceX96', 'liquidity', 'tickLower', 'tickUpper', 'amount',
+                   'amount0', 'amount1', 'paid0', 'paid1']
+        return pd.DataFrame([{'event': event, 'blockNumber': block_number, 'logIndex': log_index,
+                              **{col: values.get(col, 0) for col in columns}}
+                             for log_index, (event, block_number, values) in enumerate(rows)])
+
+    def proc_rows(self, pool, df_events):
+        handlers = {'Initialize': pool.proc_initialize, 'Mint': pool.proc_mint, 'Burn': pool.proc_burn,
+                    'Swap': pool.proc_swap, 'Collect': pool.proc_collect,
+                    'CollectProtocol': pool.proc_collect_prot, 'Flash': pool.proc_flash}
+        for _, event_row in df_events.iterrows():
+            pool.block_number = event_row['blockNumber']
+            pool.log_index = event_row['logIndex']
+            _, _, price_info = handlers[event_row['event']](event_row.to_dict())
+            tick = pool.ticks.get(pool.pool_tick)
+            yield ({'pool_tick': pool.pool_tick,
+                    'pool_sqrtPrice': pool.pool_sqrtPrice,
+                    'pool_liquidity': pool.pool_liquidity,
+                    'liquidityNet': 0 if tick is None else tick.liquidityNet,
+                    **{counter: getattr(pool, counter) for counter in UniV3Pool.REPLAY_COUNTERS
+                       if not counter.endswith('_reserve')}},
+                   price_info)
+
+    def test_replay_matches_proc(self):
+        df_events = self.events()
+        proc_pool = self.new_pool()
+        expected = list(self.proc_rows(proc_pool, df_events))
+
+        replay_pool = self.new_pool()
+        df_state, tick_table = replay_pool.replay_events(df_events)
+        assert tick_table is not None
+        self.assertEqual(tick_table.to_dict(), proc_pool.ticks)
+        for (expected_state, _), (_, row) in zip(expected, df_state.iterrows()):
+            self.assertEqual({k: row[k] for k in expected_state}, expected_state)
+
+        replayed = list(replay_pool.proc_events(df_events))
+        self.assertEqual(len(replayed), df_events.shape[0])
+        for (_, expected_info), (_, _, info) in zip(expected, replayed):
+            expected_dict, info_dict = expected_info.dict(), info.dict()
+            self.assertEqual(info_dict.keys(), expected_dict.keys())
+            for key, value in expected_dict.items():
+                if isinstance(value, float):
+                    self.assertTrue(math.isclose(info_dict[key], value, rel_tol=1e-9, abs_tol=1e-9),
+                                    (key, info_dict[key], value))
+                else:
+                    self.assertEqual(info_dict[key], value, key)
+
+        self.assertEqual(replay_pool.ticks, proc_pool.ticks)
+        self.assertEqual((replay_pool.block_number, replay_pool.log_index), (108, 10))
+        for attr in ['pool_tick', 'pool_sqrtPrice', 'pool_liquidity', 'token0_reserve', 'token1_reserve',
+                     *UniV3Pool.REPLAY_COUNTERS]:
+            self.assertEqual(getattr(replay_pool, attr), getattr(proc_pool, attr), attr)
+        self.assertEqual(replay_pool.previous_price_info, replayed[-1][2])